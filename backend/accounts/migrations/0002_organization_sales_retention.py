@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='sales_retained_from',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='sales_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:28
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def fill_watermarks(apps, schema_editor):
+    """Maior id e contagem atuais de SalesEvent: mesma marca d'água que os widgets calculavam antes."""
+    Organization = apps.get_model("accounts", "Organization")
+    SalesEvent = apps.get_model("analytics", "SalesEvent")
+    for row in SalesEvent.objects.values("org_id").annotate(last_id=Max("id"), events=Count("id")).order_by():
+        Organization.objects.filter(id=row["org_id"]).update(sales_last_event_id=row["last_id"],
+                                                             sales_changes=row["events"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_organization_sales_retention'),
+        ('analytics', '0013_report_started_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='sales_changes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='sales_last_event_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_watermarks, migrations.RunPython.noop),
+    ]
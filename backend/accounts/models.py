@@ -4,6 +4,12 @@ from django.db import models
 class Organization(models.Model):
     name = models.CharField(max_length=120)
     slug = models.SlugField(unique=True)
+    # retenção de SalesEvent brutos (None = para sempre); os rollups diários ficam
+    sales_retention_days = models.PositiveIntegerField(null=True, blank=True)
+    sales_retained_from = models.DateField(null=True, blank=True)  # eventos antes deste dia já foram expurgados
+    # marca d'água dos widgets (analytics.rollups.bump_sales_watermark): maior id e mudanças em SalesEvent
+    sales_last_event_id = models.BigIntegerField(default=0)
+    sales_changes = models.BigIntegerField(default=0)
 
     def __str__(self): return self.name
 
@@ -0,0 +1,13 @@
+# backend/accounts/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import tenancy
+from .models import Membership
+
+
+# update()/bulk_create em Membership não passam por aqui: a chave expira por TENANCY_CACHE_TIMEOUT
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def invalidate_memberships(sender, instance, **kwargs):
+    tenancy.invalidate(instance.user_id)
@@ -0,0 +1,82 @@
+# backend/accounts/tenancy.py
+"""Resolução de tenant: as orgs do usuário, calculadas uma vez por request.
+
+``memberships(request)`` lê as memberships do usuário do cache (uma chave por
+usuário, apagada pelos signals de Membership) e guarda o resultado no próprio
+request. Com ``TENANCY_CACHE_TIMEOUT=0`` (padrão sem Redis) vale só o request:
+num cache local a invalidação não alcançaria os outros processos. Com a lista de org ids em mãos, as views filtram por ``org_id__in``
+direto, sem join em Membership, sem DISTINCT e sem query de permissão por objeto.
+"""
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.exceptions import PermissionDenied
+
+from .models import Membership
+
+MEMBERSHIPS_KEY = "tenancy:memberships:{user_id}"
+
+
+class TenantOrg(NamedTuple):
+    id: int
+    slug: str
+    role: str
+
+
+def user_memberships(user_id):
+    """[TenantOrg] do usuário, do cache ou do banco (uma query)."""
+    timeout = getattr(settings, "TENANCY_CACHE_TIMEOUT", 0)
+    key = MEMBERSHIPS_KEY.format(user_id=user_id)
+    orgs = cache.get(key) if timeout else None
+    if orgs is None:
+        orgs = [TenantOrg(*row) for row in Membership.objects.filter(user_id=user_id)
+                .values_list("org_id", "org__slug", "role").order_by("org_id")]
+        if timeout:
+            cache.set(key, orgs, timeout)
+    return orgs
+
+
+def invalidate(user_id):
+    key = MEMBERSHIPS_KEY.format(user_id=user_id)
+    cache.delete(key)
+    # de novo no commit: um request concorrente pode ter cacheado o estado pré-commit
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def memberships(request):
+    """[TenantOrg] do usuário autenticado, resolvido uma vez por request."""
+    request = getattr(request, "_request", request)  # o Request do DRF e o HttpRequest dividem o resultado
+    if not hasattr(request, "_tenant_orgs"):
+        user = getattr(request, "user", None)
+        request._tenant_orgs = user_memberships(user.pk) if user and user.is_authenticated else []
+    return request._tenant_orgs
+
+
+def org_ids(request, slug=None, roles=None):
+    """Ids das orgs do usuário, opcionalmente só a de ``slug`` e/ou com um dos ``roles``."""
+    return [o.id for o in memberships(request)
+            if (slug is None or o.slug == slug) and (roles is None or o.role in roles)]
+
+
+def requested_org_ids(request):
+    """Orgs de ``?org=<slug>`` (403 se o usuário não for membro) ou todas as do usuário."""
+    slug = request.query_params.get("org")
+    ids = org_ids(request, slug)
+    if slug and not ids:
+        raise PermissionDenied("You are not a member of this organization.")
+    return ids
+
+
+def scope(queryset, request, field="org"):
+    """Restringe ``queryset`` às orgs do usuário; ``field`` é o caminho até a org."""
+    return queryset.filter(**{f"{field}_id__in": org_ids(request)})
+
+
+class TenantScopedMixin:
+    """``get_queryset`` das views DRF já filtrado pelas orgs do usuário."""
+    tenant_field = "org"
+
+    def get_queryset(self):
+        return scope(super().get_queryset(), self.request, self.tenant_field)
@@ -0,0 +1,255 @@
+# backend/analytics/archive.py
+"""Tier frio de SalesEvent: meses fechados de cada org em Parquet.
+
+``archive_month`` exporta os eventos de um mês (UTC) para
+``MEDIA_ROOT/archive/sales/org-<id>/YYYY-MM.<versão>.parquet`` e os remove do
+banco na mesma transação que aponta o ``SalesArchive`` para o arquivo novo;
+evento atrasado de um mês já arquivado fica no banco até o próximo
+arquivamento, que grava uma versão nova (a anterior sai depois do commit).
+Quem lê só enxerga o arquivo do ``SalesArchive`` commitado, então hot (banco)
+e cold (Parquet) nunca se sobrepõem e basta somar os dois.
+
+A leitura usa ``pyarrow.dataset`` com filtros em occurred_at/channel/product,
+que descartam row groups pelas estatísticas do Parquet. pyarrow é opcional:
+sem arquivos arquivados nada aqui é importado.
+"""
+import datetime as dt
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import cache as analytics_cache
+from .models import SalesArchive, SalesEvent
+from .partitions import add_months, month_start
+from .sketches import DDSKETCH_MIN_VALUE
+
+COLUMNS = ["id", "occurred_at", "amount", "cost", "product", "region", "channel", "customer"]
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("The Parquet archive requires pyarrow (pip install pyarrow)") from None
+    return pa, pc, ds, pq
+
+
+def _schema(pa):
+    return pa.schema([
+        ("id", pa.int64()), ("occurred_at", pa.timestamp("us", tz="UTC")),
+        ("amount", pa.float64()), ("cost", pa.float64()),
+        ("product", pa.string()), ("region", pa.string()), ("channel", pa.string()),
+        ("customer", pa.string()),  # ausente nos arquivos antigos: lido como null
+    ])
+
+
+def _batch(pa, schema, rows):
+    return pa.RecordBatch.from_pylist([dict(zip(COLUMNS, r)) for r in rows], schema=schema)
+
+
+def _conform(pa, schema, batch):
+    # arquivo gravado antes de uma coluna nova existir: completa com nulls
+    if batch.schema.names == schema.names:
+        return batch
+    return pa.RecordBatch.from_arrays(
+        [batch.column(f.name) if f.name in batch.schema.names else pa.nulls(batch.num_rows, f.type) for f in schema],
+        schema=schema)
+
+
+def _month_range(month):
+    lo = dt.datetime(month.year, month.month, 1, tzinfo=dt.timezone.utc)
+    return lo, dt.datetime.combine(add_months(month, 1), dt.time.min, tzinfo=dt.timezone.utc)
+
+
+def archive_name(org_id, month, version):
+    return f"archive/sales/org-{org_id}/{month:%Y-%m}.{version}.parquet"
+
+
+# ---------- escrita ----------
+
+def archive_month(org_id, month, chunk_size=None):
+    """Move os eventos da org no mês para o Parquet; devolve quantos foram movidos."""
+    pa, _, _, pq = _pyarrow()
+    chunk_size = chunk_size or settings.ANALYTICS_IMPORT_CHUNK_SIZE
+    month = month_start(month)
+    lo, hi = _month_range(month)
+    current = SalesArchive.objects.filter(org_id=org_id, month=month).exclude(file="").first()
+    previous = current.file.name if current else ""
+    # versão nova a cada execução: ninguém lê o arquivo antes do SalesArchive commitado apontar para ele
+    name = archive_name(org_id, month, f"{timezone.now():%Y%m%dT%H%M%S%f}")
+    path = Path(settings.MEDIA_ROOT) / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    schema = _schema(pa)
+    hot = (SalesEvent.objects.filter(org_id=org_id, occurred_at__gte=lo, occurred_at__lt=hi)
+           .order_by("occurred_at", "id").values_list(*COLUMNS))
+    moved, last_id = 0, 0
+    try:
+        # row groups pequenos e ordenados por occurred_at: as estatísticas ficam seletivas
+        with pq.ParquetWriter(path, schema) as writer:
+            if previous:
+                for batch in pq.ParquetFile(current.file.path).iter_batches(batch_size=chunk_size):
+                    writer.write_batch(_conform(pa, schema, batch))
+            rows = []
+            for row in hot.iterator(chunk_size=chunk_size):
+                rows.append(row)
+                last_id = max(last_id, row[0])
+                if len(rows) == chunk_size:
+                    writer.write_batch(_batch(pa, schema, rows))
+                    moved, rows = moved + len(rows), []
+            if rows:
+                writer.write_batch(_batch(pa, schema, rows))
+                moved += len(rows)
+        if not moved:
+            path.unlink()
+            return 0
+
+        with transaction.atomic():
+            # _raw_delete: sem signals, os rollups continuam com o mês
+            deleted = (SalesEvent.objects.filter(org_id=org_id, occurred_at__gte=lo, occurred_at__lt=hi,
+                                                 id__lte=last_id)._raw_delete(SalesEvent.objects.db))
+            if deleted != moved:
+                raise ValueError(f"{month:%Y-%m}: {moved} rows exported but {deleted} deleted, retry later")
+            archive, _ = SalesArchive.objects.select_for_update().get_or_create(org_id=org_id, month=month)
+            if archive.file.name != previous:
+                raise ValueError(f"{month:%Y-%m}: archived concurrently, retry later")
+            archive.file.name, archive.rows = name, archive.rows + moved
+            archive.save()
+            if previous:
+                transaction.on_commit(lambda: archive.file.storage.delete(previous))
+    except BaseException:
+        # rollback (inclusive do commit): o arquivo novo nunca foi referenciado
+        path.unlink(missing_ok=True)
+        raise
+    analytics_cache.bump_data_version(analytics_cache.SALES)
+    return moved
+
+
+def closed_months(org_id, before):
+    """Meses (UTC) com eventos no banco que terminam até ``before``."""
+    lo = dt.datetime.combine(month_start(before), dt.time.min, tzinfo=dt.timezone.utc)
+    months = (SalesEvent.objects.filter(org_id=org_id, occurred_at__lt=lo)
+              .annotate(month=TruncMonth("occurred_at", tzinfo=dt.timezone.utc))
+              .values_list("month", flat=True).distinct().order_by("month"))
+    return [m.date() for m in months]
+
+
+def archive_closed_months(after_months=None, today=None):
+    """Arquiva, para todas as orgs, os meses fechados há mais de ``after_months`` meses."""
+    after_months = settings.ANALYTICS_ARCHIVE_AFTER_MONTHS if after_months is None else after_months
+    if not after_months:
+        return {}
+    before = add_months(month_start(today or timezone.now().date()), -after_months + 1)
+    summary = {}
+    for org_id in SalesEvent.objects.values_list("org_id", flat=True).distinct().order_by():
+        for month in closed_months(org_id, before):
+            summary[f"{org_id}:{month:%Y-%m}"] = archive_month(org_id, month)
+    return summary
+
+
+def expire_archives(org_id, cutoff):
+    """Remove os arquivos de meses que terminam até ``cutoff`` (retenção)."""
+    expired = [a for a in SalesArchive.objects.filter(org_id=org_id, month__lt=cutoff)
+               if add_months(a.month, 1) <= cutoff]
+    for archive in expired:
+        archive.file.delete(save=False)
+        archive.delete()
+    return len(expired)
+
+
+# ---------- leitura ----------
+
+def _cold_table(org_id, columns, since=None, until=None, channels=None, products=None, regions=None):
+    """Eventos arquivados da org que passam nos filtros (só os meses que se sobrepõem ao intervalo)."""
+    archives = SalesArchive.objects.filter(org_id=org_id).exclude(file="")
+    if since is not None:
+        archives = archives.filter(month__gte=month_start(since.astimezone(dt.timezone.utc)))
+    if until is not None:
+        archives = archives.filter(month__lte=until.astimezone(dt.timezone.utc).date())
+    paths = [a.file.path for a in archives]
+    if not paths:
+        return None
+
+    pa, pc, ds, _ = _pyarrow()
+    expr = None
+    for cond in (
+        pc.field("occurred_at") >= pa.scalar(since, pa.timestamp("us", tz="UTC")) if since is not None else None,
+        pc.field("occurred_at") < pa.scalar(until, pa.timestamp("us", tz="UTC")) if until is not None else None,
+        pc.field("channel").isin(list(channels)) if channels else None,
+        pc.field("product").isin(list(products)) if products else None,
+        pc.field("region").isin(list(regions)) if regions else None,
+    ):
+        if cond is not None:
+            expr = cond if expr is None else expr & cond
+    return ds.dataset(paths, format="parquet", schema=_schema(pa)).to_table(columns=columns, filter=expr)
+
+
+def cold_day_rows(org_id, since=None, until=None, channels=None, products=None, regions=None):
+    """Como o scan de widgets: somas/contagem por dia (TIME_ZONE) × product × region × channel."""
+    table = _cold_table(org_id, ["occurred_at", "amount", "cost", "product", "region", "channel"],
+                        since, until, channels, products, regions)
+    if table is None or not table.num_rows:
+        return []
+    pa, pc, _, _ = _pyarrow()
+    local = pc.local_timestamp(table["occurred_at"].cast(pa.timestamp("us", tz=settings.TIME_ZONE)))
+    table = table.append_column("day", local.cast(pa.date32()))
+    grouped = table.group_by(["day", "product", "region", "channel"]).aggregate(
+        [("amount", "sum"), ("cost", "sum"), ("amount", "count")])
+    return [{"day": r["day"], "product": r["product"], "region": r["region"], "channel": r["channel"],
+             "amount": r["amount_sum"], "cost": r["cost_sum"], "count": r["amount_count"]} for r in grouped.to_pylist()]
+
+
+def cold_day_sketch_parts(org_id, log_gamma, since=None, until=None, channels=None, products=None, regions=None):
+    """Partes dos sketches por dia (TIME_ZONE) × product × region × channel, agregadas no pyarrow.
+
+    (clientes distintos, bins do DDSketch com ``log_gamma``): linhas com o dia, as
+    dimensões e ``customer`` / ``sign``, ``bin`` e ``count``.
+    """
+    table = _cold_table(org_id, ["occurred_at", "amount", "product", "region", "channel", "customer"],
+                        since, until, channels, products, regions)
+    if table is None or not table.num_rows:
+        return [], []
+    pa, pc, _, _ = _pyarrow()
+    keys = ["day", "product", "region", "channel"]
+    local = pc.local_timestamp(table["occurred_at"].cast(pa.timestamp("us", tz=settings.TIME_ZONE)))
+    table = table.append_column("day", local.cast(pa.date32()))
+
+    named = table.filter(pc.and_(pc.is_valid(table["customer"]), pc.not_equal(table["customer"], "")))
+    customers = named.group_by([*keys, "customer"]).aggregate([]).to_pylist()
+
+    # mesma conta do DDSketch.add: ceil(ln|amount| / ln(gamma)), perto de zero vai para o bin do zero
+    magnitude = pc.abs(table["amount"])
+    small = pc.less_equal(magnitude, DDSKETCH_MIN_VALUE)
+    sign = pc.if_else(small, pa.scalar(0, pa.int8()), pc.sign(table["amount"]).cast(pa.int8()))
+    key = pc.ceil(pc.divide(pc.ln(pc.max_element_wise(magnitude, DDSKETCH_MIN_VALUE)), log_gamma)).cast(pa.int64())
+    key = pc.if_else(small, pa.scalar(0, pa.int64()), key)
+    table = table.append_column("sign", sign).append_column("bin", key)
+    bins = [{**r, "count": r.pop("amount_count")}
+            for r in table.group_by([*keys, "sign", "bin"]).aggregate([("amount", "count")]).to_pylist()]
+    return customers, bins
+
+
+def cold_quarter_hours(org_id, since=None, until=None, channels=None, products=None, regions=None, dims=()):
+    """Somas/contagem por início do quarto de hora (UTC, ``slot``) × ``dims``; todo fuso tem offset múltiplo de 15 min."""
+    table = _cold_table(org_id, ["occurred_at", "amount", "cost", *dims], since, until, channels, products, regions)
+    if table is None or not table.num_rows:
+        return []
+    _, pc, _, _ = _pyarrow()
+    table = table.append_column("slot", pc.floor_temporal(table["occurred_at"], multiple=15, unit="minute"))
+    grouped = table.group_by(["slot", *dims]).aggregate([("amount", "sum"), ("cost", "sum"), ("amount", "count")])
+    return [{"slot": r["slot"], **{d: r[d] for d in dims}, "amount": r["amount_sum"], "cost": r["cost_sum"],
+             "count": r["amount_count"]} for r in grouped.to_pylist()]
+
+
+def cold_latest(org_id, limit, since=None, until=None, channels=None, products=None, regions=None):
+    table = _cold_table(org_id, ["id", "occurred_at", "product", "channel", "region", "amount"],
+                        since, until, channels, products, regions)
+    if table is None or not table.num_rows:
+        return []
+    return table.sort_by([("occurred_at", "descending"), ("id", "descending")]).slice(0, limit).to_pylist()
@@ -0,0 +1,209 @@
+# backend/analytics/benchmarks.py
+"""Harness de benchmark: dataset sintético, casos (endpoints e widgets) e relatório JSON.
+
+``seed`` gera eventos/métricas de orgs ``perf-benchmark-*`` com o gerador de
+``synthetic`` (rollups reconstruídos no fim); ``run`` executa cada caso ``repeat`` vezes e mede
+latência (p50/p95/p99), número de queries e pico de memória (tracemalloc);
+``compare`` aponta regressões contra um relatório anterior. O ponto de entrada é
+``manage.py benchmark_suite``.
+"""
+import math
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+import datetime as dt
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import Membership, Organization
+from dashboards.models import Dashboard, Widget
+from dashboards.tasks import refresh_many
+from dashboards.views import DashboardViewSet
+from . import synthetic
+from .models import MetricDailyRollup, MetricPoint, Product, Region, SalesDailyRollup, SalesEvent
+from .views import DistributionView, KPIsView, SalesEventViewSet, SummaryView, TopProductsView, TrendView
+
+PREFIX = "perf-benchmark"
+
+WIDGETS = [
+    ("kpi.sum", "kpi", {"metric": "sum_amount"}),
+    ("kpi.avg_web", "kpi", {"metric": "avg_amount", "channels": ["web"]}),
+    ("timeseries.day", "timeseries", {}),
+    ("timeseries.hour_tz", "timeseries", {"granularity": "hour", "timezone": "America/New_York"}),
+    ("bar.product", "bar", {"group_by": "product"}),
+    ("pie.channel", "pie", {"group_by": "channel"}),
+    ("table.latest", "table", {}),
+]
+
+
+# ---------- dataset ----------
+
+def seed(events, days=90, orgs=1, log=None):
+    """Orgs de benchmark com ``events`` eventos cada (últimos ``days`` dias) e métricas diárias."""
+    clear()
+    start = timezone.now().replace(microsecond=0) - dt.timedelta(days=days)
+    products = Product.objects.bulk_create([Product(name=f"{PREFIX} {p}") for p in synthetic.PRODUCTS])
+    regions = Region.objects.bulk_create([Region(code=f"{PREFIX}-{r}") for r in synthetic.REGIONS])
+    created = []
+    for i in range(orgs):
+        org = Organization.objects.create(name=f"Perf Benchmark {i}", slug=f"{PREFIX}-{i}")
+        synthetic.seed_org(org, events, start, days, products, regions, seed=42, org_index=i, log=log)
+        created.append(org)
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")  # estatísticas frescas para o planner
+    return created
+
+
+def clear():
+    # sem signals por linha: nada disso é dado de verdade
+    orgs = Organization.objects.filter(slug__startswith=PREFIX)
+    SalesEvent.objects.filter(org__in=orgs)._raw_delete(SalesEvent.objects.db)
+    MetricPoint.objects.filter(org__in=orgs)._raw_delete(MetricPoint.objects.db)
+    SalesDailyRollup.objects.filter(org__in=orgs).delete()
+    MetricDailyRollup.objects.filter(org__in=orgs).delete()
+    Product.objects.filter(name__startswith=PREFIX).delete()
+    Region.objects.filter(code__startswith=PREFIX).delete()
+    get_user_model().objects.filter(username=PREFIX).delete()
+    orgs.delete()
+
+
+def dataset():
+    """Orgs de benchmark já semeadas (para rodar de novo sem gerar os dados)."""
+    return list(Organization.objects.filter(slug__startswith=PREFIX).order_by("id"))
+
+
+# ---------- casos ----------
+
+def _endpoint(view, user, path, params=None):
+    factory = APIRequestFactory()
+
+    def call():
+        request = factory.get(path, params or {})
+        force_authenticate(request, user)
+        response = view(request)
+        response.render()  # a serialização faz parte do custo
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} {params or ''}: HTTP {response.status_code}")
+    return call
+
+
+def cases(org):
+    """[(nome, função)] de cada endpoint de analytics/dashboards e de cada tipo de widget."""
+    user, _ = get_user_model().objects.get_or_create(username=PREFIX)
+    Membership.objects.get_or_create(org=org, user=user, defaults={"role": Membership.VIEWER})
+    dashboard, _ = Dashboard.objects.get_or_create(org=org, title="Benchmark")
+    widgets = {}
+    for name, type, config in WIDGETS:
+        widgets[name], _ = Widget.objects.get_or_create(dashboard=dashboard, title=name,
+                                                        defaults={"type": type, "config": config})
+    widgets = {name: Widget.objects.select_related("dashboard").get(id=w.id) for name, w in widgets.items()}
+
+    product = f"{PREFIX} {synthetic.PRODUCTS[0]}"
+    out = [
+        ("api.kpis", _endpoint(KPIsView.as_view(), user, "/api/analytics/kpis/")),
+        ("api.kpis_product", _endpoint(KPIsView.as_view(), user, "/api/analytics/kpis/", {"product": product})),
+        ("api.trend", _endpoint(TrendView.as_view(), user, "/api/analytics/trend/")),
+        ("api.top_products", _endpoint(TopProductsView.as_view(), user, "/api/analytics/top-products/")),
+        ("api.distribution", _endpoint(DistributionView.as_view(), user, "/api/analytics/distribution/")),
+        ("api.summary", _endpoint(SummaryView.as_view(), user, "/api/analytics/summary/")),
+        ("api.sales_events", _endpoint(SalesEventViewSet.as_view({"get": "list"}), user,
+                                       "/api/analytics/sales-events/", {"page_size": 100})),
+        ("api.sales_events_fields", _endpoint(SalesEventViewSet.as_view({"get": "list"}), user,
+                                              "/api/analytics/sales-events/",
+                                              {"page_size": 500, "fields": "occurred_at,amount"})),
+        ("api.dashboards", _endpoint(DashboardViewSet.as_view({"get": "list"}), user, "/api/dashboards/")),
+    ]
+    # force: cada repetição recalcula do zero (sem atalho de marca d'água/estado incremental)
+    out += [(f"widget.{name}", lambda w=w: refresh_many([w], force=True)) for name, w in widgets.items()]
+    # dashboards list com os caches já preenchidos
+    for w in widgets.values():
+        refresh_many([w], force=True)
+    return out
+
+
+# ---------- medição ----------
+
+def percentile(values, pct):
+    """Percentil por nearest-rank (valores já ordenados)."""
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def measure(fn, repeat=10, warmup=1):
+    for _ in range(warmup):
+        fn()
+    timings, queries = [], 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - t0) * 1000)
+        queries = len(ctx.captured_queries)
+    # tracemalloc deixa tudo mais lento: pico medido numa execução à parte
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    timings.sort()
+    return {
+        "p50_ms": round(percentile(timings, 50), 3), "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3), "max_ms": round(timings[-1], 3),
+        "mean_ms": round(statistics.fmean(timings), 3), "queries": queries, "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(org, repeat=10, only=None, log=None):
+    """Relatório ``{"meta": ..., "results": {caso: métricas}}`` dos casos da org."""
+    results = {}
+    # sem cache de resultado: mede a consulta, não o Redis/locmem; requests do APIRequestFactory vêm de "testserver"
+    with override_settings(ANALYTICS_CACHE_TIMEOUT=0, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        for name, fn in cases(org):
+            if only and not any(part in name for part in only):
+                continue
+            results[name] = measure(fn, repeat)
+            if log:
+                log(name, results[name])
+    return {
+        "meta": {
+            "commit": _commit(), "vendor": connection.vendor, "python": platform.python_version(),
+            "events": SalesEvent.objects.filter(org=org).count(), "repeat": repeat,
+            "created_at": timezone.now().isoformat(),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold=0.2, min_ms=1.0, min_kb=64):
+    """Regressões de ``report`` contra ``baseline``: [(caso, métrica, antes, depois)].
+
+    Latência (p95) e memória contam acima de ``threshold`` relativo e de um piso
+    absoluto (ruído); qualquer query a mais conta.
+    """
+    regressions = []
+    for name, after in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        if after["queries"] > before["queries"]:
+            regressions.append((name, "queries", before["queries"], after["queries"]))
+        for metric, floor in (("p95_ms", min_ms), ("peak_kb", min_kb)):
+            if after[metric] > before[metric] * (1 + threshold) and after[metric] - before[metric] > floor:
+                regressions.append((name, metric, before[metric], after[metric]))
+    return regressions
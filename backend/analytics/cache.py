@@ -0,0 +1,81 @@
+# backend/analytics/cache.py
+"""Cache de resultados das views de analytics.
+
+As chaves combinam os filtros normalizados com uma versão por tabela; qualquer
+escrita em MetricPoint/SalesEvent incrementa a versão, então entradas antigas
+simplesmente deixam de ser lidas (e expiram pelo timeout). Com
+``ANALYTICS_CACHE_TIMEOUT=0`` (padrão sem Redis) as views não cacheiam nem
+usam o digest como ETag: versões num cache por processo não veem as escritas
+dos outros.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from config import instrumentation
+
+VERSION_KEY = "analytics:version:{table}"
+RESULT_KEY = "analytics:result:{digest}"
+
+METRICS = "metricpoint"
+SALES = "salesevent"
+
+
+def enabled():
+    return getattr(settings, "ANALYTICS_CACHE_TIMEOUT", 300) > 0
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns())
+
+
+def bump_data_version(table):
+    key = VERSION_KEY.format(table=table)
+    _incr(key)
+    # de novo no commit: leituras concorrentes podem ter cacheado o estado pré-commit
+    transaction.on_commit(lambda: _incr(key))
+
+
+def data_versions(*tables):
+    keys = [VERSION_KEY.format(table=t) for t in tables]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # começa num valor "aleatório" para não colidir com versões despejadas do cache
+            cache.add(key, time.time_ns())
+            found[key] = cache.get(key)
+    return [found[k] for k in keys]
+
+
+def canonical_filters(filters):
+    """Forma estável do dict de ``_filters`` (lookups iexact viram minúsculas)."""
+    out = {}
+    for lookup, value in filters.items():
+        if lookup.endswith("__iexact"):
+            value = str(value).lower()
+        elif isinstance(value, (list, tuple)):
+            value = [str(v) for v in value]
+        out[lookup] = value
+    return json.dumps(out, sort_keys=True, separators=(",", ":"))
+
+
+def result_digest(name, filters, tables):
+    raw = "|".join([name, canonical_filters(filters), *map(str, data_versions(*tables))])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def get_result(digest):
+    data = cache.get(RESULT_KEY.format(digest=digest))
+    instrumentation.record_cache("analytics", data is not None)
+    return data
+
+
+def set_result(digest, data):
+    cache.set(RESULT_KEY.format(digest=digest), data, getattr(settings, "ANALYTICS_CACHE_TIMEOUT", 300))
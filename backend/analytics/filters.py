@@ -0,0 +1,20 @@
+import django_filters
+
+from .models import SalesEvent
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class SalesEventFilter(django_filters.FilterSet):
+    # date_from inclusivo, date_to exclusivo (mesma convenção dos widgets)
+    date_from = django_filters.IsoDateTimeFilter(field_name="occurred_at", lookup_expr="gte")
+    date_to   = django_filters.IsoDateTimeFilter(field_name="occurred_at", lookup_expr="lt")
+    product   = CharInFilter(field_name="product")
+    channel   = CharInFilter(field_name="channel")
+    region    = CharInFilter(field_name="region")
+
+    class Meta:
+        model  = SalesEvent
+        fields = ["date_from", "date_to", "product", "channel", "region"]
@@ -0,0 +1,174 @@
+# backend/analytics/imports.py
+"""Leitura de arquivos de DataSource em blocos e carga em SalesEvent/MetricPoint.
+
+Nenhum formato é carregado inteiro na memória: CSV usa ``pandas.read_csv``
+com ``chunksize``, Parquet usa ``pyarrow`` (batches) e Excel usa ``openpyxl``
+em modo read-only. pyarrow/openpyxl são opcionais; sem eles o import falha
+com uma mensagem clara no DataSource.
+"""
+import os
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+import pandas as pd
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from . import cache as analytics_cache
+from .ingest import RowError, parse_event, write_events
+from .models import DataSource, MetricPoint, Product, Region
+from .rollups import apply_metric_points
+
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet", ".xlsx": "excel", ".xlsm": "excel"}
+# dependência opcional de cada leitor; o upload recusa o formato se ela não estiver instalada
+REQUIRES = {"parquet": "pyarrow", "excel": "openpyxl"}
+
+
+def file_format(name):
+    fmt = FORMATS.get(os.path.splitext(name)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported file type: {name} (use {', '.join(sorted(FORMATS))})")
+    return fmt
+
+
+# ---------- leitores: geram listas de dicts com até chunk_size linhas ----------
+
+def _csv_chunks(f, chunk_size):
+    for df in pd.read_csv(f, chunksize=chunk_size, dtype=str, keep_default_na=False):
+        yield df.to_dict("records")
+
+
+def _parquet_chunks(f, chunk_size):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet import requires pyarrow (pip install pyarrow)") from None
+    for batch in pq.ParquetFile(f).iter_batches(batch_size=chunk_size):
+        yield batch.to_pylist()
+
+
+def _excel_chunks(f, chunk_size):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Excel import requires openpyxl (pip install openpyxl)") from None
+    wb = load_workbook(f, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(h) if h is not None else "" for h in next(rows, ())]
+        while chunk := list(islice(rows, chunk_size)):
+            yield [dict(zip(header, row)) for row in chunk]
+    finally:
+        wb.close()
+
+
+READERS = {"csv": _csv_chunks, "parquet": _parquet_chunks, "excel": _excel_chunks}
+
+
+def iter_chunks(f, fmt, chunk_size):
+    return READERS[fmt](f, chunk_size)
+
+
+def map_columns(rows, column_map):
+    """Renomeia colunas (``column_map`` explícito, senão nome normalizado em minúsculas)."""
+    mapping = {k.strip().lower(): v for k, v in (column_map or {}).items()}
+    for row in rows:
+        yield {mapping.get(str(k).strip().lower(), str(k).strip().lower()): v for k, v in row.items()}
+
+
+# ---------- carga ----------
+
+def load_sales_events(org_id, rows):
+    events, rejected = [], 0
+    for raw in rows:
+        try:
+            events.append(parse_event(raw, org_id))
+        except RowError:
+            rejected += 1
+    return write_events(events), rejected
+
+
+class MetricPointLoader:
+    """Carga de MetricPoint da org; resolve Product/Region por nome com cache por import."""
+
+    def __init__(self, org_id):
+        self.org_id = org_id
+        self.products = {p.name: p for p in Product.objects.all()}
+        self.regions = {r.code: r for r in Region.objects.all()}
+
+    def _ref(self, cache, model, field, value):
+        if value not in cache:
+            cache[value], _ = model.objects.get_or_create(**{field: value})
+        return cache[value]
+
+    def _point(self, raw):
+        day = parse_date(str(raw.get("date") or "")[:10])
+        product = str(raw.get("product") or "").strip()
+        region = str(raw.get("region") or "").strip()
+        if day is None or not product or not region:
+            raise RowError("date, product and region are required")
+        try:
+            return MetricPoint(
+                org_id=self.org_id,
+                date=day,
+                product=self._ref(self.products, Product, "name", product),
+                region=self._ref(self.regions, Region, "code", region),
+                revenue=Decimal(str(raw.get("revenue") or 0)).quantize(Decimal("0.01")),
+                users=int(float(raw.get("users") or 0)),
+                orders=int(float(raw.get("orders") or 0)),
+            )
+        except (InvalidOperation, TypeError, ValueError):
+            raise RowError("revenue, users and orders must be numbers") from None
+
+    def load(self, rows):
+        """Upsert por (org, date, product, region): reimportar um arquivo substitui os pontos."""
+        points, rejected = {}, 0
+        for raw in rows:
+            try:
+                p = self._point(raw)
+            except RowError:
+                rejected += 1
+                continue
+            points[(p.date, p.product.id, p.region.id)] = p  # repetido no bloco: vale o último
+        if points:
+            points = list(points.values())
+            with transaction.atomic():
+                keys = {(p.date, p.product.id, p.region.id) for p in points}
+                existing = [m for m in MetricPoint.objects.select_for_update().filter(
+                                org_id=self.org_id, date__in={k[0] for k in keys}, product__in={k[1] for k in keys},
+                                region__in={k[2] for k in keys})
+                            if (m.date, m.product_id, m.region_id) in keys]
+                apply_metric_points(existing, sign=-1)
+                MetricPoint.objects.bulk_create(points, update_conflicts=True,
+                                                unique_fields=["org", "date", "product", "region"],
+                                                update_fields=["revenue", "users", "orders"])
+                apply_metric_points(points)
+            analytics_cache.bump_data_version(analytics_cache.METRICS)
+        return len(points), rejected
+
+
+def run_import(ds, chunk_size):
+    """Processa o arquivo do DataSource bloco a bloco, gravando progresso a cada bloco.
+
+    Carga e progresso de um bloco vão na mesma transação: depois de uma falha o
+    import continua de ``rows_processed`` sem duplicar as linhas já gravadas.
+    """
+    fmt = file_format(ds.file.name)
+    if ds.target == DataSource.METRIC_POINTS:
+        load = MetricPointLoader(ds.org_id).load
+    else:
+        load = lambda rows: load_sales_events(ds.org_id, rows)  # noqa: E731
+
+    skip = ds.rows_processed
+    with ds.file.open("rb") as f:
+        for chunk in iter_chunks(f, fmt, chunk_size):
+            if skip:
+                chunk, skip = chunk[skip:], max(skip - len(chunk), 0)
+                if not chunk:
+                    continue
+            with transaction.atomic():
+                loaded, rejected = load(list(map_columns(chunk, ds.column_map)))
+                ds.rows_processed += len(chunk)
+                ds.rows_loaded += loaded
+                ds.rows_rejected += rejected
+                ds.save(update_fields=["rows_processed", "rows_loaded", "rows_rejected", "updated_at"])
@@ -0,0 +1,161 @@
+# backend/analytics/ingest.py
+"""Ingestão em lote de SalesEvent (NDJSON/CSV em streaming).
+
+As linhas são lidas do stream uma a uma, validadas em lotes e gravadas com
+``bulk_create`` (ou ``COPY`` no Postgres). Cada lote atualiza os rollups e a
+versão de dados do cache, como os signals fariam para um ``save()``.
+"""
+import csv
+import io
+import json
+import math
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import cache as analytics_cache
+from .models import SalesEvent
+from .rollups import apply_sales_events
+
+MAX_ERRORS_PER_BATCH = 20
+
+COPY_COLUMNS = ("org_id", "occurred_at", "amount", "cost", "product", "region", "channel", "customer", "created_at")
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(raw, field, max_length, required=False):
+    value = raw.get(field)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f"{field}: required")
+    if len(value) > max_length:
+        raise RowError(f"{field}: longer than {max_length} characters")
+    return value
+
+
+def _number(raw, field, required=False):
+    value = raw.get(field)
+    if value in (None, ""):
+        if required:
+            raise RowError(f"{field}: required")
+        return 0.0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field}: not a number") from None
+    # float() aceita "NaN", "Infinity" e "1e400" (inf): nem o banco nem os sketches aceitam
+    if not math.isfinite(number):
+        raise RowError(f"{field}: not a finite number")
+    return number
+
+
+def parse_event(raw, org_id):
+    """dict (linha NDJSON/CSV) -> SalesEvent não salvo; RowError se inválido."""
+    if not isinstance(raw, dict):
+        raise RowError("row must be an object")
+    occurred_at = parse_datetime(str(raw.get("occurred_at") or ""))
+    if occurred_at is None:
+        raise RowError("occurred_at: invalid datetime")
+    if timezone.is_naive(occurred_at):
+        occurred_at = timezone.make_aware(occurred_at)
+    return SalesEvent(
+        org_id=org_id,
+        occurred_at=occurred_at,
+        amount=_number(raw, "amount", required=True),
+        cost=_number(raw, "cost"),
+        product=_text(raw, "product", 80, required=True),
+        region=_text(raw, "region", 50),
+        channel=_text(raw, "channel", 50),
+        customer=_text(raw, "customer", 80),
+    )
+
+
+# ---------- leitores (um registro por vez, sem carregar o corpo inteiro) ----------
+
+def _lines(stream):
+    for line in stream:
+        yield line.decode("utf-8") if isinstance(line, bytes) else line
+
+
+def iter_ndjson(stream):
+    """(número da linha, dict | RowError) para cada linha não vazia."""
+    for lineno, line in enumerate(_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield lineno, json.loads(line)
+        except ValueError:
+            yield lineno, RowError("invalid JSON")
+
+
+def iter_csv(stream):
+    # linha 1 é o cabeçalho
+    for lineno, row in enumerate(csv.DictReader(_lines(stream)), start=2):
+        yield lineno, row
+
+
+READERS = {
+    "application/x-ndjson": iter_ndjson,
+    "application/jsonl": iter_ndjson,
+    "text/csv": iter_csv,
+}
+
+
+# ---------- escrita ----------
+
+def _use_copy():
+    return connection.vendor == "postgresql" and getattr(settings, "ANALYTICS_INGEST_USE_COPY", True)
+
+
+def _copy_events(events):
+    now = timezone.now()
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for e in events:
+        writer.writerow([e.org_id, e.occurred_at.isoformat(), e.amount, e.cost,
+                         e.product, e.region, e.channel, e.customer, now.isoformat()])
+    buf.seek(0)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f"COPY {SalesEvent._meta.db_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf,
+        )
+
+
+def write_events(events):
+    """Grava um lote de eventos e mantém rollups/versão do cache em dia."""
+    if not events:
+        return 0
+    with transaction.atomic():
+        if _use_copy():
+            _copy_events(events)
+        else:
+            SalesEvent.objects.bulk_create(events)
+        apply_sales_events(events)
+    analytics_cache.bump_data_version(analytics_cache.SALES)
+    return len(events)
+
+
+def ingest_rows(org_id, rows, batch_size=None):
+    """Valida e grava ``(lineno, raw)`` em lotes; gera um resumo por lote."""
+    batch_size = batch_size or settings.ANALYTICS_INGEST_BATCH_SIZE
+    rows = iter(rows)
+    number = 0
+    while chunk := list(islice(rows, batch_size)):
+        number += 1
+        events, errors = [], []
+        for lineno, raw in chunk:
+            try:
+                if isinstance(raw, RowError):
+                    raise raw
+                events.append(parse_event(raw, org_id))
+            except RowError as exc:
+                if len(errors) < MAX_ERRORS_PER_BATCH:
+                    errors.append({"line": lineno, "error": str(exc)})
+        write_events(events)
+        yield {"batch": number, "accepted": len(events), "rejected": len(chunk) - len(events), "errors": errors}
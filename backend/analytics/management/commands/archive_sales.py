@@ -0,0 +1,32 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Organization
+from analytics.archive import archive_closed_months, archive_month
+
+
+class Command(BaseCommand):
+    help = "Move closed months of SalesEvent to the Parquet archive (MEDIA_ROOT/archive/sales)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", help="organization slug (with --month)")
+        parser.add_argument("--month", type=lambda v: dt.datetime.strptime(v, "%Y-%m").date(), help="YYYY-MM")
+        parser.add_argument("--after-months", type=int,
+                            help="archive every org's months closed more than N months ago "
+                                 "(default: ANALYTICS_ARCHIVE_AFTER_MONTHS)")
+
+    def handle(self, *args, **opts):
+        try:
+            if opts["month"]:
+                if not opts["org"]:
+                    raise CommandError("--month needs --org")
+                org = Organization.objects.get(slug=opts["org"])
+                summary = {f"{org.id}:{opts['month']:%Y-%m}": archive_month(org.id, opts["month"])}
+            else:
+                summary = archive_closed_months(opts["after_months"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        for key, moved in summary.items():
+            self.stdout.write(f"{key}: {moved} events archived")
+        self.stdout.write(self.style.SUCCESS(f"{sum(summary.values())} events archived."))
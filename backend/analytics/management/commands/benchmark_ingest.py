@@ -0,0 +1,77 @@
+import io
+import json
+import random
+import time
+from itertools import islice
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import Organization
+from analytics.ingest import READERS, ingest_rows, parse_event
+from analytics.models import SalesDailyRollup, SalesEvent
+
+class Command(BaseCommand):
+    help = "Measure bulk ingestion throughput (rows/s) for NDJSON/CSV bodies and batch sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50000)
+        parser.add_argument("--batch-sizes", default="1000,5000,20000", help="comma separated")
+        parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+        parser.add_argument("--keep", action="store_true", help="keep the benchmark org and its events")
+        parser.add_argument("--baseline", type=int, default=0,
+                            help="also time N rows through SalesEvent.objects.create (one INSERT per row)")
+
+    def _body(self, rows, fmt):
+        rnd = random.Random(42)
+        start = dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc)
+        buf = io.StringIO()
+        if fmt == "csv":
+            buf.write("occurred_at,amount,cost,product,region,channel\n")
+        for _ in range(rows):
+            amount = round(rnd.uniform(10, 1000), 2)
+            row = {
+                "occurred_at": (start + dt.timedelta(seconds=rnd.randint(0, 90 * 86400))).isoformat(),
+                "amount": amount, "cost": round(amount * 0.4, 2),
+                "product": rnd.choice(["Alpha", "Beta", "Gamma", "Delta", "Omega"]),
+                "region": rnd.choice(["NA", "EU", "LATAM", "APAC"]),
+                "channel": rnd.choice(["web", "retail", "partner"]),
+            }
+            if fmt == "csv":
+                buf.write(",".join(str(row[k]) for k in ("occurred_at", "amount", "cost", "product", "region", "channel")) + "\n")
+            else:
+                buf.write(json.dumps(row) + "\n")
+        return buf.getvalue().encode()
+
+    def handle(self, *args, **opts):
+        body = self._body(opts["rows"], opts["format"])
+        reader = READERS["text/csv" if opts["format"] == "csv" else "application/x-ndjson"]
+        org, _ = Organization.objects.get_or_create(slug="ingest-benchmark", defaults={"name": "Ingest Benchmark"})
+        self.stdout.write(f"{opts['rows']} rows, {len(body) / 1e6:.1f} MB {opts['format']} on {connection.vendor}")
+
+        try:
+            for batch_size in map(int, opts["batch_sizes"].split(",")):
+                self._clear(org)
+                t0 = time.perf_counter()
+                accepted = sum(b["accepted"] for b in ingest_rows(org.id, reader(io.BytesIO(body)), batch_size))
+                elapsed = time.perf_counter() - t0
+                self.stdout.write(f"batch_size={batch_size:>6}  {accepted / elapsed:>10.0f} rows/s  ({elapsed:.2f}s)")
+
+            if n := opts["baseline"]:
+                self._clear(org)
+                rows = [raw for _, raw in islice(reader(io.BytesIO(body)), n)]
+                t0 = time.perf_counter()
+                for raw in rows:
+                    parse_event(raw, org.id).save()
+                elapsed = time.perf_counter() - t0
+                self.stdout.write(f"create() loop      {len(rows) / elapsed:>10.0f} rows/s  ({elapsed:.2f}s)")
+        finally:
+            if not opts["keep"]:
+                self._clear(org)
+                org.delete()
+
+    def _clear(self, org):
+        # sem signals por linha: a org de benchmark é descartável
+        SalesEvent.objects.filter(org=org)._raw_delete(SalesEvent.objects.db)
+        SalesDailyRollup.objects.filter(org=org).delete()
@@ -0,0 +1,75 @@
+import random
+import time
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import Organization
+from config.renderers import ORJSONRenderer
+from dashboards.models import Dashboard, Widget, WidgetCache
+from dashboards.serializers import DashboardSerializer
+
+START = dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def _table(rnd):
+    return {"rows": [{"occurred_at": (START + dt.timedelta(seconds=rnd.randint(0, 86400 * 90))).isoformat(),
+                      "product": rnd.choice(["Alpha", "Beta", "Gamma"]), "channel": rnd.choice(["web", "retail"]),
+                      "region": rnd.choice(["NA", "EU", "APAC"]), "amount": round(rnd.uniform(10, 1000), 2)}
+                     for _ in range(50)]}
+
+
+def _trend(rnd, points):
+    return {"series": [{"x": (START + dt.timedelta(days=d)).date().isoformat(), "y": round(rnd.uniform(0, 5000), 2)}
+                       for d in range(points)]}
+
+
+class Command(BaseCommand):
+    help = ("Time the dashboards list response: decoded payloads + DRF JSONRenderer (before) "
+            "vs pre-encoded payload_json + ORJSONRenderer (after), inside a rolled back transaction")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dashboards", type=int, default=20)
+        parser.add_argument("--widgets", type=int, default=8, help="widgets per dashboard (half tables, half trends)")
+        parser.add_argument("--points", type=int, default=365, help="points per trend series")
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            org = self._seed(opts)
+            variants = [
+                ("before: JSONField + JSONRenderer", ["cache__state", "cache__payload_json"], JSONRenderer()),
+                ("after:  payload_json + ORJSONRenderer", ["cache__state", "cache__payload"], ORJSONRenderer()),
+            ]
+            self.stdout.write(f"{opts['dashboards']} dashboards x {opts['widgets']} widgets, best of {opts['repeat']}")
+            for name, deferred, renderer in variants:
+                widgets = Widget.objects.select_related("cache").defer(*deferred).order_by("id")
+                queryset = Dashboard.objects.filter(org=org).prefetch_related(Prefetch("widgets", queryset=widgets))
+                load = serialize = render = float("inf")
+                for _ in range(opts["repeat"]):
+                    t0 = time.perf_counter()
+                    dashboards = list(queryset.all())
+                    t1 = time.perf_counter()
+                    data = DashboardSerializer(dashboards, many=True).data
+                    t2 = time.perf_counter()
+                    body = renderer.render(data)
+                    t3 = time.perf_counter()
+                    load, serialize, render = min(load, t1 - t0), min(serialize, t2 - t1), min(render, t3 - t2)
+                self.stdout.write(f"{name:<40} load {load * 1000:7.2f} ms  serialize {serialize * 1000:7.2f} ms  "
+                                  f"render {render * 1000:7.2f} ms  ({len(body) / 1e3:.0f} kB)")
+            transaction.set_rollback(True)
+
+    def _seed(self, opts):
+        rnd = random.Random(42)
+        org = Organization.objects.create(name="Rendering Benchmark", slug="rendering-benchmark")
+        for i in range(opts["dashboards"]):
+            dashboard = Dashboard.objects.create(org=org, title=f"Board {i}")
+            for j in range(opts["widgets"]):
+                table = j % 2 == 0
+                widget = Widget.objects.create(dashboard=dashboard, type="table" if table else "timeseries")
+                # save() passa pelo signal que grava payload_json
+                WidgetCache.objects.create(widget=widget, payload=_table(rnd) if table else _trend(rnd, opts["points"]))
+        return org
@@ -0,0 +1,66 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from analytics import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Seed a synthetic dataset, time every analytics/dashboards endpoint and widget type "
+            "(latency percentiles, query count, peak memory) and write/compare a JSON report")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=100000, help="SalesEvent rows per org")
+        parser.add_argument("--days", type=int, default=90)
+        parser.add_argument("--orgs", type=int, default=1, help="orgs seeded (the first one is measured)")
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--only", help="comma separated case name fragments (e.g. api.,widget.table)")
+        parser.add_argument("--reuse", action="store_true", help="measure the dataset left by a previous --keep run")
+        parser.add_argument("--keep", action="store_true", help="keep the benchmark dataset")
+        parser.add_argument("--output", help="write the JSON report to this file ('-' = stdout)")
+        parser.add_argument("--compare", help="baseline JSON report; exits with status 1 on regressions")
+        parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown tolerated (0.2 = 20%%)")
+
+    def handle(self, *args, **opts):
+        baseline = self._load(opts["compare"]) if opts["compare"] else None
+        orgs = benchmarks.dataset() if opts["reuse"] else []
+        if not orgs:
+            self.stderr.write(f"seeding {opts['orgs']} x {opts['events']} events on {connection.vendor}...")
+            orgs = benchmarks.seed(opts["events"], opts["days"], opts["orgs"],
+                                   log=lambda msg: self.stderr.write(msg, ending="\r"))
+            self.stderr.write("")
+
+        try:
+            only = [p for p in (opts["only"] or "").split(",") if p]
+            report = benchmarks.run(orgs[0], opts["repeat"], only, log=self._row)
+        finally:
+            if not opts["keep"]:
+                benchmarks.clear()
+
+        if opts["output"] == "-":
+            self.stdout.write(json.dumps(report, indent=2))
+        elif opts["output"]:
+            with open(opts["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stderr.write(f"report written to {opts['output']}")
+
+        if baseline is not None:
+            regressions = benchmarks.compare(report, baseline, opts["threshold"])
+            for name, metric, before, after in regressions:
+                self.stderr.write(self.style.ERROR(f"REGRESSION {name} {metric}: {before} -> {after}"))
+            if regressions:
+                sys.exit(1)
+            self.stderr.write(self.style.SUCCESS(f"no regressions against {baseline['meta'].get('commit')}"))
+
+    def _row(self, name, m):
+        self.stderr.write(f"{name:<28} p50 {m['p50_ms']:>9.2f} ms  p95 {m['p95_ms']:>9.2f} ms  "
+                          f"p99 {m['p99_ms']:>9.2f} ms  {m['queries']:>3} queries  peak {m['peak_kb']:>9.1f} kB")
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read baseline {path}: {exc}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from accounts.models import Organization
+from analytics.rollups import rebuild_metric_rollups, rebuild_sales_rollups
+
+class Command(BaseCommand):
+    help = "Backfill/rebuild daily rollups from raw SalesEvent and MetricPoint rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", help="organization slug (default: all)")
+        parser.add_argument("--from", dest="date_from", type=parse_date, help="first day (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="date_to", type=parse_date, help="last day, inclusive (YYYY-MM-DD)")
+        parser.add_argument("--only", choices=["sales", "metrics"])
+
+    def handle(self, *args, **opts):
+        org = Organization.objects.get(slug=opts["org"]) if opts["org"] else None
+
+        if opts["only"] != "metrics":
+            n = rebuild_sales_rollups(org=org, day_from=opts["date_from"], day_to=opts["date_to"])
+            self.stdout.write(f"SalesDailyRollup: {n} buckets")
+        if opts["only"] != "sales":
+            n = rebuild_metric_rollups(org=org, date_from=opts["date_from"], date_to=opts["date_to"])
+            self.stdout.write(f"MetricDailyRollup: {n} buckets")
+        self.stdout.write(self.style.SUCCESS("Rollups rebuilt."))
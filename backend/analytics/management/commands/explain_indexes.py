@@ -0,0 +1,113 @@
+import random
+import time
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from accounts.models import Organization
+from analytics.models import MetricPoint, Product, Region, SalesEvent
+
+PREFIX = "index-benchmark"
+PRODUCTS = ["Alpha", "Beta", "Gamma", "Delta", "Omega"]
+REGIONS = ["NA", "EU", "LATAM", "APAC"]
+CHANNELS = ["web", "retail", "partner"]
+START = dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc)
+DAYS = 180
+
+# índices compostos/funcionais (migrations 0008/0009, nomes atuais; o de cobertura só existe no Postgres)
+NEW_INDEXES = ["salesevent_org_time_id", "salesevent_org_channel_time", "salesevent_org_time_cover",
+               "product_name_upper", "region_code_upper", "metricpoint_org_prod_reg_date"]
+# a unique de MetricPoint também é índice; no SQLite ela faz parte do CREATE TABLE e não sai
+NEW_CONSTRAINT = (MetricPoint._meta.db_table, "metricpoint_org_date_prod_reg")
+# o que a migration 0009 removeu de MetricPoint
+LEGACY_INDEXES = [("bench_legacy_date", MetricPoint._meta.db_table, "date"),
+                  ("bench_legacy_product_region", MetricPoint._meta.db_table, "product_id, region_id")]
+
+
+def _queries(org):
+    since, until = START + dt.timedelta(days=30), START + dt.timedelta(days=60)
+    events = SalesEvent.objects.filter(org=org)
+    return [
+        ("widget scan (org, range)", events.filter(occurred_at__gte=since, occurred_at__lt=until)
+            .values("product", "region", "channel").annotate(amount=Sum("amount"), count=Count("id")).order_by()),
+        ("channel filter", events.filter(channel__in=["web"], occurred_at__gte=since, occurred_at__lt=until)
+            .values("product").annotate(amount=Sum("amount")).order_by()),
+        ("latest orders table", events.order_by("-occurred_at").values("occurred_at", "product", "amount")[:50]),
+        ("metric ?product=&region=", MetricPoint.objects
+            .filter(org=org, product__name__iexact=f"{PREFIX} alpha", region__code__iexact="bench-eu",
+                    date__range=(since.date(), until.date()))
+            .values("date").annotate(revenue=Sum("revenue")).order_by()),
+    ]
+
+
+class Command(BaseCommand):
+    help = ("Print query plans and timings of the tenant query patterns with and without the composite "
+            "indexes. Everything, seed data included, runs inside a transaction that is rolled back")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200000, help="SalesEvent rows per org")
+        parser.add_argument("--orgs", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **opts):
+        # seed, DROP/CREATE INDEX e consultas numa transação só, desfeita no fim: o banco configurado
+        # (que pode não ser descartável) termina como estava, mesmo se algo falhar no meio
+        with transaction.atomic():
+            orgs = self._seed(opts["orgs"], opts["rows"])
+            self.stdout.write(f"{opts['rows']} events x {len(orgs)} orgs on {connection.vendor}")
+            before = self._without_indexes(lambda: self._run(orgs[0], opts["repeat"]))
+            after = self._run(orgs[0], opts["repeat"])
+            transaction.set_rollback(True)
+        for (name, plan_before, ms_before), (_, plan_after, ms_after) in zip(before, after):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}: {ms_before:.2f} ms -> {ms_after:.2f} ms"))
+            self.stdout.write(f"  before:\n    {plan_before}\n  after:\n    {plan_after}")
+
+    def _run(self, org, repeat):
+        results = []
+        for name, qs in _queries(org):
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                list(qs.all())
+                best = min(best, time.perf_counter() - t0)
+            results.append((name, qs.explain().replace("\n", "\n    "), best * 1000))
+        return results
+
+    def _without_indexes(self, fn):
+        # DROP INDEX é transacional no SQLite e no Postgres: nada sobrevive ao rollback do savepoint
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for name in NEW_INDEXES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {name}")
+                if connection.vendor == "postgresql":
+                    cursor.execute("ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}".format(*NEW_CONSTRAINT))
+                for legacy in LEGACY_INDEXES:
+                    cursor.execute("CREATE INDEX {} ON {} ({})".format(*legacy))
+            result = fn()
+            transaction.set_rollback(True)
+        return result
+
+    def _seed(self, n_orgs, rows):
+        rnd = random.Random(42)
+        orgs = [Organization.objects.create(name=f"Index Benchmark {i}", slug=f"{PREFIX}-{i}") for i in range(n_orgs)]
+        # bulk_create direto (sem rollups): as tabelas brutas são o que está sendo medido
+        for org in orgs:
+            SalesEvent.objects.bulk_create(
+                (SalesEvent(org=org, occurred_at=START + dt.timedelta(seconds=rnd.randint(0, DAYS * 86400)),
+                            amount=round(rnd.uniform(10, 1000), 2), product=rnd.choice(PRODUCTS),
+                            region=rnd.choice(REGIONS), channel=rnd.choice(CHANNELS)) for _ in range(rows)),
+                batch_size=5000,
+            )
+        products = Product.objects.bulk_create([Product(name=f"{PREFIX} {p.lower()}") for p in PRODUCTS])
+        regions = Region.objects.bulk_create([Region(code=f"BENCH-{r}") for r in REGIONS])
+        MetricPoint.objects.bulk_create(
+            (MetricPoint(org=org, date=(START + dt.timedelta(days=d)).date(), product=p, region=r,
+                         revenue=rnd.randint(100, 10000), users=rnd.randint(10, 500), orders=rnd.randint(1, 10))
+             for org in orgs for d in range(DAYS) for p in products for r in regions),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")  # estatísticas frescas para o planner
+        return orgs
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.partitions import convert_to_partitioned, ensure_partitions, is_partitioned, partitions
+from analytics.retention import apply_retention
+
+
+class Command(BaseCommand):
+    help = "Manage monthly SalesEvent partitions (PostgreSQL) and apply per-org retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--convert", action="store_true",
+                            help="convert the plain table into a partitioned one (locks the table while copying)")
+        parser.add_argument("--ahead", type=int, default=settings.ANALYTICS_PARTITION_MONTHS_AHEAD,
+                            help="months of partitions to create ahead of the current one")
+        parser.add_argument("--retention", action="store_true", help="also apply Organization.sales_retention_days")
+        parser.add_argument("--action", choices=["drop", "detach"], help="what to do with expired partitions")
+
+    def handle(self, *args, **opts):
+        if opts["convert"]:
+            try:
+                created = convert_to_partitioned(opts["ahead"])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f"Converted: {len(created)} monthly partitions")
+        elif not is_partitioned():
+            self.stdout.write("SalesEvent is not partitioned (run with --convert on PostgreSQL)")
+        else:
+            created = ensure_partitions(opts["ahead"])
+            self.stdout.write(f"Created: {', '.join(created) or 'none'}")
+
+        if opts["retention"]:
+            summary = apply_retention(action=opts["action"])
+            for slug, deleted in summary["orgs"].items():
+                self.stdout.write(f"{slug}: {deleted} events removed")
+            if summary["partitions"]:
+                self.stdout.write(f"Expired partitions: {', '.join(summary['partitions'])}")
+
+        if months := sorted(partitions()):
+            self.stdout.write(f"Partitions: {months[0]:%Y-%m} .. {months[-1]:%Y-%m} ({len(months)})")
+        self.stdout.write(self.style.SUCCESS("Done."))
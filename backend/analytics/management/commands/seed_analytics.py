@@ -3,7 +3,9 @@ from faker import Faker
 import random
 from datetime import datetime, timedelta
 
+from accounts.models import Organization
 from analytics.models import MetricPoint, Product, Region
+from analytics.rollups import rebuild_metric_rollups
 
 class Command(BaseCommand):
     help = "Seed demo analytics data (products x regions x days)"
@@ -11,10 +13,12 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--days", type=int, default=60)
         parser.add_argument("--clean", action="store_true", help="truncate tables before seeding")
+        parser.add_argument("--org", default="nebula", help="organization slug (created if missing)")
 
     def handle(self, *args, **opts):
         fake = Faker()
         days = opts["days"]
+        org, _ = Organization.objects.get_or_create(slug=opts["org"], defaults={"name": opts["org"].title()})
 
         products_names = ["Nebula Pro", "Nebula Lite", "Orion X", "Quasar", "Pulsar"]
         regions_codes  = ["NA", "EU", "LATAM", "APAC", "MEA"]
@@ -40,6 +44,7 @@ class Command(BaseCommand):
 
         # limpa métricas antigas (opcional)
         MetricPoint.objects.filter(
+            org=org,
             product__in=Product.objects.filter(name__in=products_names),
             region__in=Region.objects.filter(code__in=regions_codes)
         ).delete()
@@ -54,6 +59,7 @@ class Command(BaseCommand):
                     users   = random.randint(50, 800)
                     orders  = random.randint(10, users)
                     rows.append(MetricPoint(
+                        org=org,
                         date=day,
                         product=products[p],   # << FK
                         region=regions[r],     # << FK
@@ -62,4 +68,6 @@ class Command(BaseCommand):
                         orders=orders,
                     ))
         MetricPoint.objects.bulk_create(rows, batch_size=2000)
-        self.stdout.write(self.style.SUCCESS(f"Seeded {len(rows)} MetricPoint rows"))
+        # bulk_create não dispara signals: recalcula os rollups diários
+        rebuild_metric_rollups(org=org)
+        self.stdout.write(self.style.SUCCESS(f"Seeded {len(rows)} MetricPoint rows for {org.slug}"))
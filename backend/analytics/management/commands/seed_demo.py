@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from accounts.models import Organization, Membership
 from analytics.models import SalesEvent
+from analytics.ingest import write_events
 from faker import Faker
 import random, datetime as dt
 
@@ -11,6 +12,7 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--days", type=int, default=60)
         parser.add_argument("--events", type=int, default=2000)
+        parser.add_argument("--batch-size", type=int, default=5000)
 
     def handle(self, *args, **opts):
         User = get_user_model()
@@ -26,15 +28,20 @@ class Command(BaseCommand):
         channels = ["web","retail","partner"]
         regions  = ["NA","EU","LATAM","APAC"]
 
-        start = dt.datetime.utcnow() - dt.timedelta(days=opts["days"])
+        start = dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=opts["days"])
+        events = []
         for _ in range(opts["events"]):
             occurred = start + dt.timedelta(seconds=random.randint(0, opts["days"]*86400))
             amount = round(random.uniform(10, 1000), 2)
             cost   = round(amount * random.uniform(0.2, 0.7), 2)
-            SalesEvent.objects.create(
+            events.append(SalesEvent(
                 org=org, occurred_at=occurred, amount=amount, cost=cost,
                 product=random.choice(products),
                 channel=random.choice(channels),
                 region=random.choice(regions),
-            )
+            ))
+            if len(events) >= opts["batch_size"]:
+                write_events(events)
+                events = []
+        write_events(events)
         self.stdout.write(self.style.SUCCESS("Demo seeded: user=demo / pass=demo"))
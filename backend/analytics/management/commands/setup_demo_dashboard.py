@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from accounts.models import Organization
 from dashboards.models import Dashboard, Widget
+from dashboards.tasks import refresh_dashboard
 
 class Command(BaseCommand):
     help = "Create a demo dashboard with widgets"
@@ -20,4 +21,5 @@ class Command(BaseCommand):
         ]
         for cfg in widgets:
             Widget.objects.get_or_create(dashboard=dash, type=cfg["type"], title=cfg["title"], defaults={"config":cfg["config"]})
+        refresh_dashboard(dash.id)
         self.stdout.write(self.style.SUCCESS("Dashboard demo created."))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('analytics', '0004_datasource_report'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('users', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('points', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('product', models.CharField(max_length=80)),
+                ('region', models.CharField(blank=True, max_length=50)),
+                ('channel', models.CharField(blank=True, max_length=50)),
+                ('amount', models.FloatField(default=0)),
+                ('cost', models.FloatField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('org', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.organization')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salesdailyrollup',
+            constraint=models.UniqueConstraint(fields=('org', 'day', 'product', 'region', 'channel'), name='sales_rollup_bucket_unique'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('analytics', '0005_sales_metric_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='column_map',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='org',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.organization'),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='rows_loaded',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='rows_processed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='rows_rejected',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='status',
+            field=models.CharField(default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='target',
+            field=models.CharField(choices=[('sales_events', 'Sales events'), ('metric_points', 'Metric points')], default='sales_events', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='type',
+            field=models.CharField(default='file', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='datasource',
+            name='file',
+            field=models.FileField(blank=True, upload_to='datasources/'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('analytics', '0006_datasource_import_pipeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel'), ('pdf', 'PDF')], default='csv', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='org',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.organization'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='params_hash',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='rows',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='report',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'processing'])), fields=('org', 'params_hash'), name='report_unique_in_flight'),
+        ),
+    ]
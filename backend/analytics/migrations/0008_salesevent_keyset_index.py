@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_report_generation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salesevent',
+            index=models.Index(fields=['org', 'occurred_at', 'id'], name='salesevent_org_time_id'),
+        ),
+    ]
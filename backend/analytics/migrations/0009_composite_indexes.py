@@ -0,0 +1,78 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:27
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+import django.db.models.functions.text
+
+COVERING_INDEX = "salesevent_org_time_cover"
+
+
+def dedupe_metric_points(apps, schema_editor):
+    """Mantém o ponto mais recente de cada (date, product, region) antes da constraint."""
+    MetricPoint = apps.get_model("analytics", "MetricPoint")
+    MetricDailyRollup = apps.get_model("analytics", "MetricDailyRollup")
+    dupes = (MetricPoint.objects.values("date", "product", "region")
+             .annotate(n=Count("id"), keep=Max("id")).filter(n__gt=1))
+    dates = set()
+    for d in dupes.iterator():
+        MetricPoint.objects.filter(date=d["date"], product=d["product"], region=d["region"]) \
+            .exclude(id=d["keep"]).delete()
+        dates.add(d["date"])
+    # rollup diário dos dias afetados
+    for row in (MetricPoint.objects.filter(date__in=dates).values("date")
+                .annotate(revenue=Sum("revenue"), users=Sum("users"), orders=Sum("orders"), points=Count("id"))):
+        MetricDailyRollup.objects.update_or_create(date=row.pop("date"), defaults=row)
+
+
+def create_covering_index(apps, schema_editor):
+    # Postgres: index-only scan nos agregados dos widgets (INCLUDE não existe no SQLite)
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {COVERING_INDEX} ON analytics_salesevent (org_id, occurred_at) "
+            "INCLUDE (amount, product, region, channel)"
+        )
+
+
+def drop_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {COVERING_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_salesevent_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_metric_points, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='metricpoint',
+            name='analytics_m_date_a20984_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='metricpoint',
+            name='analytics_m_product_b4bcb9_idx',
+        ),
+        migrations.AddIndex(
+            model_name='metricpoint',
+            index=models.Index(fields=['product', 'region', 'date'], name='metricpoint_prod_region_date'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Upper('name'), name='product_name_upper'),
+        ),
+        migrations.AddIndex(
+            model_name='region',
+            index=models.Index(django.db.models.functions.text.Upper('code'), name='region_code_upper'),
+        ),
+        migrations.AddIndex(
+            model_name='salesevent',
+            index=models.Index(fields=['org', 'channel', 'occurred_at'], name='salesevent_org_channel_time'),
+        ),
+        migrations.AddConstraint(
+            model_name='metricpoint',
+            constraint=models.UniqueConstraint(fields=('date', 'product', 'region'), name='metricpoint_date_product_region'),
+        ),
+        migrations.RunPython(create_covering_index, drop_covering_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_organization_sales_retention'),
+        ('analytics', '0009_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('file', models.FileField(blank=True, upload_to='archive/sales/')),
+                ('rows', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('org', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.organization')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salesarchive',
+            constraint=models.UniqueConstraint(fields=('org', 'month'), name='sales_archive_org_month_unique'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:05
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def assign_orgs(apps, schema_editor):
+    """Pontos já existentes vão para a primeira org (criada se não houver); rollups por (org, date)."""
+    Organization = apps.get_model("accounts", "Organization")
+    MetricPoint = apps.get_model("analytics", "MetricPoint")
+    MetricDailyRollup = apps.get_model("analytics", "MetricDailyRollup")
+    MetricDailyRollup.objects.all().delete()
+    if not MetricPoint.objects.exists():
+        return
+    org = Organization.objects.order_by("id").first()
+    if org is None:
+        org = Organization.objects.create(name="Default", slug="default")
+    MetricPoint.objects.update(org=org)
+    MetricDailyRollup.objects.bulk_create(
+        MetricDailyRollup(**row) for row in MetricPoint.objects.values("org_id", "date")
+        .annotate(revenue=Sum("revenue"), users=Sum("users"), orders=Sum("orders"), points=Count("id"))
+        .order_by()
+    )
+
+
+class Migration(migrations.Migration):
+    # Postgres: o UPDATE do RunPython deixa checagens de FK pendentes; o ALTER seguinte precisa de outra transação
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0002_organization_sales_retention'),
+        ('analytics', '0010_sales_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='metricpoint',
+            name='metricpoint_date_product_region',
+        ),
+        migrations.RemoveIndex(
+            model_name='metricpoint',
+            name='metricpoint_prod_region_date',
+        ),
+        migrations.AddField(
+            model_name='metricpoint',
+            name='org',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.organization'),
+        ),
+        migrations.AddField(
+            model_name='metricdailyrollup',
+            name='org',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.organization'),
+        ),
+        migrations.AlterField(
+            model_name='metricdailyrollup',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.RunPython(assign_orgs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='metricpoint',
+            name='org',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.organization'),
+        ),
+        migrations.AlterField(
+            model_name='metricdailyrollup',
+            name='org',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.organization'),
+        ),
+        migrations.AddConstraint(
+            model_name='metricpoint',
+            constraint=models.UniqueConstraint(fields=('org', 'date', 'product', 'region'), name='metricpoint_org_date_prod_reg'),
+        ),
+        migrations.AddIndex(
+            model_name='metricpoint',
+            index=models.Index(fields=['org', 'product', 'region', 'date'], name='metricpoint_org_prod_reg_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='metricdailyrollup',
+            constraint=models.UniqueConstraint(fields=('org', 'date'), name='metric_rollup_org_date_unique'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:04
+
+import analytics.sketches
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def backfill_sketches(apps, schema_editor):
+    """Sketches das linhas de rollup que já existem, dos eventos no banco e dos meses arquivados.
+
+    Por org e em janelas de dias (como o rebuild); sem isso a coluna NULL é lida
+    como sketch vazio e a remoção de um evento antigo deixa contagem negativa.
+    Dias já expurgados pela retenção não têm fonte: ficam NULL. Arquivos de antes
+    desta migration não têm ``customer``: nesses meses só o DDSketch sai completo.
+    """
+    from analytics.archive import cold_day_sketch_parts
+    from analytics.rollups import REBUILD_DAYS, _day_start, add_sketch_parts, sales_sketch_parts
+    from analytics.sketches import DDSketch, HyperLogLog
+
+    SalesEvent = apps.get_model("analytics", "SalesEvent")
+    SalesDailyRollup = apps.get_model("analytics", "SalesDailyRollup")
+    SalesArchive = apps.get_model("analytics", "SalesArchive")
+    key_fields = ("day", "product", "region", "channel")
+    archived = set(SalesArchive.objects.exclude(file="").values_list("org_id", flat=True))
+    log_gamma = DDSketch().log_gamma
+
+    spans = SalesDailyRollup.objects.values("org_id").annotate(first=Min("day"), last=Max("day")).order_by()
+    for span in spans:
+        org_id, first = span["org_id"], span["first"]
+        while first <= span["last"]:
+            last = first + timedelta(days=REBUILD_DAYS - 1)
+            rows = {tuple(getattr(r, f) for f in key_fields): r for r in
+                    SalesDailyRollup.objects.filter(org_id=org_id, day__gte=first, day__lte=last)}
+            buckets = {k: {"customers": HyperLogLog(), "amounts": DDSketch()} for k in rows}
+            since, until = _day_start(first), _day_start(last + timedelta(days=1))
+            parts = [sales_sketch_parts(SalesEvent.objects.filter(
+                org_id=org_id, occurred_at__gte=since, occurred_at__lt=until))]
+            if org_id in archived:
+                parts.append(cold_day_sketch_parts(org_id, log_gamma, since, until))
+            for customers, bins in parts:
+                # bucket sem linha de rollup (dia anterior à retenção) é descartado abaixo
+                add_sketch_parts(buckets, customers, bins, lambda r: tuple(r[f] for f in key_fields),
+                                 lambda: {"customers": HyperLogLog(), "amounts": DDSketch()})
+            for k, row in rows.items():
+                row.customers, row.amounts = buckets[k]["customers"], buckets[k]["amounts"]
+            SalesDailyRollup.objects.bulk_update(rows.values(), ["customers", "amounts"], batch_size=500)
+            first = last + timedelta(days=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0011_metricpoint_org'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesdailyrollup',
+            name='amounts',
+            field=analytics.sketches.SketchField(null=True, sketch='ddsketch'),
+        ),
+        migrations.AddField(
+            model_name='salesdailyrollup',
+            name='customers',
+            field=analytics.sketches.SketchField(null=True, sketch='hll'),
+        ),
+        migrations.AddField(
+            model_name='salesevent',
+            name='customer',
+            field=models.CharField(blank=True, max_length=80),
+        ),
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
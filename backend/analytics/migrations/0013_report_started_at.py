@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0012_sales_customer_sketches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models.functions import Upper
 from accounts.models import Organization
+from .sketches import SketchField
 
 class SalesEvent(models.Model):
     org        = models.ForeignKey(Organization, on_delete=models.CASCADE)
@@ -9,22 +11,40 @@ class SalesEvent(models.Model):
     product    = models.CharField(max_length=80)
     region     = models.CharField(max_length=50, blank=True)
     channel    = models.CharField(max_length=50, blank=True)  # web, retail, partner...
+    customer   = models.CharField(max_length=80, blank=True)  # id do cliente na origem (clientes únicos)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # listagem paginada por cursor (org, occurred_at, id)
+            # também cobre os filtros (org, occurred_at) dos widgets
+            models.Index(fields=["org", "occurred_at", "id"], name="salesevent_org_time_id"),
+            # widgets/relatórios com config["channels"]
+            models.Index(fields=["org", "channel", "occurred_at"], name="salesevent_org_channel_time"),
+        ]
+
 class Product(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
+    class Meta:
+        # filtros ?product= usam name__iexact -> UPPER(name)
+        indexes = [models.Index(Upper("name"), name="product_name_upper")]
+
     def __str__(self):
         return self.name
 
 class Region(models.Model):
     code = models.CharField(max_length=20, unique=True)
 
+    class Meta:
+        indexes = [models.Index(Upper("code"), name="region_code_upper")]
+
     def __str__(self):
         return self.code
 
 class MetricPoint(models.Model):
+    org  = models.ForeignKey(Organization, on_delete=models.CASCADE)
     date = models.DateField()
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="metrics")
     region  = models.ForeignKey(Region,  on_delete=models.CASCADE, related_name="metrics")
@@ -33,18 +53,99 @@ class MetricPoint(models.Model):
     orders  = models.IntegerField()
 
     class Meta:
+        constraints = [
+            # um ponto por org/dia/produto/região; também serve as consultas por (org, intervalo de datas)
+            models.UniqueConstraint(fields=["org", "date", "product", "region"], name="metricpoint_org_date_prod_reg"),
+        ]
         indexes = [
-            models.Index(fields=["date"]),
-            models.Index(fields=["product", "region"]),
+            models.Index(fields=["org", "product", "region", "date"], name="metricpoint_org_prod_reg_date"),
         ]
 
+# ---------- Rollups diários (mantidos por analytics.rollups) ----------
+
+class SalesDailyRollup(models.Model):
+    org     = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    day     = models.DateField()
+    product = models.CharField(max_length=80)
+    region  = models.CharField(max_length=50, blank=True)
+    channel = models.CharField(max_length=50, blank=True)
+    amount  = models.FloatField(default=0)
+    cost    = models.FloatField(default=0)
+    count   = models.IntegerField(default=0)
+    # sketches mergeáveis entre buckets (analytics.sketches): clientes únicos e percentis de amount
+    customers = SketchField(sketch="hll", null=True)
+    amounts   = SketchField(sketch="ddsketch", null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["org", "day", "product", "region", "channel"],
+                                    name="sales_rollup_bucket_unique"),
+        ]
+
+class SalesArchive(models.Model):
+    """Mês fechado de SalesEvent de uma org exportado para Parquet (tier frio, ver analytics.archive)."""
+    org     = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    month   = models.DateField()  # primeiro dia do mês (UTC)
+    file    = models.FileField(upload_to="archive/sales/", blank=True)
+    rows    = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["org", "month"], name="sales_archive_org_month_unique")]
+
+class MetricDailyRollup(models.Model):
+    org     = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    date    = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    users   = models.IntegerField(default=0)
+    orders  = models.IntegerField(default=0)
+    points  = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["org", "date"], name="metric_rollup_org_date_unique")]
+
 class DataSource(models.Model):
+    PENDING="pending"; PROCESSING="processing"; DONE="done"; FAILED="failed"; CONNECTED="connected"
+    SALES_EVENTS="sales_events"; METRIC_POINTS="metric_points"
+    TARGETS=[(SALES_EVENTS,"Sales events"),(METRIC_POINTS,"Metric points")]
+
+    org  = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=120)
-    file = models.FileField(upload_to="datasources/")
+    type = models.CharField(max_length=20, default="file")  # file, api, db...
+    target = models.CharField(max_length=20, choices=TARGETS, default=SALES_EVENTS)
+    # coluna do arquivo -> campo do modelo destino (vazio = mesmos nomes)
+    column_map = models.JSONField(default=dict, blank=True)
+    file = models.FileField(upload_to="datasources/", blank=True)
+    status = models.CharField(max_length=20, default=PENDING)  # pending|processing|done|failed (connected sem arquivo)
+    rows_processed = models.IntegerField(default=0)
+    rows_loaded    = models.IntegerField(default=0)
+    rows_rejected  = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
 class Report(models.Model):
+    PENDING="pending"; PROCESSING="processing"; DONE="done"; FAILED="failed"
+    CSV="csv"; XLSX="xlsx"; PDF="pdf"
+    FORMATS=[(CSV,"CSV"),(XLSX,"Excel"),(PDF,"PDF")]
+
+    org = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
     title = models.CharField(max_length=200, default="Analytics Report")
-    status = models.CharField(max_length=20, default="pending")  # pending|processing|done|failed
+    format = models.CharField(max_length=10, choices=FORMATS, default=CSV)
+    params = models.JSONField(default=dict, blank=True)  # date_from, date_to, channels
+    # hash de (org, format, params) para deduplicar pedidos idênticos em andamento
+    params_hash = models.CharField(max_length=40, blank=True)
+    status = models.CharField(max_length=20, default=PENDING)  # pending|processing|done|failed
     file = models.FileField(upload_to="reports/", null=True, blank=True)
+    rows = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)  # worker pegou (processing)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["org", "params_hash"],
+                                    condition=models.Q(status__in=["pending", "processing"]),
+                                    name="report_unique_in_flight"),
+        ]
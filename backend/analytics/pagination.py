@@ -0,0 +1,61 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginação por cursor em (occurred_at, id) decrescentes, sem OFFSET.
+
+    Aceita querysets de modelos ou de ``.values()`` (desde que tragam
+    ``occurred_at`` e ``id``). Só há link para a próxima página.
+    """
+    page_size = 100
+    max_page_size = 5000
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, occurred_at, pk):
+        return base64.urlsafe_b64encode(f"{occurred_at.isoformat()}|{pk}".encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            occurred_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(occurred_at), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if cursor := request.query_params.get(self.cursor_query_param):
+            occurred_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(occurred_at__lt=occurred_at) | Q(occurred_at=occurred_at, id__lt=pk))
+
+        rows = list(queryset.order_by("-occurred_at", "-id")[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.last if isinstance(self.last, dict) else vars(self.last)
+        cursor = self.encode_cursor(last["occurred_at"], last["id"])
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
@@ -0,0 +1,147 @@
+# backend/analytics/partitions.py
+"""Particionamento mensal de SalesEvent por ``occurred_at`` (só Postgres).
+
+A tabela vira ``PARTITION BY RANGE (occurred_at)`` com uma partição por mês
+(``analytics_salesevent_pYYYY_MM``) e uma partição default para o que cair fora
+delas. Em outros bancos (SQLite dos testes) tudo aqui é no-op e a tabela fica
+como está. A conversão é explícita (``manage.py sales_partitions --convert``);
+partições futuras são criadas pelo beat (``ensure_sales_partitions``).
+"""
+import re
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import SalesEvent
+
+TABLE = SalesEvent._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_RE = re.compile(rf"^{TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+
+
+def is_partitioned():
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def partitions():
+    """{mês: nome} das partições mensais anexadas (sem a default)."""
+    if not is_partitioned():
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                       "WHERE i.inhparent = to_regclass(%s)", [TABLE])
+        names = [name for (name,) in cursor.fetchall()]
+    return {date(int(m[1]), int(m[2]), 1): name for name in names if (m := PARTITION_RE.match(name))}
+
+
+def _create_partition(cursor, month):
+    """Cria e anexa a partição do mês, movendo antes as linhas que estavam na default."""
+    name, lo, hi = partition_name(month), _bound(month), _bound(add_months(month, 1))
+    cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE occurred_at >= %s AND occurred_at < %s "
+                   f"RETURNING *) INSERT INTO {name} SELECT * FROM moved", [lo, hi])
+    # ATTACH cria na partição os índices do pai
+    cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [lo, hi])
+
+
+def ensure_partitions(months_ahead, first_month=None):
+    """Garante partições de ``first_month`` (padrão: mês atual) até ``months_ahead`` meses à frente."""
+    if not is_partitioned():
+        return []
+    existing = partitions()
+    month = month_start(first_month or timezone.now().date())
+    last = add_months(month_start(timezone.now().date()), months_ahead)
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        while month <= last:
+            if month not in existing:
+                _create_partition(cursor, month)
+                created.append(partition_name(month))
+            month = add_months(month, 1)
+    return created
+
+
+def convert_to_partitioned(months_ahead):
+    """Troca a tabela comum por uma particionada com os mesmos dados (operação de manutenção).
+
+    A PK passa a ser (id, occurred_at), exigência do Postgres para unicidade em
+    tabela particionada; o id continua vindo de uma sequence.
+    """
+    if connection.vendor != "postgresql":
+        raise ValueError("Partitioning requires PostgreSQL")
+    if is_partitioned():
+        return []
+    legacy, seq = f"{TABLE}_legacy", f"{TABLE}_part_id_seq"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s", [TABLE])
+        indexes = cursor.fetchall()
+        cursor.execute(f"SELECT min(occurred_at) FROM {TABLE}")
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {legacy}")
+        # nomes dos índices são globais no schema (inclusive o da PK)
+        for name, _ in indexes:
+            cursor.execute(f"ALTER INDEX {name} RENAME TO {name}_legacy")
+        cursor.execute(f"CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (occurred_at)")
+        cursor.execute(f"CREATE SEQUENCE {seq} OWNED BY {TABLE}.id")
+        cursor.execute(f"SELECT setval('{seq}', coalesce((SELECT max(id) FROM {legacy}), 0) + 1, false)")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{seq}')")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, occurred_at)")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_org_id_fk FOREIGN KEY (org_id) "
+                       "REFERENCES accounts_organization (id) DEFERRABLE INITIALLY DEFERRED")
+        for name, sql in indexes:
+            if name.endswith("_pkey"):
+                continue
+            cursor.execute(re.sub(rf"\bON (\S+\.)?{TABLE}\b", f"ON {TABLE}", sql.replace(" CONCURRENTLY", "")))
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+        month = month_start(oldest) if oldest else month_start(timezone.now().date())
+        created = []
+        while month <= add_months(month_start(timezone.now().date()), months_ahead):
+            cursor.execute(f"CREATE TABLE {partition_name(month)} PARTITION OF {TABLE} "
+                           "FOR VALUES FROM (%s) TO (%s)", [_bound(month), _bound(add_months(month, 1))])
+            created.append(partition_name(month))
+            month = add_months(month, 1)
+
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {legacy}")
+        cursor.execute(f"DROP TABLE {legacy}")
+    return created
+
+
+def expire_partitions(before, action="drop"):
+    """Remove (``drop``) ou desanexa (``detach``) as partições mensais que terminam até ``before``.
+
+    ``detach`` deixa a tabela fora do caminho das consultas para arquivamento/dump.
+    """
+    months = [m for m in partitions() if add_months(m, 1) <= before]
+    with transaction.atomic(), connection.cursor() as cursor:
+        for month in sorted(months):
+            name = partition_name(month)
+            if action == "detach":
+                cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+            else:
+                cursor.execute(f"DROP TABLE {name}")
+    return [partition_name(m) for m in sorted(months)]
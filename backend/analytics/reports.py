@@ -0,0 +1,163 @@
+# backend/analytics/reports.py
+"""Geração de relatórios (CSV/XLSX/PDF) a partir do rollup diário de vendas.
+
+As linhas saem do banco com ``iterator()`` e vão direto para o arquivo; nenhum
+writer guarda o relatório inteiro em memória. XLSX usa o modo write-only do
+openpyxl (opcional); PDF usa um writer mínimo próprio, página a página.
+"""
+import csv
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Report, SalesDailyRollup
+
+COLUMNS = ["day", "product", "region", "channel", "orders", "revenue", "cost", "margin"]
+PARAM_KEYS = ("date_from", "date_to", "channels")
+
+
+def clean_params(params):
+    params = params or {}
+    out = {k: params[k] for k in PARAM_KEYS if params.get(k)}
+    for key in ("date_from", "date_to"):
+        if key in out and parse_date(str(out[key])) is None:
+            raise ValueError(f"{key}: expected YYYY-MM-DD")
+    if "channels" in out:
+        if not isinstance(out["channels"], list):
+            raise ValueError("channels: expected a list")
+        out["channels"] = sorted(map(str, out["channels"]))
+    return out
+
+
+def params_hash(org_id, fmt, params):
+    raw = json.dumps([org_id, fmt, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def expire_stale_reports(**filters):
+    """Relatório em ``processing`` há mais de ANALYTICS_REPORT_TIMEOUT (worker morreu) vira ``failed``.
+
+    Tira o pedido de ``report_unique_in_flight``: o próximo pedido idêntico gera de novo.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.ANALYTICS_REPORT_TIMEOUT)
+    # sem started_at: pego antes da coluna existir
+    stale = Q(started_at__lt=cutoff) | Q(started_at__isnull=True, created_at__lt=cutoff)
+    return Report.objects.filter(stale, status=Report.PROCESSING, **filters).update(
+        status=Report.FAILED, error="Report generation timed out", finished_at=now)
+
+
+def report_rows(org_id, params):
+    """Linhas do relatório; date_from inclusivo, date_to exclusivo (como nos widgets)."""
+    q = SalesDailyRollup.objects.filter(org_id=org_id)
+    if date_from := params.get("date_from"):
+        q = q.filter(day__gte=parse_date(date_from))
+    if date_to := params.get("date_to"):
+        q = q.filter(day__lt=parse_date(date_to))
+    if channels := params.get("channels"):
+        q = q.filter(channel__in=channels)
+    rows = (q.order_by("day", "product", "region", "channel")
+            .values_list("day", "product", "region", "channel", "count", "amount", "cost"))
+    for day, product, region, channel, count, amount, cost in rows.iterator(chunk_size=2000):
+        yield [day.isoformat(), product, region, channel, count, round(amount, 2), round(cost, 2), round(amount - cost, 2)]
+
+
+# ---------- writers: (path, rows, title) -> número de linhas ----------
+
+def write_csv(path, rows, title):
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            n += 1
+    return n
+
+
+def write_xlsx(path, rows, title):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ValueError("XLSX reports require openpyxl (pip install openpyxl)") from None
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title[:31] or "Report")
+    ws.append(COLUMNS)
+    n = 0
+    for row in rows:
+        ws.append(row)
+        n += 1
+    wb.save(path)
+    return n
+
+
+class _PdfWriter:
+    """PDF mínimo: texto em Courier, A4, cada página gravada assim que fica cheia.
+
+    Objetos 1-3 (catalog, pages, font) são escritos no fim, quando a lista de
+    páginas já é conhecida; só os offsets ficam em memória.
+    """
+    LINES_PER_PAGE = 75
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.pages = []
+        self.next_id = 4
+        f.write(b"%PDF-1.4\n")
+
+    def _obj(self, num, body):
+        self.offsets[num] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+
+    def page(self, lines):
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        stream = "\n".join(["BT /F1 8 Tf 10 TL 30 806 Td", *(f"({line}) Tj T*" for line in escaped), "ET"])
+        stream = stream.encode("latin-1", "replace")
+        content, page = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self._obj(content, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        self._obj(page, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content} 0 R "
+                         f"/Resources << /Font << /F1 3 0 R >> >> >>").encode())
+        self.pages.append(page)
+
+    def close(self):
+        kids = " ".join(f"{p} 0 R" for p in self.pages)
+        self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode())
+        self._obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+        xref = self.f.tell()
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id)
+        for num in range(1, self.next_id):
+            self.f.write(b"%010d 00000 n \n" % self.offsets[num])
+        self.f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, xref))
+
+
+def _pdf_line(row):
+    return "{:<10} {:<16.16} {:<8.8} {:<10.10} {:>7} {:>13} {:>13} {:>13}".format(*map(str, row))
+
+
+def write_pdf(path, rows, title):
+    n = 0
+    with open(path, "wb") as f:
+        pdf = _PdfWriter(f)
+        header = [title, "", _pdf_line(COLUMNS)]
+        lines = list(header)
+        for row in rows:
+            lines.append(_pdf_line(row))
+            n += 1
+            if len(lines) == _PdfWriter.LINES_PER_PAGE:
+                pdf.page(lines)
+                lines = list(header)
+        if len(lines) > len(header) or not pdf.pages:
+            pdf.page(lines)
+        pdf.close()
+    return n
+
+
+WRITERS = {Report.CSV: write_csv, Report.XLSX: write_xlsx, Report.PDF: write_pdf}
@@ -0,0 +1,63 @@
+# backend/analytics/retention.py
+"""Retenção de SalesEvent por organização.
+
+``Organization.sales_retention_days`` define quantos dias de eventos brutos
+ficam no banco. Antes de apagar, os rollups diários do período são
+recalculados; depois disso eles são a única fonte daqueles dias (e
+``sales_retained_from`` impede que um rebuild os apague). Com a tabela
+particionada (Postgres), meses inteiros vencidos para todas as orgs saem com
+DROP/DETACH da partição; o resto sai por DELETE sem signals por linha.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Organization
+from . import cache as analytics_cache
+from .archive import expire_archives
+from .models import SalesEvent
+from .partitions import expire_partitions, is_partitioned
+from .rollups import bump_sales_watermark, rebuild_sales_rollups
+
+
+def retention_cutoffs(today=None):
+    """{org: primeiro dia mantido} das orgs com política de retenção."""
+    today = today or timezone.localdate()
+    orgs = Organization.objects.filter(sales_retention_days__isnull=False)
+    return {org: today - timedelta(days=org.sales_retention_days) for org in orgs}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def apply_retention(today=None, action=None):
+    action = action or settings.ANALYTICS_RETENTION_ACTION
+    cutoffs = retention_cutoffs(today)
+    summary = {"orgs": {}, "partitions": []}
+    if not cutoffs:
+        return summary
+
+    # 1) rollups dos dias que vão sair, ainda a partir dos eventos brutos
+    for org, cutoff in cutoffs.items():
+        if org.sales_retained_from is None or org.sales_retained_from < cutoff:
+            rebuild_sales_rollups(org=org, day_from=org.sales_retained_from, day_to=cutoff - timedelta(days=1))
+
+    # 2) partições inteiras só quando nenhuma org com eventos mantém tudo
+    keeps_all = SalesEvent.objects.filter(org__sales_retention_days__isnull=True).exists()
+    if is_partitioned() and not keeps_all:
+        summary["partitions"] = expire_partitions(min(cutoffs.values()), action)
+
+    # 3) o resto por org (_raw_delete: sem signals, os rollups não são decrementados)
+    for org, cutoff in cutoffs.items():
+        with transaction.atomic():
+            deleted = SalesEvent.objects.filter(org=org, occurred_at__lt=_day_start(cutoff))._raw_delete(SalesEvent.objects.db)
+            if org.sales_retained_from is None or org.sales_retained_from < cutoff:
+                Organization.objects.filter(id=org.id).update(sales_retained_from=cutoff)
+            if deleted:
+                bump_sales_watermark(org.id, 1)
+        summary["orgs"][org.slug] = deleted + expire_archives(org.id, cutoff)
+    analytics_cache.bump_data_version(analytics_cache.SALES)
+    return summary
@@ -0,0 +1,367 @@
+# backend/analytics/rollups.py
+"""Rollups diários de SalesEvent e MetricPoint.
+
+Os rollups são mantidos incrementalmente (signals + chamadas explícitas nos
+caminhos de bulk) e podem ser reconstruídos a partir dos dados brutos com
+``manage.py build_rollups``. Cada bucket de vendas também guarda sketches
+(``analytics.sketches``) de clientes únicos e da distribuição de amount.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Max, Min, Q, Sum, When
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Ceil, Coalesce, Greatest, Ln, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from accounts.models import Organization
+from . import cache as analytics_cache
+from .archive import cold_day_rows, cold_day_sketch_parts
+from .models import MetricDailyRollup, MetricPoint, SalesArchive, SalesDailyRollup, SalesEvent
+from .partitions import add_months
+from .sketches import DDSKETCH_MIN_VALUE, DDSketch, HyperLogLog
+
+REBUILD_BATCH_SIZE = 2000
+REBUILD_DAYS = 7
+SALES_BUCKET = ("org_id", "day", "product", "region", "channel")
+
+
+def rollups_enabled():
+    return getattr(settings, "ANALYTICS_USE_ROLLUPS", True)
+
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        value = parse_datetime(value) or datetime.combine(parse_date(value), time.min)
+    return value
+
+
+def event_day(occurred_at):
+    """Dia (no TIME_ZONE corrente) em que o evento cai."""
+    occurred_at = _as_datetime(occurred_at)
+    if timezone.is_aware(occurred_at):
+        occurred_at = timezone.localtime(occurred_at)
+    return occurred_at.date()
+
+
+def day_boundary(value):
+    """Converte um limite de filtro em ``date`` quando ele cai na virada do dia.
+
+    Retorna None se o limite tiver hora (aí só os dados brutos respondem).
+    """
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, date):
+        return value
+    else:
+        day = parse_date(str(value))
+        if day is not None:
+            return day
+        dt = parse_datetime(str(value))
+        if dt is None:
+            return None
+    if timezone.is_aware(dt):
+        dt = timezone.localtime(dt)
+    return dt.date() if dt.time() == time.min else None
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _increment(model, key, **deltas):
+    # soma em Python sobre a linha travada: sketch não tem aritmética no banco
+    with transaction.atomic():
+        row = model.objects.select_for_update().filter(**key).first()
+        if row is None:
+            try:
+                with transaction.atomic():
+                    model.objects.create(**key, **deltas)
+                return
+            except IntegrityError:
+                # outro worker criou o bucket entre o select e o create
+                row = model.objects.select_for_update().get(**key)
+        for field, value in deltas.items():
+            setattr(row, field, getattr(row, field) + value)
+        row.save(update_fields=list(deltas))
+
+
+def _apply_deltas(model, scope, key_fields, deltas):
+    """Aplica vários deltas de uma vez: um SELECT no escopo e dois INSERTs em lote.
+
+    ``scope`` é um filtro que cobre todos os buckets de ``deltas`` (pode trazer linhas
+    a mais; elas são ignoradas). Buckets criados por outro worker no meio do caminho
+    caem no caminho linha a linha.
+    """
+    value_fields = list(next(iter(deltas.values())))
+    with transaction.atomic():
+        rows = model.objects.select_for_update().filter(**scope)
+        pending = dict(deltas)
+        changed = []
+        for row in rows:
+            if (delta := pending.pop(tuple(getattr(row, f) for f in key_fields), None)) is not None:
+                for field, value in delta.items():
+                    setattr(row, field, getattr(row, field) + value)
+                changed.append(row)
+        # linhas já travadas: um upsert com os valores finais sai mais barato que bulk_update (CASE WHEN)
+        model.objects.bulk_create(changed, update_conflicts=True,
+                                  unique_fields=key_fields, update_fields=value_fields)
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([model(**dict(zip(key_fields, key)), **delta) for key, delta in pending.items()])
+        except IntegrityError:
+            for key, delta in pending.items():
+                _increment(model, dict(zip(key_fields, key)), **delta)
+
+
+# ---------- incremental ----------
+
+def bump_sales_watermark(org_id, changes, last_id=None):
+    """Conta ``changes`` mudanças em SalesEvent da org (e sobe o maior id): a marca d'água dos widgets.
+
+    Na mesma transação da escrita; evento inserido soma 1, removido/alterado também
+    (aí a contagem não fecha com os ids novos e o widget recalcula tudo).
+    """
+    fields = {"sales_changes": F("sales_changes") + changes}
+    if last_id:
+        fields["sales_last_event_id"] = Greatest("sales_last_event_id", Value(last_id))
+    Organization.objects.filter(id=org_id).update(**fields)
+
+
+def _bump_watermarks(events, sign):
+    marks = {}
+    for e in events:
+        changes, last_id = marks.get(e.org_id, (0, 0))
+        # COPY não devolve ids: None vira a busca pelo maior id abaixo
+        marks[e.org_id] = (changes + 1, None if e.pk is None or last_id is None else max(last_id, e.pk))
+    for org_id, (changes, last_id) in sorted(marks.items()):
+        if sign > 0 and last_id is None:
+            last_id = SalesEvent.objects.filter(org_id=org_id).order_by("-id").values_list("id", flat=True).first()
+        bump_sales_watermark(org_id, changes, last_id if sign > 0 else None)
+
+
+def apply_sales_events(events, sign=1):
+    """Soma (sign=1) ou subtrai (sign=-1) eventos dos buckets diários (e conta as mudanças da org)."""
+    _bump_watermarks(events, sign)
+    deltas = {}
+    for e in events:
+        key = (e.org_id, event_day(e.occurred_at), e.product, e.region or "", e.channel or "")
+        if (bucket := deltas.get(key)) is None:
+            bucket = deltas[key] = {"amount": 0.0, "cost": 0.0, "count": 0,
+                                    "customers": HyperLogLog(), "amounts": DDSketch()}
+        bucket["amount"] += sign * float(e.amount)
+        bucket["cost"] += sign * float(e.cost or 0)
+        bucket["count"] += sign
+        # HyperLogLog não subtrai: cliente de evento removido só sai no rebuild
+        if sign > 0 and e.customer:
+            bucket["customers"].add(e.customer)
+        bucket["amounts"].add(float(e.amount), sign)
+    if not deltas:
+        return 0
+    if len(deltas) == 1:
+        key, delta = next(iter(deltas.items()))
+        _increment(SalesDailyRollup, dict(zip(SALES_BUCKET, key)), **delta)
+        return 1
+    days = [key[1] for key in deltas]
+    _apply_deltas(SalesDailyRollup,
+                  {"org_id__in": {key[0] for key in deltas}, "day__gte": min(days), "day__lte": max(days)},
+                  SALES_BUCKET, deltas)
+    return len(deltas)
+
+
+def apply_metric_points(points, sign=1):
+    deltas = defaultdict(lambda: [Decimal(0), 0, 0, 0])
+    for p in points:
+        bucket = deltas[(p.org_id, parse_date(p.date) if isinstance(p.date, str) else p.date)]
+        bucket[0] += sign * Decimal(str(p.revenue))
+        bucket[1] += sign * int(p.users)
+        bucket[2] += sign * int(p.orders)
+        bucket[3] += sign
+    if not deltas:
+        return 0
+    _apply_deltas(MetricDailyRollup,
+                  {"org_id__in": {key[0] for key in deltas}, "date__in": {key[1] for key in deltas}},
+                  ("org_id", "date"),
+                  {key: {"revenue": r, "users": u, "orders": o, "points": n} for key, (r, u, o, n) in deltas.items()})
+    return len(deltas)
+
+
+# ---------- rebuild ----------
+
+def _bulk_insert(model, rows):
+    rows = iter(rows)
+    total = 0
+    while batch := list(islice(rows, REBUILD_BATCH_SIZE)):
+        model.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def sales_sketch_parts(events):
+    """Partes dos sketches por bucket, agregadas no banco: (clientes distintos, bins do DDSketch).
+
+    Uma linha por (bucket, cliente) e por (bucket, bin) em vez de uma por evento; o
+    bin é a mesma conta de ``DDSketch.add``. Só usa nomes de campo (serve para o
+    modelo histórico das migrations).
+    """
+    q = events.annotate(day=TruncDate("occurred_at"))
+    log_gamma = DDSketch().log_gamma
+    positive, negative = Q(amount__gt=DDSKETCH_MIN_VALUE), Q(amount__lt=-DDSKETCH_MIN_VALUE)
+    customers = q.exclude(customer="").values(*SALES_BUCKET, "customer").distinct().order_by()
+    bins = (q.annotate(sign=Case(When(positive, then=1), When(negative, then=-1), default=0, output_field=IntegerField()),
+                       bin=Case(When(positive, then=Ceil(Ln("amount") / log_gamma)),
+                                When(negative, then=Ceil(Ln(-F("amount")) / log_gamma)),
+                                default=0, output_field=FloatField()))
+            .values(*SALES_BUCKET, "sign", "bin").annotate(count=Count("id")).order_by())
+    return customers, bins
+
+
+def add_sketch_parts(buckets, customers, bins, key, new):
+    """Soma as partes de ``sales_sketch_parts``/``cold_day_sketch_parts`` em ``buckets[key(row)]``."""
+    for r in customers:
+        bucket = buckets.get(k := key(r)) or buckets.setdefault(k, new())
+        bucket["customers"].add(r["customer"])
+    for r in bins:
+        bucket = buckets.get(k := key(r)) or buckets.setdefault(k, new())
+        bucket["amounts"].add_key(r["sign"], int(r["bin"]), r["count"])
+
+
+def _empty_bucket():
+    return {"amount": 0.0, "cost": 0.0, "count": 0, "customers": HyperLogLog(), "amounts": DDSketch()}
+
+
+def _bucket_key(row):
+    return tuple(row[f] for f in SALES_BUCKET)
+
+
+def _window_buckets(events, archived, retained, first, last):
+    """Buckets completos dos dias ``first``..``last``: banco (somas e partes agregadas no SQL) + Parquet."""
+    since, until = _day_start(first), _day_start(last + timedelta(days=1))
+    events = events.filter(occurred_at__gte=since, occurred_at__lt=until)
+    buckets = {}
+    for row in (events.annotate(day=TruncDate("occurred_at")).values(*SALES_BUCKET)
+                .annotate(amount=Sum("amount"), cost=Sum("cost"), count=Count("id")).order_by()):
+        bucket = buckets[_bucket_key(row)] = _empty_bucket()
+        _add_sums(bucket, row)
+    add_sketch_parts(buckets, *sales_sketch_parts(events), _bucket_key, _empty_bucket)
+
+    # meses arquivados: os eventos não estão mais no banco; dia local na virada do mês UTC tem as duas partes
+    log_gamma = DDSketch().log_gamma
+    for org_id in archived:
+        def kept(rows, kept_from=retained.get(org_id)):
+            return [{**r, "org_id": org_id} for r in rows if kept_from is None or r["day"] >= kept_from]
+        for row in kept(cold_day_rows(org_id, since, until)):
+            _add_sums(buckets.get(_bucket_key(row)) or buckets.setdefault(_bucket_key(row), _empty_bucket()), row)
+        customers, bins = cold_day_sketch_parts(org_id, log_gamma, since, until)
+        add_sketch_parts(buckets, kept(customers), kept(bins), _bucket_key, _empty_bucket)
+    return buckets
+
+
+def _add_sums(bucket, row):
+    for field in ("amount", "cost", "count"):
+        bucket[field] += row[field]
+
+
+def _day_span(events, archived, day_from, day_to):
+    """Primeiro e último dia com dados (banco ou Parquet) dentro de ``day_from``..``day_to``."""
+    span = events.aggregate(lo=Min("occurred_at"), hi=Max("occurred_at"))
+    days = [event_day(v) for v in span.values() if v is not None]
+    months = archived.aggregate(lo=Min("month"), hi=Max("month"))
+    if months["lo"] is not None:
+        # mês UTC: o dia local pode cair um dia antes/depois
+        days += [months["lo"] - timedelta(days=1), add_months(months["hi"], 1)]
+    if not days:
+        return None
+    return max(filter(None, [min(days), day_from])), min(filter(None, [max(days), day_to]))
+
+
+def rebuild_sales_rollups(org=None, day_from=None, day_to=None):
+    """Recalcula os buckets de SalesEvent (intervalo de dias inclusivo) do banco e dos meses arquivados.
+
+    Vai em janelas de ``REBUILD_DAYS`` dias: a memória fica limitada aos buckets
+    (e sketches) de uma janela.
+    """
+    events = SalesEvent.objects.all()
+    rollups = SalesDailyRollup.objects.all()
+    if org is not None:
+        events, rollups = events.filter(org=org), rollups.filter(org=org)
+    if day_from:
+        events = events.filter(occurred_at__gte=_day_start(day_from))
+        rollups = rollups.filter(day__gte=day_from)
+    if day_to:
+        events = events.filter(occurred_at__lt=_day_start(day_to + timedelta(days=1)))
+        rollups = rollups.filter(day__lte=day_to)
+    # dias já expurgados pela retenção: o rollup é a única fonte, fica como está
+    retained = Organization.objects.filter(sales_retained_from__isnull=False)
+    archived = SalesArchive.objects.exclude(file="")
+    if org is not None:
+        retained = retained.filter(id=getattr(org, "id", org))
+        archived = archived.filter(org=org)
+    retained = dict(retained.values_list("id", "sales_retained_from"))
+    for org_id, retained_from in retained.items():
+        events = events.exclude(org_id=org_id, occurred_at__lt=_day_start(retained_from))
+        rollups = rollups.exclude(org_id=org_id, day__lt=retained_from)
+
+    n = 0
+    with transaction.atomic():
+        # eventos gravados sem passar pelos rollups (bulk_create) entram agora: widgets recalculam
+        orgs = Organization.objects.filter(id=getattr(org, "id", org)) if org is not None else Organization.objects
+        last_ids = SalesEvent.objects.filter(org=OuterRef("pk")).order_by("-id").values("id")[:1]
+        orgs.update(sales_changes=F("sales_changes") + 1,
+                    sales_last_event_id=Greatest("sales_last_event_id", Coalesce(Subquery(last_ids), 0)))
+        rollups.delete()
+        if span := _day_span(events, archived, day_from, day_to):
+            archived_orgs = set(archived.values_list("org_id", flat=True))
+            first, last = span
+            while first <= last:
+                window_last = min(first + timedelta(days=REBUILD_DAYS - 1), last)
+                buckets = _window_buckets(events, archived_orgs, retained, first, window_last)
+                n += _bulk_insert(SalesDailyRollup, (SalesDailyRollup(**dict(zip(SALES_BUCKET, key)), **totals)
+                                                     for key, totals in buckets.items()))
+                first = window_last + timedelta(days=1)
+    analytics_cache.bump_data_version(analytics_cache.SALES)
+    return n
+
+
+def rebuild_metric_rollups(org=None, date_from=None, date_to=None):
+    points = MetricPoint.objects.all()
+    rollups = MetricDailyRollup.objects.all()
+    if org is not None:
+        points, rollups = points.filter(org=org), rollups.filter(org=org)
+    if date_from:
+        points, rollups = points.filter(date__gte=date_from), rollups.filter(date__gte=date_from)
+    if date_to:
+        points, rollups = points.filter(date__lte=date_to), rollups.filter(date__lte=date_to)
+
+    grouped = (points.values("org_id", "date")
+               .annotate(revenue=Sum("revenue"), users=Sum("users"), orders=Sum("orders"), points=Count("id"))
+               .order_by())
+    with transaction.atomic():
+        rollups.delete()
+        n = _bulk_insert(MetricDailyRollup, (MetricDailyRollup(**row) for row in grouped.iterator()))
+    analytics_cache.bump_data_version(analytics_cache.METRICS)
+    return n
+
+
+# ---------- leitura ----------
+
+def sales_rollup_queryset(org, cfg):
+    """Rollup equivalente aos filtros de um widget, ou None se a granularidade não permitir."""
+    if not rollups_enabled():
+        return None
+    q = SalesDailyRollup.objects.filter(org=org)
+    for key, lookup in (("date_from", "day__gte"), ("date_to", "day__lt")):
+        if value := cfg.get(key):
+            day = day_boundary(value)
+            if day is None:
+                return None
+            q = q.filter(**{lookup: day})
+    for key, lookup in (("channels", "channel__in"), ("products", "product__in"), ("regions", "region__in")):
+        if values := cfg.get(key):
+            q = q.filter(**{lookup: values})
+    return q
@@ -1,3 +1,5 @@
+from importlib.util import find_spec
+
 from rest_framework import serializers
 from .models import SalesEvent
 from datetime import date
@@ -7,12 +9,14 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from .models import MetricPoint
 from .models import DataSource, Report
+from .imports import REQUIRES, file_format
+from .reports import clean_params
 
 
 class SalesEventSerializer(serializers.ModelSerializer):
     class Meta:
         model  = SalesEvent
-        fields = ["id","occurred_at","amount","cost","product","region","channel","created_at"]
+        fields = ["id","occurred_at","amount","cost","product","region","channel","customer","created_at"]
 
 # backend/analytics/serializers.py
 from rest_framework import serializers
@@ -86,9 +90,40 @@ class DistributionView(APIView):
 class DataSourceSerializer(serializers.ModelSerializer):
     class Meta:
         model = DataSource
-        fields = ["id", "name", "file", "created_at"]
+        fields = ["id", "name", "type", "target", "column_map", "file", "status",
+                  "rows_processed", "rows_loaded", "rows_rejected", "error", "created_at", "updated_at"]
+        read_only_fields = ["status", "rows_processed", "rows_loaded", "rows_rejected", "error"]
+
+    def validate_file(self, value):
+        if value:
+            try:
+                fmt = file_format(value.name)
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
+            if (module := REQUIRES.get(fmt)) and find_spec(module) is None:
+                raise serializers.ValidationError(f"{fmt.capitalize()} import requires {module} (pip install {module})")
+        return value
 
 class ReportSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
     class Meta:
         model = Report
-        fields = ["id", "title", "status", "file", "created_at"]
+        fields = ["id", "title", "format", "params", "status", "file", "url", "rows", "error",
+                  "created_at", "started_at", "finished_at"]
+        read_only_fields = ["status", "file", "rows", "error", "started_at", "finished_at"]
+
+    def get_url(self, obj):
+        return obj.file.url if obj.file else None
+
+    def validate_format(self, value):
+        # sem openpyxl o XLSX só falharia no worker, com o Report já criado e deduplicando os próximos
+        if value == Report.XLSX and find_spec("openpyxl") is None:
+            raise serializers.ValidationError("XLSX reports require openpyxl (pip install openpyxl)")
+        return value
+
+    def validate_params(self, value):
+        try:
+            return clean_params(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
@@ -0,0 +1,42 @@
+# backend/analytics/signals.py
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache as analytics_cache
+from .models import MetricPoint, SalesEvent
+from .rollups import apply_metric_points, apply_sales_events
+
+
+# updates precisam tirar o valor antigo do bucket antes de somar o novo
+@receiver(pre_save, sender=SalesEvent)
+@receiver(pre_save, sender=MetricPoint)
+def remember_previous_row(sender, instance, **kwargs):
+    instance._rollup_previous = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+
+
+@receiver(post_save, sender=SalesEvent)
+def rollup_saved_event(sender, instance, **kwargs):
+    if previous := getattr(instance, "_rollup_previous", None):
+        apply_sales_events([previous], sign=-1)
+    apply_sales_events([instance])
+    analytics_cache.bump_data_version(analytics_cache.SALES)
+
+
+@receiver(post_delete, sender=SalesEvent)
+def rollup_deleted_event(sender, instance, **kwargs):
+    apply_sales_events([instance], sign=-1)
+    analytics_cache.bump_data_version(analytics_cache.SALES)
+
+
+@receiver(post_save, sender=MetricPoint)
+def rollup_saved_point(sender, instance, **kwargs):
+    if previous := getattr(instance, "_rollup_previous", None):
+        apply_metric_points([previous], sign=-1)
+    apply_metric_points([instance])
+    analytics_cache.bump_data_version(analytics_cache.METRICS)
+
+
+@receiver(post_delete, sender=MetricPoint)
+def rollup_deleted_point(sender, instance, **kwargs):
+    apply_metric_points([instance], sign=-1)
+    analytics_cache.bump_data_version(analytics_cache.METRICS)
@@ -0,0 +1,266 @@
+# backend/analytics/sketches.py
+"""Sketches mergeáveis guardados em cada bucket do rollup diário.
+
+``HyperLogLog`` estima contagens distintas (clientes únicos) com ``2**p``
+registradores (erro ~1.04/sqrt(2**p)); ``DDSketch`` estima percentis com erro
+relativo ``alpha`` em bins logarítmicos. Os dois ocupam memória limitada e o
+merge (``+``/``+=``) é constante no tamanho do sketch, então buckets de dias,
+regiões ou canais diferentes se somam sem voltar aos eventos. Precisão padrão em
+``ANALYTICS_HLL_PRECISION``/``ANALYTICS_DDSKETCH_ACCURACY``; mudar exige
+``build_rollups`` para regravar os sketches antigos.
+
+HyperLogLog não desfaz: evento removido/alterado só sai da estimativa no
+próximo rebuild. DDSketch aceita contagem negativa (o delta de uma remoção) e
+acompanha remoções.
+"""
+import hashlib
+import math
+import struct
+
+from django.conf import settings
+from django.db import models
+
+HLL_MIN_PRECISION, HLL_MAX_PRECISION = 4, 16
+DDSKETCH_MAX_BINS = 2048
+DDSKETCH_MIN_VALUE = 1e-9  # |valor| abaixo disso cai no bin do zero
+
+
+class HyperLogLog:
+    __slots__ = ("p", "registers")
+
+    def __init__(self, p=None):
+        p = settings.ANALYTICS_HLL_PRECISION if p is None else p
+        if not HLL_MIN_PRECISION <= p <= HLL_MAX_PRECISION:
+            raise ValueError(f"HyperLogLog precision must be between {HLL_MIN_PRECISION} and {HLL_MAX_PRECISION}")
+        self.p = p
+        self.registers = {}  # índice -> posto; registrador zerado não ocupa espaço
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+        rest = 64 - self.p
+        index, rank = h >> rest, rest - (h & ((1 << rest) - 1)).bit_length() + 1
+        if rank > self.registers.get(index, 0):
+            self.registers[index] = rank
+
+    def reduced(self, p):
+        """Mesmo conjunto com precisão menor (necessário para somar sketches de precisões diferentes)."""
+        if p >= self.p:
+            return self.copy()
+        out, shift = HyperLogLog(p), self.p - p
+        for index, rank in self.registers.items():
+            dropped = index & ((1 << shift) - 1)
+            rank = shift - dropped.bit_length() + 1 if dropped else rank + shift
+            if rank > out.registers.get(index >> shift, 0):
+                out.registers[index >> shift] = rank
+        return out
+
+    def copy(self):
+        out = HyperLogLog(self.p)
+        out.registers = dict(self.registers)
+        return out
+
+    def __iadd__(self, other):
+        if other.p < self.p:
+            reduced = self.reduced(other.p)
+            self.p, self.registers = reduced.p, reduced.registers
+        elif other.p > self.p:
+            other = other.reduced(self.p)
+        registers = self.registers
+        for index, rank in other.registers.items():
+            if rank > registers.get(index, 0):
+                registers[index] = rank
+        return self
+
+    def __add__(self, other):
+        out = self.copy()
+        out += other
+        return out
+
+    def estimate(self):
+        m = 1 << self.p
+        zeros = m - len(self.registers)
+        z = zeros + sum(2.0 ** -rank for rank in self.registers.values())
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m) or 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / z
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting na faixa baixa
+        return round(estimate)
+
+    def to_bytes(self):
+        # esparso (3 bytes por registrador ocupado) enquanto for menor que o denso
+        if len(self.registers) * 3 < 1 << self.p:
+            items = sorted(self.registers.items())
+            return b"HS" + bytes([self.p]) + b"".join(struct.pack(">HB", i, r) for i, r in items)
+        dense = bytearray(1 << self.p)
+        for index, rank in self.registers.items():
+            dense[index] = rank
+        return b"HD" + bytes([self.p]) + bytes(dense)
+
+    @classmethod
+    def from_bytes(cls, raw):
+        if not raw:
+            return cls()
+        raw = bytes(raw)
+        out = cls(raw[2])
+        if raw[:2] == b"HS":
+            out.registers = {i: r for i, r in struct.iter_unpack(">HB", raw[3:])}
+        elif raw[:2] == b"HD":
+            out.registers = {i: r for i, r in enumerate(raw[3:]) if r}
+        else:
+            raise ValueError("not a HyperLogLog sketch")
+        return out
+
+
+class DDSketch:
+    __slots__ = ("alpha", "gamma", "log_gamma", "positive", "negative", "zero")
+
+    def __init__(self, alpha=None):
+        alpha = settings.ANALYTICS_DDSKETCH_ACCURACY if alpha is None else alpha
+        if not 0 < alpha < 1:
+            raise ValueError("DDSketch relative accuracy must be between 0 and 1")
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.positive, self.negative = {}, {}  # chave do bin -> contagem
+        self.zero = 0
+
+    @property
+    def count(self):
+        return self.zero + sum(self.positive.values()) + sum(self.negative.values())
+
+    def _key(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value, count=1):
+        """Soma ``count`` ocorrências de ``value`` (negativo = remove)."""
+        if value > DDSKETCH_MIN_VALUE:
+            self._bump(self.positive, self._key(value), count)
+        elif value < -DDSKETCH_MIN_VALUE:
+            self._bump(self.negative, self._key(-value), count)
+        else:
+            self.zero += count
+
+    def add_key(self, sign, key, count):
+        """Soma ``count`` ao bin ``key`` já calculado (fora daqui, ex. agrupado no banco); sign 0 = bin do zero."""
+        if sign > 0:
+            self._bump(self.positive, key, count)
+        elif sign < 0:
+            self._bump(self.negative, key, count)
+        else:
+            self.zero += count
+
+    @staticmethod
+    def _bump(bins, key, count):
+        total = bins.get(key, 0) + count
+        if total:
+            bins[key] = total
+            if len(bins) > DDSKETCH_MAX_BINS:
+                DDSketch._collapse(bins)
+        else:
+            bins.pop(key, None)
+
+    @staticmethod
+    def _collapse(bins):
+        # memória limitada: os bins de menor magnitude viram um só (perde precisão só na cauda baixa)
+        keys = sorted(bins)
+        excess = keys[:len(keys) - DDSKETCH_MAX_BINS + 1]
+        bins[excess[-1]] = sum(bins.pop(k) for k in excess)
+
+    def copy(self):
+        out = DDSketch(self.alpha)
+        out.positive, out.negative, out.zero = dict(self.positive), dict(self.negative), self.zero
+        return out
+
+    def __iadd__(self, other):
+        if abs(other.gamma - self.gamma) > 1e-12:
+            # precisões diferentes (mudança de setting antes do rebuild): re-bina pelo valor representativo
+            for bins, sign in ((other.positive, 1), (other.negative, -1)):
+                for key, count in bins.items():
+                    self.add(sign * other._value(key), count)
+            self.zero += other.zero
+            return self
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in theirs.items():
+                self._bump(mine, key, count)
+        self.zero += other.zero
+        return self
+
+    def __add__(self, other):
+        out = self.copy()
+        out += other
+        return out
+
+    def quantile(self, q):
+        """Valor no quantil ``q`` (0..1) com erro relativo ``alpha``; None sem dados."""
+        total = self.count
+        if total <= 0:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def to_bytes(self):
+        parts = [b"DD", struct.pack("<dqII", self.alpha, self.zero, len(self.positive), len(self.negative))]
+        for bins in (self.positive, self.negative):
+            keys = sorted(bins)
+            parts.append(struct.pack(f"<{len(keys)}i{len(keys)}q", *keys, *(bins[k] for k in keys)))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, raw):
+        if not raw:
+            return cls()
+        raw = bytes(raw)
+        if raw[:2] != b"DD":
+            raise ValueError("not a DDSketch")
+        alpha, zero, n_pos, n_neg = struct.unpack_from("<dqII", raw, 2)
+        out, offset = cls(alpha), 2 + struct.calcsize("<dqII")
+        out.zero = zero
+        for bins, n in ((out.positive, n_pos), (out.negative, n_neg)):
+            values = struct.unpack_from(f"<{n}i{n}q", raw, offset)
+            bins.update(zip(values[:n], values[n:]))
+            offset += 12 * n
+        return out
+
+
+KINDS = {"hll": HyperLogLog, "ddsketch": DDSketch}
+
+
+class SketchField(models.BinaryField):
+    """Coluna binária lida/gravada como sketch (``sketch="hll"|"ddsketch"``); NULL vira sketch vazio."""
+
+    def __init__(self, *args, sketch="hll", **kwargs):
+        self.sketch = sketch
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["sketch"] = self.sketch
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        return KINDS[self.sketch].from_bytes(value)
+
+    def to_python(self, value):
+        if isinstance(value, tuple(KINDS.values())) or value is None:
+            return value
+        return KINDS[self.sketch].from_bytes(super().to_python(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, tuple(KINDS.values())):
+            value = value.to_bytes()
+        return super().get_db_prep_value(value, connection, prepared)
@@ -0,0 +1,176 @@
+# backend/analytics/synthetic.py
+"""Gerador vetorizado (NumPy) de dados sintéticos para testes de carga.
+
+Os eventos saem em colunas por blocos de ``CHUNK_ROWS`` linhas: dia com
+tendência/sazonalidade anual/semanal, hora com pico diurno, produto com
+popularidade Zipf, região condicionada ao produto, valor lognormal (cauda
+longa) com preço mediano por produto, cliente com recompra de cauda longa
+(Pareto) numa base de ``CUSTOMERS`` por org. Cada bloco tem o próprio RNG derivado de
+``(seed, org_index, bloco)``: o resultado é o mesmo com qualquer número de
+workers. No Postgres os blocos vão por ``COPY`` (em paralelo com ``workers``);
+nos outros bancos por ``executemany``.
+"""
+import datetime as dt
+import io
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .ingest import COPY_COLUMNS
+from .models import MetricPoint, SalesEvent
+from .rollups import rebuild_metric_rollups, rebuild_sales_rollups
+
+PRODUCTS = ["Alpha", "Beta", "Gamma", "Delta", "Omega"]
+REGIONS = ["NA", "EU", "LATAM", "APAC"]
+CHANNELS = ["web", "retail", "partner"]
+CUSTOMERS = 1_000_000
+CHUNK_ROWS = 100_000
+BULK_BATCH_SIZE = 5000
+
+# peso de cada hora do dia (UTC): madrugada fraca, pico no começo da tarde
+HOUR_WEIGHTS = 0.15 + np.exp(-(((np.arange(24) - 14) / 4.5) ** 2))
+# segunda..domingo
+WEEKDAY_WEIGHTS = np.array([1.0, 1.0, 1.05, 1.1, 1.3, 1.45, 0.85])
+
+
+def profile(seed, org_index=0):
+    """Distribuições fixas de uma org (as mesmas em todos os blocos)."""
+    rng = np.random.default_rng([seed, org_index])
+    popularity = 1 / np.arange(1, len(PRODUCTS) + 1) ** 1.1
+    return {
+        "products": rng.permutation(popularity) / popularity.sum(),
+        # P(região | produto): uma linha de Dirichlet por produto
+        "regions": rng.dirichlet(np.full(len(REGIONS), 2.0), size=len(PRODUCTS)).cumsum(axis=1),
+        "channels": rng.dirichlet(np.full(len(CHANNELS), 4.0)),
+        "prices": rng.lognormal(np.log(120), 0.8, size=len(PRODUCTS)),
+    }
+
+
+def day_weights(start, days):
+    """Peso de cada dia de ``start``: crescimento, pico de fim de ano e fim de semana."""
+    dates = np.datetime64(start.date(), "D") + np.arange(days)
+    weekday = (dates.astype("int64") + 3) % 7  # 1970-01-01 foi quinta
+    doy = (dates - dates.astype("datetime64[Y]")).astype("int64")
+    weights = np.linspace(1.0, 1.3, days) * (1 + 0.25 * np.cos(2 * np.pi * (doy - 350) / 365.25))
+    return weights * WEEKDAY_WEIGHTS[weekday]
+
+
+def event_columns(rows, start, days, prof, rng):
+    """Colunas de ``rows`` eventos: occurred_at (datetime64[s], UTC), amount, cost e índices de categoria/cliente."""
+    weights = day_weights(start, days)
+    day = rng.choice(days, size=rows, p=weights / weights.sum())
+    hour = rng.choice(24, size=rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    seconds = day * 86400 + hour * 3600 + rng.integers(0, 3600, size=rows)
+    product = rng.choice(len(PRODUCTS), size=rows, p=prof["products"])
+    region = (rng.random(rows)[:, None] > prof["regions"][product]).sum(axis=1).clip(max=len(REGIONS) - 1)
+    amount = np.maximum(prof["prices"][product] * rng.lognormal(0, 0.9, size=rows), 1.0).round(2)
+    return {
+        "occurred_at": np.datetime64(start.astimezone(dt.timezone.utc).replace(tzinfo=None), "s") + seconds,
+        "amount": amount,
+        "cost": (amount * rng.uniform(0.2, 0.7, size=rows)).round(2),
+        "product": product,
+        "region": region,
+        "channel": rng.choice(len(CHANNELS), size=rows, p=prof["channels"]),
+        # sorteado por último: as outras colunas não mudam com a mesma semente
+        "customer": (rng.pareto(1.2, size=rows) * 1000).astype(np.int64) % CUSTOMERS,
+    }
+
+
+def _frame(org_id, cols):
+    return pd.DataFrame({
+        "org_id": org_id,
+        "occurred_at": pd.to_datetime(cols["occurred_at"], utc=True),
+        "amount": cols["amount"],
+        "cost": cols["cost"],
+        "product": np.array(PRODUCTS)[cols["product"]],
+        "region": np.array(REGIONS)[cols["region"]],
+        "channel": np.array(CHANNELS)[cols["channel"]],
+        "customer": np.char.add("c", cols["customer"].astype(str)),
+    })
+
+
+def write_columns(org_id, cols):
+    """Grava um bloco sem signals nem rollups (o chamador reconstrói os rollups no fim)."""
+    frame = _frame(org_id, cols)
+    if connection.vendor == "postgresql":
+        frame["created_at"] = pd.Timestamp.now(tz="UTC")
+        buf = io.StringIO()
+        frame[list(COPY_COLUMNS)].to_csv(buf, header=False, index=False, float_format="%.2f")
+        buf.seek(0)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                f"COPY {SalesEvent._meta.db_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf,
+            )
+    else:
+        # executemany direto: sem montar um SalesEvent (e preparar cada campo) por linha
+        adapt = connection.ops.adapt_datetimefield_value
+        now = adapt(timezone.now())
+        # datetimes ingênuos em UTC: é o que os bancos sem timezone guardam
+        occurred = [adapt(value) for value in cols["occurred_at"].astype("datetime64[us]").tolist()]
+        columns = ", ".join(connection.ops.quote_name(c) for c in COPY_COLUMNS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SalesEvent._meta.db_table} ({columns}) VALUES ({', '.join(['%s'] * len(COPY_COLUMNS))})",
+                zip(frame["org_id"].tolist(), occurred, frame["amount"].tolist(), frame["cost"].tolist(),
+                    frame["product"].tolist(), frame["region"].tolist(), frame["channel"].tolist(),
+                    frame["customer"].tolist(), [now] * len(frame)),
+            )
+    return len(frame)
+
+
+def _chunk(task):
+    org_id, start, days, seed, org_index, number, rows = task
+    rng = np.random.default_rng([seed, org_index, number])
+    return write_columns(org_id, event_columns(rows, start, days, profile(seed, org_index), rng))
+
+
+def seed_events(org, events, start, days, seed=0, org_index=0, workers=1, chunk_rows=CHUNK_ROWS, log=None):
+    """``events`` eventos da org a partir de ``start`` (``days`` dias); workers > 1 só no Postgres."""
+    tasks = [(org.id, start, days, seed, org_index, number, min(chunk_rows, events - offset))
+             for number, offset in enumerate(range(0, events, chunk_rows))]
+    if workers > 1 and connection.vendor == "postgresql":
+        connections.close_all()  # cada processo abre a própria conexão
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            done = 0
+            for written in pool.imap_unordered(_chunk, tasks):
+                done += written
+                if log:
+                    log(f"{org.slug}: {done}/{events} events")
+        return done
+    done = 0
+    for task in tasks:
+        done += _chunk(task)
+        if log:
+            log(f"{org.slug}: {done}/{events} events")
+    return done
+
+
+def metric_points(org, products, regions, start, days, seed=0, org_index=0):
+    """MetricPoint de cada dia x produto x região com a mesma sazonalidade dos eventos."""
+    rng = np.random.default_rng([seed, org_index, 2**32])  # fora da faixa dos números de bloco
+    shape = (days, len(products), len(regions))
+    base = rng.lognormal(np.log(4000), 0.5, size=shape[1:])
+    revenue = (day_weights(start, days)[:, None, None] * base * rng.lognormal(0, 0.2, size=shape)).round(2)
+    users = rng.poisson(revenue / 20) + 1
+    orders = rng.binomial(users, rng.uniform(0.05, 0.3, size=shape))
+    revenue, users, orders = revenue.tolist(), users.tolist(), orders.tolist()
+    dates = [start.date() + dt.timedelta(days=d) for d in range(days)]
+    return [
+        MetricPoint(org=org, date=dates[d], product=products[p], region=regions[r],
+                    revenue=revenue[d][p][r], users=users[d][p][r], orders=orders[d][p][r])
+        for d, p, r in np.ndindex(*shape)
+    ]
+
+
+def seed_org(org, events, start, days, products=(), regions=(), seed=0, org_index=0, workers=1, log=None):
+    """Eventos + métricas de uma org e os rollups reconstruídos de uma vez."""
+    n = seed_events(org, events, start, days, seed, org_index, workers, log=log)
+    if products and regions:
+        MetricPoint.objects.bulk_create(metric_points(org, products, regions, start, days, seed, org_index),
+                                        batch_size=BULK_BATCH_SIZE)
+    rebuild_sales_rollups(org=org)
+    rebuild_metric_rollups(org=org)
+    return n
@@ -0,0 +1,73 @@
+from pathlib import Path
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .archive import archive_closed_months
+from .imports import run_import
+from .models import DataSource, Report
+from .partitions import ensure_partitions
+from .reports import WRITERS, expire_stale_reports, report_rows
+from .retention import apply_retention
+
+@shared_task
+def import_datasource(datasource_id: int):
+    # só um worker "pega" o import: pending/failed -> processing é atômico
+    claimed = (DataSource.objects.filter(id=datasource_id, status__in=[DataSource.PENDING, DataSource.FAILED])
+               .update(status=DataSource.PROCESSING, error="", updated_at=timezone.now()))
+    ds = DataSource.objects.get(id=datasource_id)
+    if not claimed:
+        return {"datasource": ds.id, "status": ds.status}  # já importado ou em andamento
+    try:
+        if ds.target == DataSource.SALES_EVENTS and ds.org_id is None:
+            raise ValueError("Sales event imports need an organization")
+        run_import(ds, settings.ANALYTICS_IMPORT_CHUNK_SIZE)
+    except Exception as exc:
+        ds.status, ds.error = DataSource.FAILED, str(exc)[:2000]
+    else:
+        ds.status = DataSource.DONE
+    ds.save(update_fields=["status", "error", "updated_at"])
+    return {"datasource": ds.id, "status": ds.status, "rows_loaded": ds.rows_loaded}
+
+@shared_task
+def generate_report(report_id: int):
+    # só um worker "pega" o relatório: pending -> processing é atômico
+    if not Report.objects.filter(id=report_id, status=Report.PENDING).update(status=Report.PROCESSING,
+                                                                             started_at=timezone.now()):
+        return {"report": report_id, "status": "skipped"}
+    report = Report.objects.get(id=report_id)
+
+    name = f"reports/report-{report.id}.{report.format}"
+    path = Path(settings.MEDIA_ROOT) / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".part")
+    try:
+        report.rows = WRITERS[report.format](partial, report_rows(report.org_id, report.params), report.title)
+        partial.replace(path)
+    except Exception as exc:
+        partial.unlink(missing_ok=True)
+        report.status, report.error = Report.FAILED, str(exc)[:2000]
+    else:
+        report.status, report.file.name = Report.DONE, name
+    report.finished_at = timezone.now()
+    report.save(update_fields=["status", "error", "file", "rows", "finished_at"])
+    return {"report": report.id, "status": report.status, "rows": report.rows}
+
+@shared_task
+def expire_reports():
+    return {"expired": expire_stale_reports()}
+
+@shared_task
+def ensure_sales_partitions():
+    # no-op fora do Postgres ou com a tabela ainda não particionada
+    return {"created": ensure_partitions(settings.ANALYTICS_PARTITION_MONTHS_AHEAD)}
+
+@shared_task
+def apply_sales_retention():
+    return apply_retention()
+
+@shared_task
+def archive_sales_events():
+    # no-op com ANALYTICS_ARCHIVE_AFTER_MONTHS=0
+    return archive_closed_months()
@@ -1,19 +1,48 @@
-from datetime import date
+import io
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from importlib import import_module
+from importlib.util import find_spec
+from unittest import mock, skipUnless
 
+import numpy as np
+from django.apps import apps as django_apps
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.db.models import Sum
+from django.test import TestCase, override_settings
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from .models import MetricPoint, Product, Region
+from accounts.models import Membership, Organization
+from . import benchmarks, synthetic
+from .archive import archive_month
+from .models import (DataSource, MetricDailyRollup, Report, MetricPoint, Product, Region, SalesArchive,
+                     SalesDailyRollup, SalesEvent)
+from .ingest import write_events
+from .reports import params_hash
+from .retention import apply_retention
+from .sketches import DDSketch, HyperLogLog
+from .rollups import rebuild_metric_rollups, rebuild_sales_rollups
+from .tasks import generate_report, import_datasource
 
 
 class AnalyticsApiTests(APITestCase):
     def setUp(self):
         user = get_user_model().objects.create_user(username="analyst", password="test-pass")
         self.client.force_authenticate(user)
+        self.org = Organization.objects.create(name="Metrics Org", slug="metrics-org")
+        Membership.objects.create(org=self.org, user=user, role=Membership.VIEWER)
         product = Product.objects.create(name="Synthetic Panel")
         region = Region.objects.create(code="BR-SP")
         MetricPoint.objects.create(
+            org=self.org,
             date=date(2026, 1, 1),
             product=product,
             region=region,
@@ -30,9 +59,628 @@ class AnalyticsApiTests(APITestCase):
         self.assertEqual(response.data["active_users"], 10)
         self.assertEqual(response.data["conv_rate"], 20.0)
 
+    def test_summary_combines_dashboard_sections_in_one_query(self):
+        other = Product.objects.create(name="Other Panel")
+        MetricPoint.objects.create(
+            org=self.org,
+            date=date(2026, 1, 2),
+            product=other,
+            region=Region.objects.get(code="BR-SP"),
+            revenue="50.00",
+            users=5,
+            orders=1,
+        )
+
+        with self.assertNumQueries(2):  # memberships do usuário + o scan
+            response = self.client.get("/api/analytics/summary/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["kpis"]["revenue_mtd"], 150.5)
+        self.assertEqual(response.data["kpis"]["active_users"], 15)
+        self.assertEqual(response.data["kpis"]["conv_rate"], 20.0)
+        self.assertEqual([p["value"] for p in response.data["trend"]], [100.5, 50.0])
+        self.assertEqual([p["label"] for p in response.data["top_products"]], ["Synthetic Panel", "Other Panel"])
+        self.assertEqual(response.data["distribution"], [{"label": "BR-SP", "value": 150.5}])
+
+    @override_settings(TENANCY_CACHE_TIMEOUT=300, ANALYTICS_CACHE_TIMEOUT=300)  # cache compartilhado (Redis)
+    def test_kpis_are_cached_until_metric_points_change(self):
+        first = self.client.get("/api/analytics/kpis/", {"product": "synthetic panel"})
+        etag = first["ETag"]
+
+        with self.assertNumQueries(0):
+            cached = self.client.get("/api/analytics/kpis/", {"product": "SYNTHETIC PANEL"})
+            not_modified = self.client.get("/api/analytics/kpis/", {"product": "Synthetic Panel"},
+                                           HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.data, first.data)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        point = MetricPoint.objects.get()
+        point.revenue = "200.00"
+        point.save()
+        changed = self.client.get("/api/analytics/kpis/", {"product": "synthetic panel"}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(changed.data["revenue_mtd"], 200.0)
+
+    @override_settings(TENANCY_CACHE_TIMEOUT=300, ANALYTICS_CACHE_TIMEOUT=300, COMPRESSION_MIN_SIZE=0)
+    def test_weak_etag_from_compressed_response_still_matches(self):
+        point = MetricPoint.objects.get()
+        for day in range(2, 29):  # corpo acima do piso de 200 bytes do gzip
+            MetricPoint.objects.create(org=self.org, date=date(2026, 1, day), product=point.product,
+                                       region=point.region, revenue="10.00", users=1, orders=1)
+        first = self.client.get("/api/analytics/trend/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(first["Content-Encoding"], "gzip")
+        self.assertTrue(first["ETag"].startswith('W/"'))
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get("/api/analytics/trend/", HTTP_ACCEPT_ENCODING="gzip",
+                                           HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(ANALYTICS_CACHE_TIMEOUT=0)  # padrão sem Redis: versões por processo
+    def test_results_are_computed_per_request_without_a_shared_cache(self):
+        first = self.client.get("/api/analytics/kpis/")
+
+        point = MetricPoint.objects.get()
+        point.revenue = "200.00"
+        with mock.patch("analytics.cache.bump_data_version"):  # escrita feita por outro processo
+            point.save()
+        with self.assertNumQueries(2):  # memberships do usuário + o scan
+            again = self.client.get("/api/analytics/kpis/", HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(again.data["revenue_mtd"], 200.0)
+
+    def test_metrics_are_scoped_to_the_users_organizations(self):
+        other = Organization.objects.create(name="Other Org", slug="other-org")
+        MetricPoint.objects.create(org=other, date=date(2026, 1, 1), product=Product.objects.get(),
+                                   region=Region.objects.get(), revenue="900.00", users=90, orders=9)
+
+        self.assertEqual(self.client.get("/api/analytics/kpis/").data["revenue_mtd"], 100.5)
+        self.assertEqual(self.client.get("/api/analytics/summary/", {"org": "metrics-org"}).data["kpis"]["revenue_mtd"],
+                         100.5)
+        self.assertEqual(self.client.get("/api/analytics/kpis/", {"org": "other-org"}).status_code,
+                         status.HTTP_403_FORBIDDEN)
+
     def test_demo_datasources_require_authentication(self):
         self.client.force_authenticate(user=None)
 
         response = self.client.get("/api/datasources/")
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RollupMaintenanceTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Rollup Org", slug="rollup-org")
+
+    def _event(self, **kwargs):
+        defaults = {"org": self.org, "occurred_at": datetime(2026, 1, 1, 10, tzinfo=timezone.utc),
+                    "amount": 100.0, "cost": 40.0, "product": "Alpha", "region": "NA", "channel": "web"}
+        return SalesEvent.objects.create(**{**defaults, **kwargs})
+
+    def test_sales_rollup_follows_creates_updates_and_deletes(self):
+        first = self._event()
+        self._event(amount=50.0, cost=10.0)
+        moved = self._event(channel="retail")
+
+        moved.channel = "web"
+        moved.save()
+        first.delete()
+
+        bucket = SalesDailyRollup.objects.get(org=self.org, day=date(2026, 1, 1), channel="web")
+        self.assertEqual((bucket.amount, bucket.cost, bucket.count), (150.0, 50.0, 2))
+        self.assertEqual(SalesDailyRollup.objects.get(channel="retail").count, 0)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self._event()
+        self._event(occurred_at=datetime(2026, 1, 2, 23, 59, tzinfo=timezone.utc), product="Beta")
+        product = Product.objects.create(name="Panel")
+        region = Region.objects.create(code="EU")
+        MetricPoint.objects.create(org=self.org, date=date(2026, 1, 1), product=product, region=region,
+                                   revenue="10.00", users=4, orders=1)
+        incremental = sorted(SalesDailyRollup.objects.values_list("day", "product", "amount", "count"))
+
+        self.assertEqual(rebuild_sales_rollups(org=self.org), 2)
+        self.assertEqual(rebuild_metric_rollups(), 1)
+
+        self.assertEqual(sorted(SalesDailyRollup.objects.values_list("day", "product", "amount", "count")), incremental)
+        self.assertEqual(MetricDailyRollup.objects.get(date=date(2026, 1, 1)).users, 4)
+
+    def test_rollup_sketches_follow_events_and_match_rebuild(self):
+        self._event(customer="c1")
+        self._event(customer="c2", amount=50.0)
+        self._event(customer="c1", amount=10.0).delete()
+        write_events([SalesEvent(org=self.org, occurred_at=datetime(2026, 1, d, 10, tzinfo=timezone.utc), amount=20.0,
+                                 product="Alpha", region="NA", channel="web", customer="c3") for d in (1, 2)])
+
+        bucket = SalesDailyRollup.objects.get(org=self.org, day=date(2026, 1, 1))
+        self.assertEqual(bucket.customers.estimate(), 3)
+        self.assertEqual(bucket.amounts.count, 3)  # o evento removido saiu do DDSketch
+        self.assertAlmostEqual(bucket.amounts.quantile(0.5), 50.0, delta=0.5)
+
+        rebuild_sales_rollups(org=self.org)
+        rebuilt = SalesDailyRollup.objects.get(org=self.org, day=date(2026, 1, 1))
+        self.assertEqual(rebuilt.customers.registers, bucket.customers.registers)
+        self.assertEqual(rebuilt.amounts.positive, bucket.amounts.positive)
+        self.assertEqual(SalesDailyRollup.objects.get(org=self.org, day=date(2026, 1, 2)).customers.estimate(), 1)
+
+
+    def test_retention_purges_raw_events_but_keeps_rollups(self):
+        self.org.sales_retention_days = 30
+        self.org.save()
+        keeper = Organization.objects.create(name="Keeper", slug="keeper")
+        self._event()
+        self._event(occurred_at=datetime(2026, 2, 20, tzinfo=timezone.utc))
+        self._event(org=keeper)
+        # bulk_create não passa pelos rollups: a retenção reconstrói antes de apagar
+        SalesEvent.objects.bulk_create([SalesEvent(org=self.org, occurred_at=datetime(2026, 1, 1, 11, tzinfo=timezone.utc),
+                                                   amount=20.0, product="Alpha", region="NA", channel="web")])
+
+        summary = apply_retention(today=date(2026, 3, 1))
+
+        self.assertEqual(summary["orgs"], {"rollup-org": 2})
+        self.assertEqual(SalesEvent.objects.filter(org=self.org).count(), 1)
+        self.assertEqual(SalesEvent.objects.filter(org=keeper).count(), 1)
+        self.org.refresh_from_db()
+        self.assertEqual(self.org.sales_retained_from, date(2026, 1, 30))
+
+        rebuild_sales_rollups(org=self.org)  # não apaga os dias expurgados
+        bucket = SalesDailyRollup.objects.get(org=self.org, day=date(2026, 1, 1))
+        self.assertEqual((bucket.amount, bucket.count), (120.0, 2))
+        self.assertEqual(SalesDailyRollup.objects.filter(org=self.org).count(), 2)
+
+    @skipUnless(find_spec("pyarrow"), "pyarrow not installed")
+    def test_rebuild_keeps_archived_months(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media, TIME_ZONE="America/Sao_Paulo"):
+            self._event(customer="c1")
+            self._event(occurred_at=datetime(2026, 1, 31, 12, tzinfo=timezone.utc), amount=30.0, customer="c2")
+            # 2026-01-31 22:00 em São Paulo: mesmo dia local, mas fora do mês UTC arquivado
+            self._event(occurred_at=datetime(2026, 2, 1, 1, tzinfo=timezone.utc), amount=5.0, customer="c3")
+
+            def buckets():
+                return sorted((r.day, r.amount, r.count, r.customers.estimate(), r.amounts.count)
+                              for r in SalesDailyRollup.objects.filter(org=self.org))
+
+            before = buckets()
+            self.assertEqual(archive_month(self.org.id, date(2026, 1, 1)), 2)
+            rebuild_sales_rollups(org=self.org)
+            self.assertEqual(buckets(), before)
+            self.assertEqual(before[-1], (date(2026, 1, 31), 35.0, 2, 2, 2))
+
+    @skipUnless(find_spec("pyarrow"), "pyarrow not installed")
+    def test_migration_backfills_sketches_of_existing_rollups(self):
+        backfill = import_module("analytics.migrations.0012_sales_customer_sketches").backfill_sketches
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media):
+            self._event(customer="c1")
+            self._event(customer="c2", amount=40.0)
+            self._event(occurred_at=datetime(2026, 2, 10, 10, tzinfo=timezone.utc), customer="c1")
+            archive_month(self.org.id, date(2026, 1, 1))
+
+            def sketches():
+                return sorted((r.day, r.customers.estimate(), r.amounts.count, r.amounts.quantile(1))
+                              for r in SalesDailyRollup.objects.filter(org=self.org))
+
+            before = sketches()
+            SalesDailyRollup.objects.update(customers=None, amounts=None)
+            backfill(django_apps, None)
+            self.assertEqual(sketches(), before)
+            self.assertEqual(before[0][1:3], (2, 2))
+
+
+    @skipUnless(find_spec("pyarrow"), "pyarrow not installed")
+    def test_archive_file_is_only_published_with_the_commit(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media):
+            self._event()
+            with mock.patch.object(SalesArchive, "save", side_effect=RuntimeError("db down")), \
+                    self.assertRaises(RuntimeError):
+                archive_month(self.org.id, date(2026, 1, 1))
+            self.assertEqual(SalesEvent.objects.filter(org=self.org).count(), 1)
+            self.assertEqual([p for p in Path(media).rglob("*.parquet")], [])
+
+            self.assertEqual(archive_month(self.org.id, date(2026, 1, 1)), 1)
+            first = SalesArchive.objects.get(org=self.org).file.name
+            self._event(amount=7.0)  # atrasado: vira uma versão nova do arquivo
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(archive_month(self.org.id, date(2026, 1, 1)), 1)
+            archive = SalesArchive.objects.get(org=self.org)
+            self.assertNotEqual(archive.file.name, first)
+            self.assertEqual(archive.rows, 2)
+            self.assertEqual([p.name for p in Path(media).rglob("*.parquet")], [Path(archive.file.name).name])
+
+
+class SketchTests(TestCase):
+    def test_hyperloglog_estimates_merges_and_serializes(self):
+        odd, even = HyperLogLog(12), HyperLogLog(12)
+        for i in range(20000):
+            (odd if i % 2 else even).add(f"c{i}")
+        for i in range(5000):
+            odd.add(f"c{i}")  # repetidos não contam
+
+        union = odd + even
+        self.assertLess(abs(union.estimate() - 20000) / 20000, 0.05)
+        self.assertEqual(HyperLogLog.from_bytes(union.to_bytes()).registers, union.registers)
+        coarse = HyperLogLog(10) + union  # precisões diferentes: fica a menor
+        self.assertEqual(coarse.p, 10)
+        self.assertLess(abs(coarse.estimate() - 20000) / 20000, 0.1)
+
+        small = HyperLogLog(12)
+        small.add("a"), small.add("b"), small.add("a")
+        self.assertEqual(small.estimate(), 2)
+        self.assertTrue(small.to_bytes().startswith(b"HS"))
+        self.assertEqual(HyperLogLog.from_bytes(None).estimate(), 0)
+
+    def test_ddsketch_quantiles_have_bounded_relative_error(self):
+        values = np.random.default_rng(0).lognormal(4, 1, 10000)
+        left, right = DDSketch(0.01), DDSketch(0.01)
+        for i, v in enumerate(values):
+            (left if i % 3 else right).add(v)
+
+        merged = DDSketch.from_bytes((left + right).to_bytes())
+        for q in (0.5, 0.95, 0.99):
+            exact = np.quantile(values, q, method="lower")
+            self.assertLessEqual(abs(merged.quantile(q) - exact) / exact, 0.01)
+        for v in values[:5000]:
+            merged.add(v, -1)
+        self.assertEqual(merged.count, 5000)
+        self.assertLessEqual(abs(merged.quantile(0.5) - np.quantile(values[5000:], 0.5, method="lower"))
+                             / np.quantile(values[5000:], 0.5, method="lower"), 0.01)
+
+        signed = DDSketch(0.01)
+        for v in (-5.0, 0.0, 5.0):
+            signed.add(v)
+        self.assertAlmostEqual(signed.quantile(0), -5.0, delta=0.05)
+        self.assertEqual(signed.quantile(0.5), 0.0)
+        self.assertIsNone(DDSketch().quantile(0.5))
+
+
+class SalesEventIngestTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="loader", password="test-pass")
+        self.org = Organization.objects.create(name="Ingest Org", slug="ingest-org")
+        Membership.objects.create(org=self.org, user=self.user, role=Membership.ANALYST)
+        self.client.force_authenticate(self.user)
+
+    def test_ndjson_is_ingested_in_batches_with_rejections(self):
+        body = "\n".join([
+            '{"occurred_at": "2026-01-01T10:00:00Z", "amount": 10, "product": "Alpha", "channel": "web"}',
+            '{"occurred_at": "2026-01-01T11:00:00Z", "amount": 5.5, "cost": 2, "product": "Beta"}',
+            '{"occurred_at": "not a date", "amount": 1, "product": "Alpha"}',
+            'not json',
+            '{"occurred_at": "2026-01-02T09:00:00Z", "amount": 1, "product": "Alpha"}',
+        ])
+
+        response = self.client.post("/api/analytics/sales-events/ingest/?batch_size=2", body,
+                                    content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["accepted"], response.data["rejected"]), (3, 2))
+        self.assertEqual([(b["accepted"], b["rejected"]) for b in response.data["batches"]], [(2, 0), (0, 2), (1, 0)])
+        self.assertEqual(response.data["batches"][1]["errors"][0], {"line": 3, "error": "occurred_at: invalid datetime"})
+        self.assertEqual(SalesEvent.objects.filter(org=self.org).count(), 3)
+        self.assertEqual(SalesDailyRollup.objects.get(org=self.org, day=date(2026, 1, 1), product="Alpha").amount, 10.0)
+
+    def test_non_finite_numbers_are_rejected_per_row(self):
+        body = "\n".join([
+            '{"occurred_at": "2026-01-01T10:00:00Z", "amount": "NaN", "product": "Alpha"}',
+            '{"occurred_at": "2026-01-01T10:00:00Z", "amount": "Infinity", "product": "Alpha"}',
+            '{"occurred_at": "2026-01-01T10:00:00Z", "amount": 1, "cost": "1e400", "product": "Alpha"}',
+            '{"occurred_at": "2026-01-01T10:00:00Z", "amount": 3, "product": "Alpha"}',
+        ])
+
+        response = self.client.post("/api/analytics/sales-events/ingest/", body, content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["accepted"], response.data["rejected"]), (1, 3))
+        self.assertEqual([e["error"] for e in response.data["batches"][0]["errors"]],
+                         ["amount: not a finite number", "amount: not a finite number", "cost: not a finite number"])
+        self.assertEqual(SalesDailyRollup.objects.get(org=self.org).amount, 3.0)
+
+    def test_csv_ingest_requires_write_role(self):
+        body = "occurred_at,amount,product,region\n2026-01-01T10:00:00Z,12.5,Alpha,EU\n"
+        response = self.client.post("/api/analytics/sales-events/ingest/", body, content_type="text/csv")
+        self.assertEqual(response.data["accepted"], 1)
+
+        membership = Membership.objects.get(user=self.user)
+        membership.role = Membership.VIEWER
+        membership.save()  # o signal invalida as memberships cacheadas
+        response = self.client.post("/api/analytics/sales-events/ingest/", body, content_type="text/csv")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class DataSourceImportTests(APITestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media, ANALYTICS_IMPORT_CHUNK_SIZE=2)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = get_user_model().objects.create_user(username="importer", password="test-pass")
+        self.org = Organization.objects.create(name="Import Org", slug="import-org")
+        Membership.objects.create(org=self.org, user=self.user, role=Membership.ADMIN)
+        self.client.force_authenticate(self.user)
+
+    def _upload(self, name, content, **data):
+        with mock.patch("analytics.views.import_datasource.delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/datasources/", {
+                "name": name, "file": SimpleUploadedFile(name, content.encode()), **data,
+            }, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        delay.assert_called_once_with(response.data["id"])
+        return response.data["id"]
+
+    def test_csv_upload_is_imported_in_chunks_by_background_task(self):
+        ds_id = self._upload("sales.csv", "When,Amount,Product,Channel\n"
+                                          "2026-01-01T10:00:00Z,10,Alpha,web\n"
+                                          "2026-01-01T11:00:00Z,20,Beta,retail\n"
+                                          "bad date,5,Alpha,web\n",
+                             column_map='{"When": "occurred_at"}')
+        self.assertEqual(DataSource.objects.get(id=ds_id).status, DataSource.PENDING)
+
+        import_datasource(ds_id)
+
+        ds = DataSource.objects.get(id=ds_id)
+        self.assertEqual((ds.status, ds.rows_processed, ds.rows_loaded, ds.rows_rejected), ("done", 3, 2, 1))
+        self.assertEqual(SalesEvent.objects.filter(org=self.org).count(), 2)
+        self.assertEqual(self.client.get(f"/api/datasources/{ds_id}/").data["rows_loaded"], 2)
+
+    def test_failed_import_resumes_after_the_last_committed_chunk(self):
+        ds_id = self._upload("sales.csv", "occurred_at,amount,product\n" + "".join(
+            f"2026-01-01T1{i}:00:00Z,{i + 1},Alpha\n" for i in range(5)))
+        real_write = write_events
+        calls = []
+
+        def flaky(events):
+            calls.append(len(events))
+            if len(calls) == 2:
+                raise RuntimeError("db gone")
+            return real_write(events)
+
+        with mock.patch("analytics.imports.write_events", side_effect=flaky):
+            import_datasource(ds_id)
+        ds = DataSource.objects.get(id=ds_id)
+        self.assertEqual((ds.status, ds.rows_processed, ds.rows_loaded), (DataSource.FAILED, 2, 2))
+
+        DataSource.objects.filter(id=ds_id).update(status=DataSource.PROCESSING)
+        self.assertEqual(import_datasource(ds_id), {"datasource": ds_id, "status": DataSource.PROCESSING})
+        DataSource.objects.filter(id=ds_id).update(status=DataSource.FAILED)
+
+        import_datasource(ds_id)
+        ds.refresh_from_db()
+        self.assertEqual((ds.status, ds.rows_processed, ds.rows_loaded), (DataSource.DONE, 5, 5))
+        self.assertEqual(sorted(SalesEvent.objects.filter(org=self.org).values_list("amount", flat=True)),
+                         [1.0, 2.0, 3.0, 4.0, 5.0])
+
+    def test_metric_point_csv_and_unsupported_parquet(self):
+        ds_id = self._upload("metrics.csv", "date,product,region,revenue,users,orders\n"
+                                            "2026-01-01,Panel,EU,10.50,4,1\n",
+                             target=DataSource.METRIC_POINTS)
+        import_datasource(ds_id)
+        self.assertEqual(MetricPoint.objects.get().revenue, Decimal("10.50"))
+        self.assertEqual(MetricDailyRollup.objects.get().users, 4)
+
+        # reimportar com valores novos substitui o ponto (unique date/product/region)
+        ds_id = self._upload("metrics.csv", "date,product,region,revenue,users,orders\n"
+                                            "2026-01-01,Panel,EU,12.00,6,2\n",
+                             target=DataSource.METRIC_POINTS)
+        import_datasource(ds_id)
+        self.assertEqual(MetricPoint.objects.get().revenue, Decimal("12.00"))
+        self.assertEqual(MetricDailyRollup.objects.get().users, 6)
+
+        ds = DataSource.objects.create(org=self.org, name="broken", file=SimpleUploadedFile("x.parquet", b"nope"))
+        import_datasource(ds.id)
+        ds.refresh_from_db()
+        self.assertEqual(ds.status, DataSource.FAILED)
+        self.assertTrue(ds.error)
+
+
+    def test_excel_upload_is_rejected_without_openpyxl(self):
+        with mock.patch("analytics.serializers.find_spec", return_value=None), \
+                mock.patch("analytics.views.import_datasource.delay") as delay:
+            response = self.client.post("/api/datasources/", {
+                "name": "sales", "file": SimpleUploadedFile("sales.xlsx", b"PK"),
+            }, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("openpyxl", str(response.data["file"]))
+        self.assertFalse(DataSource.objects.exists())
+        delay.assert_not_called()
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class ReportGenerationTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="reporter", password="test-pass")
+        self.org = Organization.objects.create(name="Report Org", slug="report-org")
+        Membership.objects.create(org=self.org, user=self.user, role=Membership.VIEWER)
+        self.client.force_authenticate(self.user)
+        for day, channel in [(1, "web"), (2, "web"), (2, "retail")]:
+            SalesEvent.objects.create(org=self.org, occurred_at=datetime(2026, 1, day, 12, tzinfo=timezone.utc),
+                                      amount=100.0, cost=40.0, product="Alpha", region="NA", channel=channel)
+
+    def _request(self, **body):
+        with mock.patch("analytics.views.generate_report.delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/reports/", body, format="json")
+        return response, delay
+
+    def test_identical_in_flight_requests_are_deduplicated(self):
+        params = {"date_from": "2026-01-02", "channels": ["web", "retail"]}
+        first, delay = self._request(title="Jan", params=params)
+        again, again_delay = self._request(title="Jan (again)", params={"channels": ["retail", "web"], "date_from": "2026-01-02"})
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(first.data["status"], Report.PENDING)
+        delay.assert_called_once_with(first.data["id"])
+        self.assertEqual((again.status_code, again.data["id"]), (status.HTTP_200_OK, first.data["id"]))
+        again_delay.assert_not_called()
+
+        generate_report(first.data["id"])
+        report = Report.objects.get(id=first.data["id"])
+        self.addCleanup(report.file.delete, save=False)
+        self.assertEqual((report.status, report.rows), (Report.DONE, 2))
+        with report.file.open("r") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], "day,product,region,channel,orders,revenue,cost,margin")
+        self.assertEqual(lines[1:], ["2026-01-02,Alpha,NA,retail,1,100.0,40.0,60.0",
+                                     "2026-01-02,Alpha,NA,web,1,100.0,40.0,60.0"])
+        self.assertEqual(self._request(title="Jan", params=params)[0].status_code, status.HTTP_201_CREATED)
+
+    def test_stale_in_flight_report_is_expired_and_requested_again(self):
+        first, _ = self._request(title="Jan")
+        Report.objects.filter(id=first.data["id"]).update(status=Report.PROCESSING,
+                                                          started_at=datetime(2026, 1, 1, tzinfo=timezone.utc))
+        again, delay = self._request(title="Jan")
+        self.assertEqual(again.status_code, status.HTTP_201_CREATED)
+        delay.assert_called_once_with(again.data["id"])
+        stale = Report.objects.get(id=first.data["id"])
+        self.assertEqual((stale.status, stale.error), (Report.FAILED, "Report generation timed out"))
+
+    def test_lost_create_race_returns_the_winner_even_if_already_done(self):
+        from .serializers import ReportSerializer
+        # o pedido concorrente criou e terminou entre a checagem e o INSERT deste
+        winner = Report.objects.create(org=self.org, params_hash=params_hash(self.org.id, Report.CSV, {}),
+                                       status=Report.DONE)
+        with mock.patch.object(ReportSerializer, "save", side_effect=IntegrityError("report_unique_in_flight")):
+            response, delay = self._request(title="Jan")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["id"], response.data["status"]), (winner.id, Report.DONE))
+        delay.assert_not_called()
+
+    def test_xlsx_is_rejected_upfront_without_openpyxl(self):
+        with mock.patch("analytics.serializers.find_spec", return_value=None):
+            response, delay = self._request(title="Jan", format=Report.XLSX)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("openpyxl", str(response.data["format"]))
+        self.assertFalse(Report.objects.exists())
+        delay.assert_not_called()
+
+    def test_pdf_report_is_written_page_by_page(self):
+        report = Report.objects.create(org=self.org, format=Report.PDF, params_hash="x")
+        with mock.patch("analytics.reports._PdfWriter.LINES_PER_PAGE", 4):
+            generate_report(report.id)
+        report.refresh_from_db()
+        self.addCleanup(report.file.delete, save=False)
+
+        with report.file.open("rb") as f:
+            pdf = f.read()
+        self.assertEqual(report.status, Report.DONE)
+        self.assertTrue(pdf.startswith(b"%PDF-1.4") and pdf.endswith(b"%%EOF\n"))
+        self.assertIn(b"/Count 3", pdf)
+
+
+class SalesEventListTests(APITestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username="lister", password="test-pass")
+        self.org = Organization.objects.create(name="List Org", slug="list-org")
+        other = Organization.objects.create(name="Other", slug="other")
+        Membership.objects.create(org=self.org, user=user, role=Membership.VIEWER)
+        self.client.force_authenticate(user)
+        # dois eventos por horário: o cursor precisa desempatar pelo id
+        for hour in range(3):
+            for channel in ("web", "retail"):
+                SalesEvent.objects.create(org=self.org, occurred_at=datetime(2026, 1, 1, hour, tzinfo=timezone.utc),
+                                          amount=hour, product="Alpha", channel=channel)
+        SalesEvent.objects.create(org=other, occurred_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+                                  amount=1, product="Alpha")
+
+    def _walk(self, url, params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            pages += 1
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [row["id"] for row in response.data["results"]]
+            if not response.data["next"]:
+                return ids, pages, response
+            response = self.client.get(response.data["next"])
+
+    def test_cursor_pages_cover_org_events_once_in_order(self):
+        expected = list(SalesEvent.objects.filter(org=self.org).order_by("-occurred_at", "-id")
+                        .values_list("id", flat=True))
+
+        ids, pages, _ = self._walk("/api/analytics/sales-events/", {"page_size": 4})
+
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 2)
+
+    def test_filters_and_sparse_fields_use_values_fast_path(self):
+        _, _, response = self._walk("/api/analytics/sales-events/", {
+            "channel": "web", "date_from": "2026-01-01T01:00:00Z", "fields": "id,amount",
+        })
+
+        self.assertEqual(response.data["results"], [
+            {"id": row["id"], "amount": row["amount"]}
+            for row in SalesEvent.objects.filter(org=self.org, channel="web", amount__gte=1)
+            .order_by("-occurred_at").values("id", "amount")
+        ])
+        bad = self.client.get("/api/analytics/sales-events/", {"fields": "id,secret"})
+        self.assertEqual(bad.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_suite_reports_every_case_and_flags_regressions(self):
+        out = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, out, True)
+        path = f"{out}/bench.json"
+
+        call_command("benchmark_suite", events=300, days=5, repeat=2, output=path, stderr=io.StringIO())
+
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report["meta"]["events"], 300)
+        self.assertIn("api.kpis", report["results"])
+        self.assertIn("widget.timeseries.hour_tz", report["results"])
+        self.assertEqual(set(report["results"]["api.kpis"]),
+                         {"p50_ms", "p95_ms", "p99_ms", "max_ms", "mean_ms", "queries", "peak_kb"})
+        self.assertFalse(Organization.objects.filter(slug__startswith=benchmarks.PREFIX).exists())
+
+        slower = json.loads(json.dumps(report))
+        slower["results"]["api.kpis"]["p95_ms"] += 50
+        slower["results"]["api.trend"]["queries"] += 1
+        self.assertEqual(benchmarks.compare(report, report), [])
+        self.assertEqual({(name, metric) for name, metric, *_ in benchmarks.compare(slower, report)},
+                         {("api.kpis", "p95_ms"), ("api.trend", "queries")})
+
+
+class SyntheticDataTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Synthetic Org", slug="synthetic-org")
+        self.start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def test_same_seed_generates_same_columns(self):
+        def columns(seed):
+            return synthetic.event_columns(500, self.start, 30, synthetic.profile(seed), np.random.default_rng(seed))
+
+        first, again, other = columns(7), columns(7), columns(8)
+
+        for name in first:
+            np.testing.assert_array_equal(first[name], again[name])
+        self.assertFalse(np.array_equal(first["amount"], other["amount"]))
+        self.assertTrue((first["occurred_at"] >= np.datetime64("2026-01-01")).all())
+        self.assertTrue((first["occurred_at"] < np.datetime64("2026-01-31")).all())
+        self.assertTrue((first["cost"] < first["amount"]).all())
+
+    def test_seed_org_writes_events_metrics_and_rollups(self):
+        products = [Product.objects.create(name=name) for name in ("Panel", "Sensor")]
+        regions = [Region.objects.create(code=code) for code in ("NA", "EU", "APAC")]
+
+        n = synthetic.seed_org(self.org, 1234, self.start, 10, products, regions, seed=3)
+
+        events = SalesEvent.objects.filter(org=self.org)
+        self.assertEqual((n, events.count()), (1234, 1234))
+        self.assertEqual(set(events.values_list("product", flat=True)) - set(synthetic.PRODUCTS), set())
+        self.assertEqual(SalesDailyRollup.objects.filter(org=self.org).aggregate(n=Sum("count"))["n"], 1234)
+        self.assertAlmostEqual(SalesDailyRollup.objects.filter(org=self.org).aggregate(s=Sum("amount"))["s"],
+                               events.aggregate(s=Sum("amount"))["s"], places=2)
+        self.assertEqual(MetricPoint.objects.filter(org=self.org).count(), 10 * 2 * 3)
+        self.assertEqual(MetricDailyRollup.objects.filter(org=self.org).count(), 10)
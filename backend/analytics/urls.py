@@ -3,7 +3,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     SalesEventViewSet,
-    KPIsView, TrendView, TopProductsView, DistributionView,
+    KPIsView, TrendView, TopProductsView, DistributionView, SummaryView,
     DataSourceListCreate, DataSourceDetail,
     ReportListCreate, ReportDetail,
     SettingsView,
@@ -21,6 +21,7 @@ urlpatterns = [
     path("trend/", TrendView.as_view(), name="trend"),
     path("top-products/", TopProductsView.as_view(), name="top-products"),
     path("distribution/", DistributionView.as_view(), name="distribution"),
+    path("summary/", SummaryView.as_view(), name="summary"),
 
     # data sources
     path("datasources/", DataSourceListCreate.as_view(), name="datasources"),
@@ -1,7 +1,9 @@
 from rest_framework import viewsets, permissions
 from .models import SalesEvent
 from .serializers import SalesEventSerializer
-from .models import MetricPoint  
+from .models import MetricPoint, MetricDailyRollup
+from .rollups import rollups_enabled
+from . import cache as analytics_cache
 from rest_framework import viewsets
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -9,9 +11,11 @@ from django.db.models import Sum, F, FloatField
 from django.db.models.functions import Cast
 
 from rest_framework.parsers import MultiPartParser, FormParser
+from config.renderers import ORJSONParser
 from rest_framework import generics, permissions
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.utils.cache import get_conditional_response
 import pandas as pd
 from io import BytesIO
 
@@ -23,10 +27,87 @@ from datetime import date, timedelta
 import random
 
 from rest_framework import status
-class SalesEventViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = SalesEvent.objects.all().order_by("-occurred_at")
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from accounts import tenancy
+from accounts.models import Membership
+from django.db import IntegrityError, transaction
+from .filters import SalesEventFilter
+from .ingest import READERS, ingest_rows
+from .pagination import KeysetPagination
+from .reports import expire_stale_reports, params_hash
+from .tasks import generate_report, import_datasource
+
+WRITE_ROLES = (Membership.ADMIN, Membership.ANALYST)
+
+def _writable_org(request, slug=None, roles=WRITE_ROLES):
+    """(org_id, None) da org em que o usuário pode agir, ou (None, Response de erro).
+
+    Sem ``slug`` só funciona se o usuário tiver exatamente uma org com um dos ``roles``
+    (None = qualquer papel).
+    """
+    org_ids = tenancy.org_ids(request, slug or None, roles or None)
+    if len(org_ids) == 1:
+        return org_ids[0], None
+    return None, Response({"detail": "Pass ?org=<slug> of an organization you can write to."},
+                          status=status.HTTP_400_BAD_REQUEST if org_ids else status.HTTP_403_FORBIDDEN)
+
+class SalesEventViewSet(tenancy.TenantScopedMixin, viewsets.ReadOnlyModelViewSet):
+    """Eventos das orgs do usuário, paginados por cursor.
+
+    ``?fields=a,b`` limita as colunas; com ``fields`` ou páginas grandes a lista sai
+    direto de ``.values()``, sem passar pelo ModelSerializer.
+    """
     serializer_class = SalesEventSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    filterset_class = SalesEventFilter
+    fast_path_page_size = 200
+    queryset = SalesEvent.objects.order_by("-occurred_at", "-id")
+
+    def _requested_fields(self):
+        fields = [f for f in self.request.query_params.get("fields", "").split(",") if f]
+        if unknown := set(fields) - set(SalesEventSerializer.Meta.fields):
+            raise ValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}"})
+        return fields
+
+    def list(self, request, *args, **kwargs):
+        fields = self._requested_fields()
+        if not fields and self.paginator.get_page_size(request) < self.fast_path_page_size:
+            return super().list(request, *args, **kwargs)
+
+        fields = fields or SalesEventSerializer.Meta.fields
+        queryset = self.filter_queryset(self.get_queryset())
+        # occurred_at/id sempre vêm do banco: a paginação precisa deles para o cursor
+        rows = self.paginate_queryset(queryset.values(*{*fields, "occurred_at", "id"}))
+        data = [{f: row[f] for f in fields} for row in rows]
+        return self.get_paginated_response(data)
+
+    @action(detail=False, methods=["post"], url_path="ingest")
+    def ingest(self, request):
+        """Corpo NDJSON ou CSV lido em streaming; resposta com aceitos/rejeitados por lote."""
+        reader = READERS.get(request.content_type.split(";")[0].strip())
+        if reader is None:
+            return Response({"detail": f"Use one of: {', '.join(READERS)}."},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        org_id, error = _writable_org(request, request.query_params.get("org"))
+        if error:
+            return error
+
+        try:
+            batch_size = min(int(request.query_params.get("batch_size", settings.ANALYTICS_INGEST_BATCH_SIZE)),
+                             settings.ANALYTICS_INGEST_MAX_BATCH_SIZE)
+        except ValueError:
+            return Response({"detail": "batch_size must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        stream = request.stream or []
+        batches = list(ingest_rows(org_id, reader(stream), batch_size=max(batch_size, 1)))
+        return Response({
+            "accepted": sum(b["accepted"] for b in batches),
+            "rejected": sum(b["rejected"] for b in batches),
+            "batches": batches,
+        })
 
 
 def _filters(request):
@@ -40,110 +121,181 @@ def _filters(request):
     if reg:  q["region__code__iexact"] = reg
     return q
 
-class KPIsView(APIView):
-    def get(self, request):
-        qs = MetricPoint.objects.filter(**_filters(request))
-        revenue = qs.aggregate(v=Sum("revenue"))["v"] or 0
-        users   = qs.aggregate(v=Sum("users"))["v"] or 0
-        orders  = qs.aggregate(v=Sum("orders"))["v"] or 0
-        conv    = (orders/users*100) if users else 0
-        return Response({
-            "revenue_mtd": float(revenue),
-            "active_users": int(users),
-            "conv_rate": round(conv, 2),
-            "tickets_open": 87,
-        })
+def _metric_source(filters):
+    # sem filtro de produto/região o rollup diário (por org) responde sozinho
+    if rollups_enabled() and set(filters) <= {"org_id__in", "date__range"}:
+        return MetricDailyRollup.objects.filter(**filters)
+    return MetricPoint.objects.filter(**filters)
+
+def _kpis(revenue, users, orders):
+    conv = (orders/users*100) if users else 0
+    return {
+        "revenue_mtd": float(revenue),
+        "active_users": int(users),
+        "conv_rate": round(conv, 2),
+        "tickets_open": 87,
+    }
+
+class CachedAnalyticsView(APIView):
+    """Base das views de analytics: resultado cacheado por orgs + filtros + versão dos dados.
+
+    As orgs vêm de ``accounts.tenancy`` (``?org=<slug>`` ou todas as do usuário) e
+    entram nos filtros, logo na chave. O ETag é o próprio digest da chave, então um
+    If-None-Match igual devolve 304 sem consultar as tabelas de métricas. Sem cache
+    compartilhado (``analytics.cache.enabled``) cada request calcula e o ETag fica com
+    o ConditionalGetMiddleware (hash do corpo).
+    """
+    cache_tables = (analytics_cache.METRICS,)
+
+    def compute(self, filters):
+        raise NotImplementedError
 
-class TrendView(APIView):
     def get(self, request):
-        data = (MetricPoint.objects.filter(**_filters(request))
+        filters = {"org_id__in": tenancy.requested_org_ids(request), **_filters(request)}
+        if not analytics_cache.enabled():
+            return Response(self.compute(filters))
+        digest = analytics_cache.result_digest(type(self).__name__, filters, self.cache_tables)
+        etag = f'"{digest}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        # comparação fraca: gzip/br devolvem o ETag como W/"..." e é essa a forma que o cliente reenvia
+        if (not_modified := get_conditional_response(request._request, etag=etag)) is not None:
+            for name, value in headers.items():
+                not_modified.headers[name] = value
+            return not_modified
+
+        data = analytics_cache.get_result(digest)
+        if data is None:
+            data = self.compute(filters)
+            analytics_cache.set_result(digest, data)
+        return Response(data, headers=headers)
+
+class KPIsView(CachedAnalyticsView):
+    def compute(self, filters):
+        totals = _metric_source(filters).aggregate(
+            revenue=Sum("revenue"), users=Sum("users"), orders=Sum("orders"),
+        )
+        return _kpis(totals["revenue"] or 0, totals["users"] or 0, totals["orders"] or 0)
+
+class TrendView(CachedAnalyticsView):
+    def compute(self, filters):
+        data = (_metric_source(filters)
                 .values("date").annotate(value=Sum("revenue")).order_by("date"))
-        return Response([{"label": r["date"].strftime("%b %d"), "value": float(r["value"])} for r in data])
+        return [{"label": r["date"].strftime("%b %d"), "value": float(r["value"])} for r in data]
 
-class TopProductsView(APIView):
-    def get(self, request):
-        data = (MetricPoint.objects.filter(**_filters(request))
+class TopProductsView(CachedAnalyticsView):
+    def compute(self, filters):
+        data = (MetricPoint.objects.filter(**filters)
                 .values(label=F("product__name"))
                 .annotate(value=Sum("revenue"))
                 .order_by("-value")[:5])
-        return Response([{"label": r["label"], "value": float(r["value"])} for r in data])
+        return [{"label": r["label"], "value": float(r["value"])} for r in data]
 
-class DistributionView(APIView):
-    def get(self, request):
+class DistributionView(CachedAnalyticsView):
+    def compute(self, filters):
         data = (
-            MetricPoint.objects.filter(**_filters(request))
+            MetricPoint.objects.filter(**filters)
             .values(label=F("region__code"))  # <-- troque name por code
             .annotate(value=Cast(Sum("revenue"), FloatField()))
             .order_by("-value")
         )
-        return Response(
-            [{"label": r["label"], "value": float(r["value"])} for r in data]
-        )
+        return [{"label": r["label"], "value": float(r["value"])} for r in data]
 
 
+class SummaryView(CachedAnalyticsView):
+    """KPIs, trend, top products e distribuição num único scan.
 
-# ---------- Data Sources (stubs só p/ não quebrar rotas) ----------
+    Uma query agrupada por (date, product, region) e o rollup é feito em
+    Python, em vez das seis queries das views separadas.
+    """
+    top_n = 5
 
-# Vamos manter um “storage” em memória só para teste.
-# Logo a gente troca por Model + serializer de verdade.
-_FAKE_DATASOURCES = [
-    {"id": 1, "name": "Stripe", "type": "api", "status": "connected"},
-    {"id": 2, "name": "Postgres Sales", "type": "db", "status": "connected"},
-]
+    def compute(self, filters):
+        rows = (MetricPoint.objects.filter(**filters)
+                .values("date", product_name=F("product__name"), region_code=F("region__code"))
+                .annotate(revenue=Sum("revenue"), users=Sum("users"), orders=Sum("orders")))
 
-class DataSourceListCreate(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+        revenue = users = orders = 0
+        by_date, by_product, by_region = {}, {}, {}
+        for r in rows:
+            revenue += r["revenue"]
+            users   += r["users"]
+            orders  += r["orders"]
+            by_date[r["date"]] = by_date.get(r["date"], 0) + r["revenue"]
+            by_product[r["product_name"]] = by_product.get(r["product_name"], 0) + r["revenue"]
+            by_region[r["region_code"]] = by_region.get(r["region_code"], 0) + r["revenue"]
 
-    def get(self, request):
-        return Response(_FAKE_DATASOURCES)
+        def ranked(totals, limit=None):
+            items = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+            return [{"label": k, "value": float(v)} for k, v in items]
 
-    def post(self, request):
-        payload = request.data
-        new_id = max([d["id"] for d in _FAKE_DATASOURCES] or [0]) + 1
-        item = {
-            "id": new_id,
-            "name": payload.get("name", f"Datasource {new_id}"),
-            "type": payload.get("type", "api"),
-            "status": payload.get("status", "connected"),
+        return {
+            "kpis": _kpis(revenue, users, orders),
+            "trend": [{"label": d.strftime("%b %d"), "value": float(v)} for d, v in sorted(by_date.items())],
+            "top_products": ranked(by_product, self.top_n),
+            "distribution": ranked(by_region),
         }
-        _FAKE_DATASOURCES.append(item)
-        return Response(item, status=status.HTTP_201_CREATED)
 
-class DataSourceDetail(APIView):
+
+# ---------- Data Sources ----------
+
+class DataSourceListCreate(tenancy.TenantScopedMixin, generics.ListCreateAPIView):
+    """Upload de arquivo (multipart) vira um import em background (analytics.tasks)."""
+    serializer_class = DataSourceSerializer
     permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [ORJSONParser, MultiPartParser, FormParser]
+    queryset = DataSource.objects.order_by("-created_at")
 
-    def get(self, request, pk):
-        for d in _FAKE_DATASOURCES:
-            if d["id"] == pk:
-                return Response(d)
-        return Response({"detail": "Not found."}, status=404)
+    def create(self, request, *args, **kwargs):
+        org_id, error = _writable_org(request, request.query_params.get("org") or request.data.get("org"))
+        if error:
+            return error
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        has_file = bool(serializer.validated_data.get("file"))
+        ds = serializer.save(org_id=org_id, status=DataSource.PENDING if has_file else DataSource.CONNECTED)
+        if has_file:
+            transaction.on_commit(lambda: import_datasource.delay(ds.id))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-# ---------- Reports (stubs) ----------
+class DataSourceDetail(tenancy.TenantScopedMixin, generics.RetrieveAPIView):
+    serializer_class = DataSourceSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = DataSource.objects.all()
 
-_FAKE_REPORTS = [
-    {"id": 1, "title": "Weekly Revenue", "status": "done", "url": "/media/reports/weekly.pdf"},
-]
+# ---------- Reports ----------
 
-class ReportListCreate(APIView):
+class ReportListCreate(tenancy.TenantScopedMixin, generics.ListCreateAPIView):
+    """POST enfileira a geração (analytics.tasks.generate_report); pedidos idênticos em andamento são reaproveitados."""
+    serializer_class = ReportSerializer
     permission_classes = [permissions.IsAuthenticated]
+    queryset = Report.objects.order_by("-created_at")
 
-    def get(self, request):
-        return Response(_FAKE_REPORTS)
+    def create(self, request, *args, **kwargs):
+        org_id, error = _writable_org(request, request.query_params.get("org") or request.data.get("org"), roles=None)
+        if error:
+            return error
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        digest = params_hash(org_id, data.get("format", Report.CSV), data.get("params", {}))
 
-    def post(self, request):
-        new_id = max([r["id"] for r in _FAKE_REPORTS] or [0]) + 1
-        item = {"id": new_id, "title": request.data.get("title", f"Report {new_id}"), "status": "queued", "url": None}
-        _FAKE_REPORTS.append(item)
-        return Response(item, status=201)
+        expire_stale_reports(org_id=org_id, params_hash=digest)
+        same = Report.objects.filter(org_id=org_id, params_hash=digest)
+        if existing := same.filter(status__in=[Report.PENDING, Report.PROCESSING]).first():
+            return Response(self.get_serializer(existing).data)
+        try:
+            with transaction.atomic():
+                report = serializer.save(org_id=org_id, params_hash=digest)
+        except IntegrityError:
+            # outro request idêntico venceu a corrida (constraint report_unique_in_flight); pode já ter terminado
+            return Response(self.get_serializer(same.order_by("-id").first()).data)
+        transaction.on_commit(lambda: generate_report.delay(report.id))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-class ReportDetail(APIView):
+class ReportDetail(tenancy.TenantScopedMixin, generics.RetrieveAPIView):
+    serializer_class = ReportSerializer
     permission_classes = [permissions.IsAuthenticated]
-
-    def get(self, request, pk):
-        for r in _FAKE_REPORTS:
-            if r["id"] == pk:
-                return Response(r)
-        return Response({"detail": "Not found."}, status=404)
+    queryset = Report.objects.all()
 
 # ---------- Settings (stub) ----------
 
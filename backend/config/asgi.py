@@ -1,13 +1,16 @@
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import dashboards.routing  # criaremos
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django_asgi_app = get_asgi_application()
 
+# só depois do setup do Django: routing importa models
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+import dashboards.routing  # noqa: E402
+from dashboards.auth import JWTQueryAuthMiddleware  # noqa: E402
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
-    "websocket": AuthMiddlewareStack(URLRouter(dashboards.routing.websocket_urlpatterns)),
+    "websocket": AuthMiddlewareStack(JWTQueryAuthMiddleware(URLRouter(dashboards.routing.websocket_urlpatterns))),
 })
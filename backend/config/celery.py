@@ -5,3 +5,5 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 app = Celery("config")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+from . import instrumentation  # noqa: E402,F401 - hooks task_prerun/task_postrun
@@ -0,0 +1,340 @@
+# backend/config/instrumentation.py
+"""Instrumentação: tempo, queries e tempo de banco, cache e tamanho da resposta por request/task.
+
+O ``InstrumentationMiddleware`` e os signals do Celery abrem um ``Timing`` por
+request/task (contextvar). O execute_wrapper das conexões soma queries e tempo
+de banco nele e loga as queries acima de ``INSTRUMENTATION_SLOW_QUERY_MS``. A
+resposta sai com ``Server-Timing``. Cada processo acumula as séries num registro
+local e publica o snapshot no cache do Django; ``/metrics`` soma os snapshots de
+todos os processos (web e workers) no formato texto do Prometheus.
+
+Processo sem flush há ``INSTRUMENTATION_PROCESS_TIMEOUT`` (reciclado, morto) tem
+o snapshot somado a um acumulado permanente: os contadores não "zeram" quando
+workers são trocados. Se o processo estava só ocioso, ele desconta o que foi
+acumulado no próximo flush. Fora do DEBUG, ``/metrics`` exige cache
+compartilhado (Redis) e ``METRICS_TOKEN``.
+"""
+import hmac
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+INDEX_KEY = "instrumentation:processes"
+SNAPSHOT_KEY = "instrumentation:snapshot:{process}"
+# séries de processos que já saíram do índice (somadas), e o que foi somado de cada um
+ACCUMULATED_KEY = "instrumentation:accumulated"
+RETIRED_KEY = "instrumentation:retired:{process}"
+RETIRED_TIMEOUT = 7 * 24 * 3600
+
+HELP = {
+    "http_requests_total": "HTTP requests by view, method and status",
+    "http_request_duration_seconds": "HTTP request wall time by view",
+    "http_db_queries_total": "DB queries run while serving requests, by view",
+    "http_db_seconds_total": "DB time spent serving requests, by view",
+    "http_response_bytes_total": "Response body bytes (after compression), by view",
+    "celery_tasks_total": "Celery tasks by name and final state",
+    "celery_task_duration_seconds": "Celery task wall time by name",
+    "celery_task_db_queries_total": "DB queries run by Celery tasks, by name",
+    "celery_task_db_seconds_total": "DB time spent by Celery tasks, by name",
+    "widget_compute_duration_seconds": "Widget payload computation time by widget type",
+    "widget_compute_db_queries_total": "DB queries run computing widget payloads, by widget type",
+    "widget_compute_db_seconds_total": "DB time spent computing widget payloads, by widget type",
+    "cache_requests_total": "Cache lookups by cache and result",
+    "db_slow_queries_total": "Queries slower than INSTRUMENTATION_SLOW_QUERY_MS",
+}
+
+
+# ---------- registro ----------
+
+class Registry:
+    """Contadores e histogramas do processo; chave = (nome, labels ordenados)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}  # contagem por bucket (não acumulada) + [soma, total]
+        self.flushed_at = 0.0
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            series = self.histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {"counters": dict(self.counters), "histograms": {k: list(v) for k, v in self.histograms.items()}}
+
+    def merge(self, snapshot, sign=1):
+        with self.lock:
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + sign * value
+            for key, values in snapshot["histograms"].items():
+                series = self.histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+                for i, value in enumerate(values):
+                    series[i] += sign * value
+
+
+REGISTRY = Registry()
+# processo filho (prefork do Celery/gunicorn) não herda as séries do pai
+os.register_at_fork(after_in_child=REGISTRY.reset)
+
+
+def _process():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def shared_cache():
+    """O cache é visto por todos os processos? (LocMem/Dummy: cada processo só enxerga o seu)."""
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def flush(force=False):
+    """Publica o snapshot do processo no cache (no máximo a cada INSTRUMENTATION_FLUSH_SECONDS)."""
+    now = time.monotonic()
+    if not force and now - REGISTRY.flushed_at < settings.INSTRUMENTATION_FLUSH_SECONDS:
+        return
+    REGISTRY.flushed_at = now
+    process = _process()
+    retired_key = RETIRED_KEY.format(process=process)
+    if (retired := cache.get(retired_key)) is not None:
+        # ocioso, não morto: o que já foi para o acumulado sai daqui
+        REGISTRY.merge(retired, sign=-1)
+        cache.delete(retired_key)
+    cache.set(SNAPSHOT_KEY.format(process=process), {**REGISTRY.snapshot(), "at": time.time()}, None)
+    # índice refeito a cada flush: uma escrita concorrente perdida se corrige no próximo
+    index = cache.get(INDEX_KEY) or []
+    if process not in index:
+        cache.set(INDEX_KEY, [*index, process], None)
+
+
+def collect():
+    """Registro com o acumulado dos processos que saíram mais os snapshots dos ativos."""
+    flush(force=True)
+    index = cache.get(INDEX_KEY) or []
+    snapshots = cache.get_many([SNAPSHOT_KEY.format(process=p) for p in index])
+    accumulated = Registry()
+    accumulated.merge(cache.get(ACCUMULATED_KEY) or {"counters": {}, "histograms": {}})
+    stale_before = time.time() - settings.INSTRUMENTATION_PROCESS_TIMEOUT
+    retired = {}
+    for process in index:
+        key = SNAPSHOT_KEY.format(process=process)
+        if key in snapshots and snapshots[key].get("at", 0) < stale_before:
+            retired[process] = snapshots.pop(key)
+    if retired:
+        for snapshot in retired.values():
+            accumulated.merge(snapshot)
+        cache.set(ACCUMULATED_KEY, accumulated.snapshot(), None)
+        cache.set_many({RETIRED_KEY.format(process=p): s for p, s in retired.items()}, RETIRED_TIMEOUT)
+        cache.delete_many([SNAPSHOT_KEY.format(process=p) for p in retired])
+    alive = [p for p in index if SNAPSHOT_KEY.format(process=p) in snapshots]
+    if len(alive) != len(index):
+        cache.set(INDEX_KEY, alive, None)
+    for snapshot in snapshots.values():
+        accumulated.merge(snapshot)
+    return accumulated
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render(registry):
+    """Formato texto de exposição do Prometheus (0.0.4)."""
+    lines, seen = [], set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(registry.counters.items()):
+        header(name, "counter")
+        lines.append(f"{name}{_labels(labels)} {value:g}")
+    for (name, labels), series in sorted(registry.histograms.items()):
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(BUCKETS, series):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, le=f'{bound:g}')} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {series[-1]}")
+        lines.append(f"{name}_sum{_labels(labels)} {series[-2]:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {series[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- tempo por request/task ----------
+
+class Timing:
+    __slots__ = ("label", "started", "queries", "db_seconds", "cache_hits", "cache_misses")
+
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = self.cache_misses = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, elapsed):
+        parts = [f"app;dur={elapsed * 1000:.1f}",
+                 f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"']
+        if self.cache_hits or self.cache_misses:
+            parts.append(f'cache;desc="{self.cache_hits} hit, {self.cache_misses} miss"')
+        return ", ".join(parts)
+
+
+_current = ContextVar("instrumentation_timing", default=None)
+
+
+def _execute(execute, sql, params, many, context):
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - t0
+        timing = _current.get()
+        if timing is not None:
+            timing.queries += 1
+            timing.db_seconds += elapsed
+        if 0 < settings.INSTRUMENTATION_SLOW_QUERY_MS <= elapsed * 1000:
+            REGISTRY.inc("db_slow_queries_total")
+            logger.warning("slow query (%.0f ms, %s): %s", elapsed * 1000, timing.label if timing else "-",
+                           sql[:2000])
+
+
+def install_db_wrappers():
+    # conexões são por thread: confere a cada request/task (barato) em vez de uma vez só
+    for alias in connections:
+        wrappers = connections[alias].execute_wrappers
+        if _execute not in wrappers:
+            wrappers.append(_execute)
+
+
+def record_cache(name, hit):
+    """Conta um acesso a cache (``name`` = qual cache) no request/task atual e no /metrics."""
+    REGISTRY.inc("cache_requests_total", cache=name, result="hit" if hit else "miss")
+    if (timing := _current.get()) is not None:
+        if hit:
+            timing.cache_hits += 1
+        else:
+            timing.cache_misses += 1
+
+
+@contextmanager
+def span(name, **labels):
+    """Tempo e banco de um trecho (ex.: cálculo de um widget) em ``<name>_duration_seconds``/``<name>_db_*``."""
+    timing = _current.get()
+    queries, db_seconds = (timing.queries, timing.db_seconds) if timing else (0, 0.0)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(f"{name}_duration_seconds", time.perf_counter() - t0, **labels)
+        if timing is not None:
+            REGISTRY.inc(f"{name}_db_queries_total", timing.queries - queries, **labels)
+            REGISTRY.inc(f"{name}_db_seconds_total", timing.db_seconds - db_seconds, **labels)
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        install_db_wrappers()
+        timing = Timing(request.path)
+        token = _current.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = timing.elapsed()
+
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        REGISTRY.inc("http_requests_total", view=view, method=request.method, status=response.status_code)
+        REGISTRY.observe("http_request_duration_seconds", elapsed, view=view)
+        REGISTRY.inc("http_db_queries_total", timing.queries, view=view)
+        REGISTRY.inc("http_db_seconds_total", timing.db_seconds, view=view)
+        if not response.streaming:
+            REGISTRY.inc("http_response_bytes_total", len(response.content), view=view)
+        response.headers["Server-Timing"] = timing.server_timing(elapsed)
+        flush()
+        return response
+
+
+# ---------- Celery ----------
+
+_tasks = {}
+
+
+@task_prerun.connect
+def _task_started(task_id=None, task=None, **kwargs):
+    install_db_wrappers()
+    timing = Timing(task.name)
+    _tasks[task_id] = (timing, _current.set(timing))
+
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, state=None, **kwargs):
+    timing, token = _tasks.pop(task_id, (None, None))
+    if timing is None:
+        return
+    _current.reset(token)
+    REGISTRY.inc("celery_tasks_total", task=task.name, state=state or "UNKNOWN")
+    REGISTRY.observe("celery_task_duration_seconds", timing.elapsed(), task=task.name)
+    REGISTRY.inc("celery_task_db_queries_total", timing.queries, task=task.name)
+    REGISTRY.inc("celery_task_db_seconds_total", timing.db_seconds, task=task.name)
+    # worker não tem request para publicar depois: publica ao fim de cada task
+    flush(force=True)
+
+
+# ---------- /metrics ----------
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if not settings.DEBUG and not token:
+        return HttpResponse("Set METRICS_TOKEN to expose /metrics.\n", status=503, content_type="text/plain")
+    if not settings.DEBUG and not shared_cache():
+        # cada processo publica no cache: com cache local o scrape veria só este processo
+        return HttpResponse("/metrics needs a shared cache (CACHE_REDIS_URL).\n", status=503,
+                            content_type="text/plain")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return HttpResponse(status=401, headers={"WWW-Authenticate": "Bearer"})
+    return HttpResponse(render(collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,50 @@
+# backend/config/middleware.py
+"""Compressão das respostas negociada por Accept-Encoding: brotli ou gzip.
+
+Respostas menores que ``COMPRESSION_MIN_SIZE`` saem como estão. brotli é
+opcional (pacote ``brotli``); sem ele, ou se o cliente não aceitar ``br``, vale
+o gzip do Django (que também cuida das respostas em streaming).
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+
+def accepts(accept_encoding, coding):
+    """``coding`` aparece em Accept-Encoding sem ``q=0``?"""
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        if name.strip().lower() != coding:
+            continue
+        q = params.strip().lower().removeprefix("q=")
+        try:
+            return float(q) > 0 if q else True
+        except ValueError:
+            return False
+    return False
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if (brotli is None or response.streaming or response.has_header("Content-Encoding")
+                or not accepts(request.META.get("HTTP_ACCEPT_ENCODING", ""), "br")):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        # JSON com token no header (não em cookie): sem o padding anti-BREACH do gzip
+        compressed = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        if (etag := response.get("ETag")) and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag  # representação comprimida: ETag fraco (RFC 9110 8.8.1)
+        response.headers["Content-Encoding"] = "br"
+        return response
@@ -0,0 +1,80 @@
+# backend/config/renderers.py
+"""Renderer/parser JSON com orjson e inserção de JSON já codificado.
+
+``RawJSON`` embrulha bytes JSON prontos (ex.: ``WidgetCache.payload_json``); o
+renderer os copia para a resposta sem decodificar/recodificar. orjson é opcional:
+sem ele tudo cai no JSONRenderer/JSONParser do DRF (mesmo formato de saída).
+"""
+import json
+import re
+import uuid
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z if orjson else 0
+
+
+class RawJSON:
+    """Valor JSON já codificado, inserido como está pelo ``ORJSONRenderer``."""
+    __slots__ = ("encoded",)
+
+    def __init__(self, encoded):
+        self.encoded = bytes(encoded)
+
+
+def dumps(data):
+    """bytes JSON compactos de ``data`` (o formato guardado em ``WidgetCache.payload_json``)."""
+    if orjson:
+        return orjson.dumps(data, default=JSONEncoder().default, option=OPTIONS)
+    return json.dumps(data, cls=JSONEncoder, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def encode(data, indent=None):
+    """Codifica ``data`` trocando cada RawJSON por um marcador e os marcadores pelos bytes no fim."""
+    fragments = []
+    marker = f"rawjson-{uuid.uuid4().hex}-"
+    fallback = JSONEncoder().default
+
+    def default(obj):
+        if isinstance(obj, RawJSON):
+            fragments.append(obj.encoded)
+            return f"{marker}{len(fragments) - 1}"
+        return fallback(obj)
+
+    if orjson:
+        out = orjson.dumps(data, default=default, option=OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+    else:
+        out = json.dumps(data, default=default, indent=indent, ensure_ascii=False,
+                         separators=(",", ": ") if indent else (",", ":")).encode()
+    if fragments:
+        out = re.sub(rb'"%s(\d+)"' % marker.encode(), lambda m: fragments[int(m[1])], out)
+    # como o JSONRenderer do DRF: separadores de linha Unicode escapados (JSON embutido em <script>)
+    return out.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        return encode(data, self.get_indent(accepted_media_type, renderer_context))
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -42,8 +42,13 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # por fora de tudo: Server-Timing e /metrics contam o request inteiro
+    'config.instrumentation.InstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # comprime por último (na volta) e antes disso responde 304 pelos ETag/Last-Modified das views
+    'config.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,6 +57,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# br/gzip negociado (config.middleware); respostas menores que isso não compensam
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "5"))
+
+# Instrumentação (config.instrumentation): queries acima disso vão para o log (0 = desligado);
+# cada processo publica suas séries no cache no máximo a cada FLUSH_SECONDS; sem flush há
+# PROCESS_TIMEOUT o processo vai para o acumulado. /metrics exige "Authorization: Bearer
+# <METRICS_TOKEN>"; fora do DEBUG, sem token ou sem cache compartilhado (Redis) responde 503
+INSTRUMENTATION_SLOW_QUERY_MS = int(os.environ.get("INSTRUMENTATION_SLOW_QUERY_MS", "500"))
+INSTRUMENTATION_FLUSH_SECONDS = float(os.environ.get("INSTRUMENTATION_FLUSH_SECONDS", "10"))
+INSTRUMENTATION_PROCESS_TIMEOUT = int(os.environ.get("INSTRUMENTATION_PROCESS_TIMEOUT", str(6 * 3600)))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 CORS_ALLOW_ALL_ORIGINS = os.environ.get("CORS_ALLOW_ALL_ORIGINS", "0") == "1"
 
 CORS_ALLOWED_ORIGINS = [
@@ -67,8 +85,24 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": ("rest_framework_simplejwt.authentication.JWTAuthentication",),
     "DEFAULT_PERMISSION_CLASSES":     ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_FILTER_BACKENDS":        ["django_filters.rest_framework.DjangoFilterBackend"],
+    # orjson (config.renderers); sem o pacote instalado cai no JSON do DRF
+    "DEFAULT_RENDERER_CLASSES":       ("config.renderers.ORJSONRenderer", "rest_framework.renderers.BrowsableAPIRenderer"),
+    "DEFAULT_PARSER_CLASSES":         ("config.renderers.ORJSONParser", "rest_framework.parsers.FormParser",
+                                       "rest_framework.parsers.MultiPartParser"),
 }
 
+# Cache (Redis em produção; locmem em dev/testes)
+if CACHE_REDIS_URL := os.environ.get("CACHE_REDIS_URL"):
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": CACHE_REDIS_URL}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+# resultado/ETag das views de analytics (analytics.cache): as versões dos dados moram no cache, então
+# no LocMem cada processo teria as suas e serviria dado velho; sem Redis fica desligado (0)
+ANALYTICS_CACHE_TIMEOUT = int(os.environ.get("ANALYTICS_CACHE_TIMEOUT", "300" if CACHE_REDIS_URL else "0"))
+# memberships por usuário (accounts.tenancy); signals de Membership invalidam antes. Só com
+# cache compartilhado: no LocMem a invalidação não chega aos outros processos (0 = por request)
+TENANCY_CACHE_TIMEOUT = int(os.environ.get("TENANCY_CACHE_TIMEOUT", "300" if CACHE_REDIS_URL else "0"))
+
 # Redis / Celery
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/1")
@@ -147,6 +181,7 @@ STATIC_URL = "/static/"
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 ASGI_APPLICATION = "config.asgi.application"
+# o push sai dos workers Celery para os processos ASGI: precisa do Redis (os testes trocam por em memória)
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -155,13 +190,63 @@ CHANNEL_LAYERS = {
 }
 
 
+# Refresh de widgets: o beat roda refresh_due_widgets a cada tick, que agrupa
+# os widgets vencidos (refresh_seconds) por org/filtros e dispara em lotes.
+DASHBOARDS_REFRESH_TICK_SECONDS = int(os.environ.get("DASHBOARDS_REFRESH_TICK_SECONDS", "60"))
+DASHBOARDS_REFRESH_BATCH_SIZE = int(os.environ.get("DASHBOARDS_REFRESH_BATCH_SIZE", "50"))
+# agregação incremental: recálculo completo periódico e teto de eventos novos somados em Python
+DASHBOARDS_RECONCILE_SECONDS = int(os.environ.get("DASHBOARDS_RECONCILE_SECONDS", "3600"))
+DASHBOARDS_INCREMENTAL_MAX_ROWS = int(os.environ.get("DASHBOARDS_INCREMENTAL_MAX_ROWS", "50000"))
+
+# SalesEvent: partições mensais criadas com antecedência (Postgres, após
+# ``manage.py sales_partitions --convert``) e retenção por org
+# (Organization.sales_retention_days). "detach" tira a partição vencida do
+# caminho das consultas sem apagá-la.
+ANALYTICS_PARTITION_MONTHS_AHEAD = int(os.environ.get("ANALYTICS_PARTITION_MONTHS_AHEAD", "3"))
+ANALYTICS_RETENTION_ACTION = os.environ.get("ANALYTICS_RETENTION_ACTION", "drop")  # drop | detach
+# Tier frio: meses fechados há mais de N meses vão para Parquet em MEDIA_ROOT (0 = desligado; requer pyarrow)
+ANALYTICS_ARCHIVE_AFTER_MONTHS = int(os.environ.get("ANALYTICS_ARCHIVE_AFTER_MONTHS", "0"))
+
 CELERY_BEAT_SCHEDULE = {
-    "refresh-widgets": {
-        "task": "dashboards.tasks.refresh_widget",
-        "schedule": 60.0,   # a cada 60s roda por id (vamos chamar individualmente do seed ou via mgmt)
-        "args": (),         # (opcional: você pode ter um task que varre todos os widgets)
-    }
+    "refresh-due-widgets": {
+        "task": "dashboards.tasks.refresh_due_widgets",
+        "schedule": float(DASHBOARDS_REFRESH_TICK_SECONDS),
+    },
+    "ensure-sales-partitions": {
+        "task": "analytics.tasks.ensure_sales_partitions",
+        "schedule": 24 * 3600.0,
+    },
+    "apply-sales-retention": {
+        "task": "analytics.tasks.apply_sales_retention",
+        "schedule": 24 * 3600.0,
+    },
+    "archive-sales-events": {
+        "task": "analytics.tasks.archive_sales_events",
+        "schedule": 24 * 3600.0,
+    },
+    "expire-reports": {
+        "task": "analytics.tasks.expire_reports",
+        "schedule": 600.0,
+    },
 }
 
+# Analytics: lê dos rollups diários quando a granularidade do filtro permite
+ANALYTICS_USE_ROLLUPS = os.environ.get("ANALYTICS_USE_ROLLUPS", "1") == "1"
+# Sketches dos rollups (clientes únicos e percentis): 2**p registradores do HyperLogLog
+# (erro ~1.6% com 12) e erro relativo do DDSketch. Mudou = rodar build_rollups.
+ANALYTICS_HLL_PRECISION = int(os.environ.get("ANALYTICS_HLL_PRECISION", "12"))
+ANALYTICS_DDSKETCH_ACCURACY = float(os.environ.get("ANALYTICS_DDSKETCH_ACCURACY", "0.01"))
+
+# Ingestão em lote de SalesEvent (POST /api/analytics/sales-events/ingest/)
+ANALYTICS_INGEST_BATCH_SIZE = int(os.environ.get("ANALYTICS_INGEST_BATCH_SIZE", "5000"))
+ANALYTICS_INGEST_MAX_BATCH_SIZE = int(os.environ.get("ANALYTICS_INGEST_MAX_BATCH_SIZE", "50000"))
+ANALYTICS_INGEST_USE_COPY = os.environ.get("ANALYTICS_INGEST_USE_COPY", "1") == "1"
+
+# Relatório em processing há mais que isso (segundos) é dado como perdido (worker morreu) e vira failed
+ANALYTICS_REPORT_TIMEOUT = int(os.environ.get("ANALYTICS_REPORT_TIMEOUT", "1800"))
+
+# Import de arquivos de DataSource (linhas por bloco lido/gravado)
+ANALYTICS_IMPORT_CHUNK_SIZE = int(os.environ.get("ANALYTICS_IMPORT_CHUNK_SIZE", "10000"))
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
@@ -4,6 +4,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from config.instrumentation import metrics_view
+
 # IMPORTA AS VIEWS PARA OS ALIASES
 from analytics.views import (
     DataSourceListCreate, DataSourceDetail,
@@ -16,6 +18,7 @@ urlpatterns = [
     path("api/accounts/", include("accounts.urls")),
     path("api/analytics/", include("analytics.urls")),  # já existia
     path("api/", include("dashboards.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 # === ALIASES PARA NÃO QUEBRAR O FRONT ===
@@ -0,0 +1,28 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+
+@database_sync_to_async
+def _user_for_token(raw_token):
+    auth = JWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+class JWTQueryAuthMiddleware(BaseMiddleware):
+    """WebSocket não manda header Authorization do browser: aceita ``?token=<access>``.
+
+    Sem token válido mantém o usuário que vier da sessão (AuthMiddlewareStack).
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get("query_string", b"").decode()).get("token")
+        if token and (user := await _user_for_token(token[0])) is not None:
+            scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
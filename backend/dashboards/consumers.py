@@ -0,0 +1,65 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from accounts import tenancy
+from config.renderers import RawJSON, encode
+from .models import Dashboard, WidgetCache
+
+
+def dashboard_group(dashboard_id):
+    return f"dashboard-{dashboard_id}"
+
+
+class DashboardConsumer(AsyncJsonWebsocketConsumer):
+    """ws/dashboards/<id>/: snapshot na conexão e depois só os widgets que mudaram.
+
+    As mensagens chegam pelo grupo do dashboard, publicadas por
+    ``dashboards.tasks`` quando o hash do payload de um widget muda.
+    """
+
+    async def connect(self):
+        self.dashboard_id = int(self.scope["url_route"]["kwargs"]["dashboard_id"])
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated or not await self._is_member(user):
+            await self.close(code=4403)
+            return
+        self.group = dashboard_group(self.dashboard_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+        await self.send_json({"type": "snapshot", "widgets": await self._snapshot()})
+
+    @classmethod
+    async def encode_json(cls, content):
+        # snapshot leva os payload_json como estão (RawJSON), sem decodificar
+        return encode(content).decode()
+
+    async def disconnect(self, code):
+        if group := getattr(self, "group", None):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def widgets_update(self, event):
+        await self.send_json({"type": "update", "widgets": event["widgets"], "updated_at": event["updated_at"]})
+
+    @database_sync_to_async
+    def _is_member(self, user):
+        org_id = Dashboard.objects.filter(id=self.dashboard_id).values_list("org_id", flat=True).first()
+        return org_id is not None and any(o.id == org_id for o in tenancy.user_memberships(user.pk))
+
+    @database_sync_to_async
+    def _snapshot(self):
+        caches = WidgetCache.objects.filter(widget__dashboard_id=self.dashboard_id)
+        return [{"widget": c["widget_id"], "payload": RawJSON(c["payload_json"])}
+                for c in caches.values("widget_id", "payload_json").order_by("widget_id")]
+
+
+def publish_widget_updates(changed, updated_at):
+    """changed: {dashboard_id: [{"widget": id, "payload": {...}}, ...]} -> uma mensagem por dashboard."""
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    send = async_to_sync(layer.group_send)
+    for dashboard_id, widgets in changed.items():
+        send(dashboard_group(dashboard_id), {"type": "widgets.update", "widgets": widgets, "updated_at": updated_at})
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetcache',
+            name='payload_hash',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
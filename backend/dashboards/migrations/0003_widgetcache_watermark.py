@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0002_widgetcache_payload_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetcache',
+            name='checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='widgetcache',
+            name='data_watermark',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0003_widgetcache_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetcache',
+            name='reconciled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='widgetcache',
+            name='state',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:40
+
+import json
+
+from django.db import migrations, models
+
+
+def encode_payloads(apps, schema_editor):
+    WidgetCache = apps.get_model("dashboards", "WidgetCache")
+    caches = list(WidgetCache.objects.only("id", "payload"))
+    for cache in caches:
+        cache.payload_json = json.dumps(cache.payload, separators=(",", ":"), ensure_ascii=False).encode()
+    WidgetCache.objects.bulk_update(caches, ["payload_json"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0004_widgetcache_partial_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetcache',
+            name='payload_json',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.RunPython(encode_payloads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0005_widgetcache_payload_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dashboard',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='widget',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:30
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_next_refresh(apps, schema_editor):
+    """next_refresh_at = checked_at (ou updated_at) + refresh_seconds, um UPDATE por intervalo distinto."""
+    Widget = apps.get_model("dashboards", "Widget")
+    WidgetCache = apps.get_model("dashboards", "WidgetCache")
+    for seconds in Widget.objects.values_list("refresh_seconds", flat=True).distinct().order_by():
+        caches = WidgetCache.objects.filter(widget__refresh_seconds=seconds)
+        caches.update(next_refresh_at=Coalesce("checked_at", "updated_at") + timedelta(seconds=seconds))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0006_dashboard_widget_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetcache',
+            name='next_refresh_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_next_refresh, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,13 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from accounts.models import Organization
+from .query import QueryError, compile_plan
 
 class Dashboard(models.Model):
     org   = models.ForeignKey(Organization, on_delete=models.CASCADE)
     title = models.CharField(max_length=120, default="Analytics")
     theme = models.JSONField(default=dict)  # cores etc.
+    updated_at = models.DateTimeField(auto_now=True)  # entra no ETag/Last-Modified da API
     def __str__(self): return f"{self.org.name} • {self.title}"
 
 class Widget(models.Model):
@@ -18,8 +21,27 @@ class Widget(models.Model):
     config    = models.JSONField(default=dict)
     position  = models.JSONField(default=dict)  # {x,y,w,h} caso queira gridster
     refresh_seconds = models.IntegerField(default=300)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def clean(self):
+        # o mesmo compilador do refresh: config que viraria {"error": ...} não passa no admin
+        try:
+            compile_plan(self.type, self.config)
+        except QueryError as exc:
+            raise ValidationError({"config": str(exc)})
 
 class WidgetCache(models.Model):
     widget   = models.OneToOneField(Widget, on_delete=models.CASCADE, related_name="cache")
     payload  = models.JSONField(default=dict)   # dados prontos pro gráfico
-    updated_at = models.DateTimeField(auto_now=True)
+    # o mesmo payload já codificado: a API copia os bytes na resposta sem decodificar (config.renderers.RawJSON)
+    payload_json = models.BinaryField(default=b"", blank=True)
+    payload_hash = models.CharField(max_length=40, blank=True)  # só muda quando o payload muda
+    # estado dos dados da org + spec do widget quando o payload foi calculado
+    data_watermark = models.CharField(max_length=64, blank=True)
+    # agregados parciais (KPI: soma/contagem; timeseries: soma por bucket) para somar só eventos novos
+    state = models.JSONField(default=dict, blank=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True)  # último recálculo completo
+    updated_at = models.DateTimeField(auto_now=True)  # última vez que o payload mudou
+    checked_at = models.DateTimeField(null=True, blank=True)  # última verificação (mesmo sem mudança)
+    # checked_at + widget.refresh_seconds: o beat acha os vencidos pelo índice; NULL = vencido já
+    next_refresh_at = models.DateTimeField(null=True, blank=True, db_index=True)
@@ -0,0 +1,250 @@
+# backend/dashboards/query.py
+"""Motor de consulta declarativo dos widgets.
+
+O config de um widget declara medidas, dimensões, granularidade, filtros e top-N::
+
+    {"measures": ["sum_amount", "margin"], "dimensions": ["region"], "top": 5,
+     "order_by": "margin", "channels": ["web"], "date_from": "2026-01-01"}
+
+``compile_plan`` valida e normaliza o config num ``Plan`` (cacheado pelo hash de
+tipo + config); as chaves antigas (``metric``, ``group_by``) viram os mesmos
+planos. Cada medida se decompõe em componentes somáveis (amount, cost, count),
+em sketches mergeáveis dos rollups (clientes únicos, percentis de amount; ver
+``analytics.sketches``) ou numa contagem distinta de dimensão. ``scan_shape`` junta os planos de widgets
+com os mesmos filtros num único scan agregado só com as colunas pedidas, e
+``aggregate`` agrupa as linhas desse scan para cada plano.
+"""
+import functools
+import json
+import zoneinfo
+from datetime import datetime, time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from analytics.sketches import DDSketch, HyperLogLog
+
+DIMENSIONS = ("product", "region", "channel")
+COMPONENTS = ("amount", "cost", "count", "customers", "amounts")
+# componentes que são sketches: o banco não soma, o scan traz um por bucket do rollup (ou evento)
+SKETCHES = {"customers": HyperLogLog, "amounts": DDSketch}
+PERCENTILES = (50, 75, 90, 95, 99)
+GRAINS = ("hour", "day", "week", "month")
+# chaves do config que definem o conjunto de eventos lido pelo widget
+FILTER_KEYS = ("date_from", "date_to", "channels", "products", "regions")
+TYPES = ("kpi", "timeseries", "bar", "pie", "table")
+ZERO = {"amount": 0.0, "cost": 0.0, "count": 0}
+# formato de plano/estado parcial: entra na marca d'água dos caches (mudou = recálculo completo)
+VERSION = 2
+
+
+class QueryError(ValueError):
+    pass
+
+
+class Measure(NamedTuple):
+    components: tuple
+    fn: object = None
+    distinct: str = None  # dimensão contada (distinct_*)
+
+
+def _ratio(a, b):
+    return a / b if b else 0.0
+
+
+def _quantile(sketch, q):
+    value = sketch.quantile(q)
+    return round(value, 2) if value is not None else 0.0
+
+
+MEASURES = {
+    "sum_amount": Measure(("amount",), lambda t: t["amount"]),
+    "avg_amount": Measure(("amount", "count"), lambda t: _ratio(t["amount"], t["count"])),
+    "count": Measure(("count",), lambda t: t["count"]),
+    "sum_cost": Measure(("cost",), lambda t: t["cost"]),
+    "margin": Measure(("amount", "cost"), lambda t: t["amount"] - t["cost"]),
+    "margin_pct": Measure(("amount", "cost"), lambda t: _ratio(100 * (t["amount"] - t["cost"]), t["amount"])),
+    # aproximadas: HyperLogLog e DDSketch (erro em ANALYTICS_HLL_PRECISION/ANALYTICS_DDSKETCH_ACCURACY)
+    "unique_customers": Measure(("customers",), lambda t: t["customers"].estimate()),
+    **{f"p{q}_amount": Measure(("amounts",), lambda t, q=q: _quantile(t["amounts"], q / 100)) for q in PERCENTILES},
+    # linhas zeradas do rollup (eventos removidos) não contam: precisa da contagem
+    **{f"distinct_{d}": Measure(("count",), distinct=d) for d in DIMENSIONS},
+}
+
+
+class Plan(NamedTuple):
+    type: str
+    measures: tuple
+    dimensions: tuple
+    grain: str          # só timeseries
+    tz: str             # fuso dos buckets (timeseries)
+    filters: dict       # FILTER_KEYS -> valor do config
+    top: int
+    order_by: str
+    components: tuple   # união dos componentes das medidas, na ordem de COMPONENTS
+    distinct: tuple     # dimensões com contagem distinta
+
+    @property
+    def zone(self):
+        return zoneinfo.ZoneInfo(self.tz)
+
+    @property
+    def filter_key(self):
+        return filter_key(self.filters)
+
+    @property
+    def shares_day_rows(self):
+        # as linhas do scan compartilhado são dias no TIME_ZONE do projeto
+        if self.type == "timeseries":
+            return self.grain != "hour" and self.tz == settings.TIME_ZONE
+        return self.type != "table"
+
+    @property
+    def incremental(self):
+        # estado parcial somável em JSON (aceita somar só os eventos novos); contagem distinta e sketch não
+        return self.type in ("kpi", "timeseries") and not self.distinct and not SKETCHES.keys() & set(self.components)
+
+
+def zero(component):
+    """Total inicial de um componente (sketch novo a cada chamada: ele é somado in-place)."""
+    return SKETCHES[component]() if component in SKETCHES else ZERO[component]
+
+
+def add_event(totals, e, components):
+    """Soma um evento (dict de SalesEvent) aos totais de um grupo."""
+    for c in components:
+        if c == "count":
+            totals[c] += 1
+        elif c == "customers":
+            if e["customer"]:
+                totals[c].add(e["customer"])
+        elif c == "amounts":
+            totals[c].add(e["amount"])
+        else:
+            totals[c] += e[c]
+
+
+def filter_key(cfg):
+    return json.dumps({k: (cfg or {}).get(k) for k in FILTER_KEYS}, sort_keys=True)
+
+
+def parse_bound(value):
+    """Limite de filtro como datetime aware (data sem hora = meia-noite no fuso do projeto)."""
+    if not value:
+        return None
+    dt = parse_datetime(str(value))
+    if dt is None and (day := parse_date(str(value))) is not None:
+        dt = datetime.combine(day, time.min)
+    if dt is None:
+        return None
+    return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+
+def compile_plan(type, config):
+    """Plano validado do widget; QueryError se o config não fizer sentido para o tipo."""
+    return _compile(json.dumps([type, config or {}], sort_keys=True))
+
+
+def _names(cfg, key, default):
+    value = cfg.get(key, default)
+    if value is None:
+        return ()
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise QueryError(f"{key}: expected a list of names")
+    if len(set(value)) != len(value):
+        raise QueryError(f"{key}: duplicated names")
+    return tuple(value)
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile(raw):
+    type, cfg = json.loads(raw)
+    if type not in TYPES:
+        raise QueryError(f"unknown widget type {type!r}")
+    if not isinstance(cfg, dict):
+        raise QueryError("config must be an object")
+
+    filters = {k: cfg.get(k) for k in FILTER_KEYS}
+    for key in ("date_from", "date_to"):
+        if filters[key] and parse_bound(filters[key]) is None:
+            raise QueryError(f"{key}: invalid date/datetime {filters[key]!r}")
+    for key in ("channels", "products", "regions"):
+        _names(cfg, key, None)
+    if type == "table":
+        return Plan(type, (), (), None, settings.TIME_ZONE, filters, None, None, (), ())
+
+    measures = _names(cfg, "measures", [cfg.get("metric", "sum_amount")] if type == "kpi" else ["sum_amount"])
+    if not measures:
+        raise QueryError("measures: at least one measure is required")
+    if unknown := [m for m in measures if m not in MEASURES]:
+        raise QueryError(f"measures: unknown {', '.join(unknown)} (known: {', '.join(MEASURES)})")
+
+    default_dimension = {"bar": "product", "pie": "channel"}.get(type)
+    dimensions = _names(cfg, "dimensions", [cfg.get("group_by", default_dimension)] if default_dimension else [])
+    if unknown := [d for d in dimensions if d not in DIMENSIONS]:
+        raise QueryError(f"dimensions: unknown {', '.join(unknown)} (known: {', '.join(DIMENSIONS)})")
+    if type in ("bar", "pie") and len(dimensions) != 1:
+        raise QueryError(f"{type} widgets take exactly one dimension")
+    if type in ("kpi", "timeseries") and dimensions:
+        raise QueryError(f"{type} widgets take no dimensions")
+
+    grain = tz = None
+    if type == "timeseries":
+        grain = cfg.get("granularity") or "day"
+        if grain not in GRAINS:
+            raise QueryError(f"granularity: expected one of {', '.join(GRAINS)}")
+        tz = cfg.get("timezone") or settings.TIME_ZONE
+        try:
+            zoneinfo.ZoneInfo(tz)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError, TypeError):
+            raise QueryError(f"timezone: unknown {tz!r}") from None
+
+    top = cfg.get("top", 10 if type == "bar" else None)
+    if top is not None and (not isinstance(top, int) or isinstance(top, bool) or top < 1):
+        raise QueryError("top: expected a positive integer")
+    order_by = cfg.get("order_by", measures[0])
+    if order_by not in measures:
+        raise QueryError("order_by: must be one of the widget measures")
+
+    used = {c for m in measures for c in MEASURES[m].components}
+    if grain and (grain == "hour" or tz != settings.TIME_ZONE) and SKETCHES.keys() & used:
+        # sketches só existem por dia no fuso do projeto (rollup); montar por evento não escala
+        raise QueryError(f"{', '.join(m for m in measures if SKETCHES.keys() & set(MEASURES[m].components))}: "
+                         f"only available for day/week/month timeseries in {settings.TIME_ZONE}")
+    distinct = {MEASURES[m].distinct for m in measures} - {None}
+    return Plan(type, measures, dimensions, grain, tz or settings.TIME_ZONE, filters, top, order_by,
+                tuple(c for c in COMPONENTS if c in used), tuple(d for d in DIMENSIONS if d in distinct))
+
+
+def scan_shape(plans):
+    """(por dia?, dimensões, componentes) do scan compartilhado que atende todos os ``plans``."""
+    dims = {d for p in plans for d in (*p.dimensions, *p.distinct)}
+    used = {c for p in plans for c in p.components}
+    return (any(p.grain for p in plans), tuple(d for d in DIMENSIONS if d in dims),
+            tuple(c for c in COMPONENTS if c in used))
+
+
+def aggregate(plan, rows, bucket=None):
+    """{(bucket, *dimensões): totais} com os componentes somados e os conjuntos das dimensões distintas."""
+    groups = {}
+    for r in rows:
+        key = (bucket(r) if bucket else None, *(r[d] for d in plan.dimensions))
+        totals = groups.get(key)
+        if totals is None:
+            totals = groups[key] = {**{c: zero(c) for c in plan.components}, **{d: set() for d in plan.distinct}}
+        for c in plan.components:
+            totals[c] += r[c]
+        if plan.distinct and r["count"]:
+            for d in plan.distinct:
+                totals[d].add(r[d])
+    return groups
+
+
+def value(measure, totals=None):
+    """Valor da medida nos totais de um grupo (grupo ausente = zero)."""
+    m = MEASURES[measure]
+    if totals is None:
+        return 0 if m.distinct else m.fn({c: zero(c) for c in m.components})
+    return len(totals[m.distinct]) if m.distinct else m.fn(totals)
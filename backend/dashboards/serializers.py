@@ -1,11 +1,33 @@
 from rest_framework import serializers
+from config.renderers import RawJSON
 from .models import Dashboard, Widget, WidgetCache
 
+class PayloadField(serializers.Field):
+    """Payload do cache: os bytes de ``payload_json`` vão direto para a resposta.
+
+    Só decodifica o JSONField quando o queryset adiou ``payload_json`` (ou o cache é anterior a ele).
+    """
+    def __init__(self, **kwargs):
+        super().__init__(source="*", read_only=True, **kwargs)
+
+    def to_representation(self, cache):
+        if "payload_json" not in cache.get_deferred_fields() and cache.payload_json:
+            return RawJSON(cache.payload_json)
+        return cache.payload
+
 class WidgetCacheSerializer(serializers.ModelSerializer):
+    payload = PayloadField()
+
     class Meta:
         model  = WidgetCache
         fields = ["payload","updated_at"]
 
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get("omit_payloads"):
+            fields.pop("payload")
+        return fields
+
 class WidgetSerializer(serializers.ModelSerializer):
     cache = WidgetCacheSerializer(read_only=True)
     class Meta:
@@ -0,0 +1,20 @@
+# backend/dashboards/signals.py
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from config.renderers import dumps
+from .models import Widget, WidgetCache
+
+
+@receiver(post_save, sender=Widget)
+def refresh_edited_widget(sender, instance, created, raw=False, **kwargs):
+    # refresh_seconds/config novos: vence já, o próximo tick recalcula next_refresh_at
+    if not created and not raw:
+        WidgetCache.objects.filter(widget=instance).update(next_refresh_at=None)
+
+
+@receiver(pre_save, sender=WidgetCache)
+def encode_payload(sender, instance, update_fields=None, **kwargs):
+    # save() completo mantém payload_json em dia; os caminhos em lote (dashboards.tasks) codificam sozinhos
+    if update_fields is None:
+        instance.payload_json = dumps(instance.payload)
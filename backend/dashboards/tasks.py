@@ -1,61 +1,497 @@
-from celery import shared_task
+import hashlib
+import json
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from celery import group, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate, TruncDay, TruncHour, TruncMonth, TruncWeek
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from . import query
+from .consumers import publish_widget_updates
 from .models import Widget, WidgetCache
-from analytics.models import SalesEvent
-from django.db.models import Sum, Avg, Count
-import pandas as pd
+from accounts.models import Organization
+from analytics.archive import cold_day_rows, cold_day_sketch_parts, cold_latest, cold_quarter_hours
+from analytics.models import SalesArchive, SalesEvent
+from analytics.rollups import add_sketch_parts, sales_rollup_queryset, sales_sketch_parts
+from analytics.sketches import DDSketch
+from config import instrumentation
+from config.renderers import dumps
 
-@shared_task
-def refresh_widget(widget_id: int):
-    w = Widget.objects.select_related("dashboard").get(id=widget_id)
-    cfg = w.config or {}
-    q = SalesEvent.objects.filter(org=w.dashboard.org)
+TABLE_LIMIT = 50
+# Trunc* do bucketing no banco (timeseries por hora ou em fuso diferente do projeto)
+GRANULARITIES = {"hour": TruncHour, "day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+MAX_BUCKETS = 10_000
+
+def _events(org_id, filters):
+    q = SalesEvent.objects.filter(org_id=org_id)
 
     # filtros básicos
-    if date_from := cfg.get("date_from"):
+    if date_from := filters.get("date_from"):
         q = q.filter(occurred_at__gte=date_from)
-    if date_to := cfg.get("date_to"):
+    if date_to := filters.get("date_to"):
         q = q.filter(occurred_at__lt=date_to)
-    if channels := cfg.get("channels"):
-        q = q.filter(channel__in=channels)
-
-    typ = w.type
-    payload = {}
-    if typ == "kpi":
-        metric = cfg.get("metric","sum_amount") # sum_amount|avg_amount|count
-        if metric == "sum_amount":
-            payload = {"value": float(q.aggregate(Sum("amount"))["amount__sum"] or 0)}
-        elif metric == "avg_amount":
-            payload = {"value": float(q.aggregate(Avg("amount"))["amount__avg"] or 0)}
-        elif metric == "count":
-            payload = {"value": int(q.count())}
-
-    elif typ == "timeseries":
-        # agrega por dia
-        df = pd.DataFrame(list(q.values("occurred_at","amount")))
-        if len(df):
-            df["day"] = df["occurred_at"].dt.tz_convert("UTC").dt.date if hasattr(df["occurred_at"].iloc[0],'tzinfo') else df["occurred_at"].dt.date
-            ts = df.groupby("day")["amount"].sum().reset_index()
-            payload = {"labels":[str(x) for x in ts["day"].tolist()],
-                       "series":[ts["amount"].round(2).tolist()]}
+    for key, lookup in (("channels", "channel__in"), ("products", "product__in"), ("regions", "region__in")):
+        if values := filters.get(key):
+            q = q.filter(**{lookup: values})
+    return q
+
+def _cold_filters(filters):
+    # mesmos filtros de _events para o tier frio (Parquet)
+    return {"since": query.parse_bound(filters.get("date_from")), "until": query.parse_bound(filters.get("date_to")),
+            "channels": filters.get("channels"), "products": filters.get("products"), "regions": filters.get("regions")}
+
+def _aggregates(components, count):
+    return {c: count if c == "count" else Sum(c) for c in components}
+
+def _grouped(q, keys, aggregates):
+    if keys:
+        return list(q.values(*keys).annotate(**aggregates).order_by())
+    # sem chaves values().annotate() agruparia por todas as colunas: um aggregate só
+    return [{k: v or 0 for k, v in q.aggregate(**aggregates).items()}]
+
+def _merge_rows(rows, extra, keys, components):
+    """Soma as linhas do tier frio (dia × todas as dimensões) às do banco, na chave do scan."""
+    merged = {tuple(r[k] for k in keys): dict(r) for r in rows}
+    for r in extra:
+        key = tuple(r[k] for k in keys)
+        if key in merged:
+            for c in components:
+                merged[key][c] += r[c]
         else:
-            payload = {"labels":[],"series":[]}
+            merged[key] = {**{k: r[k] for k in keys}, **{c: r[c] for c in components}}
+    return list(merged.values())
+
+def _sketch_rows(org_id, filters, rollup, keys, by_day, components, cold):
+    # rollup: uma linha por bucket com os sketches, somados aqui na chave do scan
+    if rollup is not None:
+        return _merge_rows([], rollup.values(*keys, *components).iterator(), keys, components)
+    # bruto: somas e partes dos sketches (clientes distintos, bins) agregadas no banco/pyarrow
+    sums = tuple(c for c in query.ZERO if c in components or c == "count")
+    q = _events(org_id, filters)
+    rows = _grouped(q.annotate(day=TruncDate("occurred_at")) if by_day else q, keys, _aggregates(sums, Count("id")))
+    parts = [sales_sketch_parts(q)]
+    if cold:
+        rows = _merge_rows(rows, cold_day_rows(org_id, **_cold_filters(filters)), keys, sums)
+        parts.append(cold_day_sketch_parts(org_id, DDSketch().log_gamma, **_cold_filters(filters)))
+    groups = {tuple(r[k] for k in keys): {**r, **{c: query.zero(c) for c in query.SKETCHES}} for r in rows}
+    for customers, bins in parts:
+        add_sketch_parts(groups, customers if "customers" in components else (),
+                         bins if "amounts" in components else (), lambda r: tuple(r[k] for k in keys), None)
+    return list(groups.values())
+
+def _grain_rows(org_id, filters, shape, cold=False):
+    """Um scan por conjunto de filtros, agrupado só pelo que os planos do grupo pedem (``query.scan_shape``).
+
+    Rollups já cobrem os meses arquivados; só o caminho bruto lê o Parquet (``cold``).
+    """
+    by_day, dims, components = shape
+    keys = ("day", *dims) if by_day else dims
+    rollup = sales_rollup_queryset(org_id, filters)
+    if query.SKETCHES.keys() & set(components):
+        return _sketch_rows(org_id, filters, rollup, keys, by_day, components, cold)
+    if rollup is not None:
+        return _grouped(rollup, keys, _aggregates(components, Sum("count")))
+    q = _events(org_id, filters)
+    if by_day:
+        q = q.annotate(day=TruncDate("occurred_at"))
+    rows = _grouped(q, keys, _aggregates(components, Count("id")))
+    if cold:
+        rows = _merge_rows(rows, cold_day_rows(org_id, **_cold_filters(filters)), keys, components)
+    return rows
+
+def _state(plan, groups):
+    """Estado parcial (mergeável) de um plano KPI/timeseries: componentes por bucket."""
+    return {"buckets": {(_bucket_key(key[0]) if plan.grain else ""): {c: totals[c] for c in plan.components}
+                        for key, totals in groups.items()}}
+
+def render_state(plan, state):
+    tz = plan.zone
+    groups = {((_parse_bucket(k, plan.grain, tz) if plan.grain else None),): totals
+              for k, totals in state["buckets"].items()}
+    return _render(plan, groups)
+
+def _render(plan, groups):
+    """Payload do tipo do widget a partir dos grupos de ``query.aggregate``."""
+    if plan.type == "kpi":
+        totals = groups.get((None,))
+        out = {"value": query.value(plan.measures[0], totals)}
+        if len(plan.measures) > 1:
+            out["values"] = {m: query.value(m, totals) for m in plan.measures}
+        return out
+    if plan.type == "timeseries":
+        return _timeseries_payload(plan, groups)
+
+    # bar/pie: uma dimensão, ordenada pela medida de order_by
+    ranked = sorted(((key[1], totals) for key, totals in groups.items()),
+                    key=lambda kv: query.value(plan.order_by, kv[1]), reverse=True)[:plan.top]
+    out = {"labels": [label for label, _ in ranked], "series": [query.value(plan.measures[0], t) for _, t in ranked]}
+    if len(plan.measures) > 1:
+        out["values"] = {m: [query.value(m, t) for _, t in ranked] for m in plan.measures}
+    return out
+
+# ---------- timeseries ----------
+
+def _floor(value, g):
+    """Início do bucket: datetime local para hour, date para o resto."""
+    if g == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    if isinstance(value, datetime):
+        value = value.date()
+    if g == "week":
+        return value - timedelta(days=value.weekday())
+    if g == "month":
+        return value.replace(day=1)
+    return value
+
+def _next(bucket, g):
+    if g == "hour":
+        # passo em UTC para atravessar DST sem criar horas inexistentes
+        return (bucket.astimezone(dt_timezone.utc) + timedelta(hours=1)).astimezone(bucket.tzinfo)
+    if g == "week":
+        return bucket + timedelta(days=7)
+    if g == "month":
+        return (bucket.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return bucket + timedelta(days=1)
+
+def _label(bucket, g):
+    if g == "hour":
+        return bucket.isoformat(timespec="minutes")
+    if g == "month":
+        return bucket.strftime("%Y-%m")
+    return str(bucket)
+
+def _bound(value, tz, g, exclusive=False):
+    """Bucket que contém o limite do filtro (date_to é exclusivo)."""
+    if not value:
+        return None
+    dt = parse_datetime(str(value))
+    if dt is None:
+        day = parse_date(str(value))
+        if day is None:
+            return None
+        dt = datetime.combine(day, time.min)
+    dt = timezone.make_aware(dt, tz) if timezone.is_naive(dt) else dt.astimezone(tz)
+    if exclusive:
+        dt -= timedelta(microseconds=1)
+    return _floor(dt.astimezone(tz), g)
+
+def _bucket_key(bucket):
+    return bucket.isoformat()
+
+def _parse_bucket(key, g, tz):
+    if g == "hour":
+        # volta para a ZoneInfo do widget (fromisoformat dá só um offset fixo)
+        return datetime.fromisoformat(key).astimezone(tz)
+    return date.fromisoformat(key)
+
+def _bucket_rows(org_id, plan, cold=False):
+    """Bucketing no banco (Trunc* com tzinfo) para hora ou fuso diferente do projeto."""
+    g, tz = plan.grain, plan.zone
+    q = (_events(org_id, plan.filters).annotate(bucket=GRANULARITIES[g]("occurred_at", tzinfo=tz))
+         .values("bucket", *plan.distinct).annotate(**_aggregates(plan.components, Count("id"))).order_by())
+    rows = [{**r, "bucket": _floor(r["bucket"].astimezone(tz), g)} for r in q]
+    if cold:
+        # o Parquet agrega por quarto de hora UTC; cada quarto cai inteiro num bucket local
+        rows += [{**r, "bucket": _floor(r["slot"].astimezone(tz), g)}
+                 for r in cold_quarter_hours(org_id, dims=plan.distinct, **_cold_filters(plan.filters))]
+    return rows
+
+def _timeseries_payload(plan, groups):
+    g, tz = plan.grain, plan.zone
+    start = _bound(plan.filters["date_from"], tz, g)
+    end = _bound(plan.filters["date_to"], tz, g, exclusive=True)
+    buckets = sorted(key[0] for key in groups)
+    if buckets:
+        start = start if start is not None else buckets[0]
+        end = end if end is not None else buckets[-1]
+    if start is None or end is None:
+        return {"labels":[],"series":[]}
+
+    # preenche buckets vazios com 0 (até MAX_BUCKETS; acima disso só os buckets com dados)
+    ts, bucket = [], start
+    while bucket <= end and len(ts) < MAX_BUCKETS:
+        ts.append(bucket)
+        bucket = _next(bucket, g)
+    if bucket <= end:
+        ts = buckets
+    # uma série por medida
+    return {"labels":[_label(b, g) for b in ts],
+            "series":[[round(query.value(m, groups[(b,)]), 2) if (b,) in groups else 0 for b in ts]
+                      for m in plan.measures]}
+
+def _table_payload(org_id, filters, cold=False):
+    rows = list(_events(org_id, filters).order_by("-occurred_at", "-id")
+                .values("id","occurred_at","product","channel","region","amount")[:TABLE_LIMIT])
+    if cold:
+        cold_filters = _cold_filters(filters)
+        if len(rows) == TABLE_LIMIT:
+            # nada do arquivo mais antigo que a última linha do banco entra na tabela
+            cold_filters["since"] = max(filter(None, [cold_filters["since"], rows[-1]["occurred_at"]]))
+        rows = sorted(rows + cold_latest(org_id, TABLE_LIMIT, **cold_filters),
+                      key=lambda r: (r["occurred_at"], r["id"]), reverse=True)[:TABLE_LIMIT]
+    for r in rows:
+        del r["id"]
+        r["occurred_at"] = r["occurred_at"].isoformat()
+    return {"rows": rows}
+
+def compute_payloads(widgets, states=None):
+    """Payloads de vários widgets com um único scan por (org, filtros).
+
+    Cada config vira um plano (``dashboards.query``); os planos com o mesmo filtro
+    compartilham um scan agregado com a união das dimensões e medidas pedidas (e a
+    consulta da tabela de pedidos recentes); cada payload é derivado em Python.
+    Orgs com meses arquivados também leem o Parquet nos caminhos brutos. Se
+    ``states`` for um dict, recebe o estado parcial dos planos incrementais.
+    Config inválido vira ``{"error": ...}``.
+    """
+    states = {} if states is None else states
+    payloads, plans, by_filters = {}, {}, {}
+    for w in widgets:
+        try:
+            plans[w.id] = query.compile_plan(w.type, w.config)
+        except query.QueryError as exc:
+            payloads[w.id] = {"error": str(exc)}
+            continue
+        by_filters.setdefault((w.dashboard.org_id, plans[w.id].filter_key), []).append(w)
+    archived = set(SalesArchive.objects.filter(org_id__in={org_id for org_id, _ in by_filters})
+                   .values_list("org_id", flat=True)) if by_filters else set()
+
+    for (org_id, _), members in by_filters.items():
+        filters = plans[members[0].id].filters
+        shape = query.scan_shape([plans[w.id] for w in members if plans[w.id].shares_day_rows])
+        cold = org_id in archived
+        rows = table = None
+        for w in members:
+            plan = plans[w.id]
+            # o scan compartilhado conta para o primeiro widget do grupo que o usa
+            with instrumentation.span("widget_compute", type=w.type):
+                if plan.type == "table":
+                    table = table if table is not None else _table_payload(org_id, filters, cold)
+                    payloads[w.id] = table
+                    continue
+                if plan.shares_day_rows:
+                    rows = rows if rows is not None else _grain_rows(org_id, filters, shape, cold)
+                    groups = query.aggregate(plan, rows, (lambda r, g=plan.grain: _floor(r["day"], g))
+                                             if plan.grain else None)
+                else:
+                    groups = query.aggregate(plan, _bucket_rows(org_id, plan, cold), lambda r: r["bucket"])
+                if plan.incremental:
+                    states[w.id] = _state(plan, groups)
+                    payloads[w.id] = render_state(plan, states[w.id])
+                else:
+                    payloads[w.id] = _render(plan, groups)
+    return payloads
+
+# ---------- agregação incremental ----------
 
-    elif typ == "bar":
-        field = cfg.get("group_by","product")
-        agg   = list(q.values(field).annotate(total=Sum("amount")).order_by("-total")[:10])
-        payload = {"labels":[a[field] for a in agg], "series":[float(a["total"]) for a in agg]}
+def _plan(w):
+    try:
+        return query.compile_plan(w.type, w.config)
+    except query.QueryError:
+        return None
 
-    elif typ == "pie":
-        field = cfg.get("group_by","channel")
-        agg   = list(q.values(field).annotate(total=Sum("amount")).order_by("-total"))
-        payload = {"labels":[a[field] for a in agg], "series":[float(a["total"]) for a in agg]}
+def _fold(plan, state, events):
+    """Soma eventos novos (dicts de SalesEvent) ao estado parcial do plano."""
+    f = plan.filters
+    lo, hi = query.parse_bound(f["date_from"]), query.parse_bound(f["date_to"])
+    events = [e for e in events
+              if (lo is None or e["occurred_at"] >= lo) and (hi is None or e["occurred_at"] < hi)
+              and all(not f[key] or e[field] in f[key]
+                      for key, field in (("channels", "channel"), ("products", "product"), ("regions", "region")))]
+    tz = plan.zone
+    buckets = {k: dict(v) for k, v in state["buckets"].items()}
+    for e in events:
+        key = _bucket_key(_floor(e["occurred_at"].astimezone(tz), plan.grain)) if plan.grain else ""
+        totals = buckets.setdefault(key, {c: query.zero(c) for c in plan.components})
+        query.add_event(totals, e, plan.components)
+    return {"buckets": buckets}
 
-    elif typ == "table":
-        rows = list(q.order_by("-occurred_at").values("occurred_at","product","channel","region","amount")[:50])
-        payload = {"rows": rows}
+def _incremental_base(w, cache, mark, now):
+    """(maior id, contagem) já somados no estado do cache, se dá para continuar dele."""
+    plan = _plan(w)
+    if plan is None or not plan.incremental or cache is None or not cache.state or cache.reconciled_at is None:
+        return None
+    if cache.reconciled_at + timedelta(seconds=settings.DASHBOARDS_RECONCILE_SECONDS) <= now:
+        return None  # reconciliação periódica: recalcula do zero
+    old = _parse_watermark(cache.data_watermark)
+    if old is None or old[2] != _spec_digest(w):
+        return None
+    last_id, count, _ = old
+    if not 0 < mark[1] - count <= settings.DASHBOARDS_INCREMENTAL_MAX_ROWS:
+        return None
+    return last_id, count
 
-    cache, _ = WidgetCache.objects.get_or_create(widget=w)
-    cache.payload = payload
-    cache.save()
+def _fold_new_events(widgets, caches, marks, now):
+    """Resultados dos widgets que dá para atualizar só com os eventos após a marca d'água."""
+    bases, by_org = {}, {}
+    for w in widgets:
+        org_id = w.dashboard.org_id
+        if (base := _incremental_base(w, caches.get(w.id), marks[org_id], now)) is not None:
+            bases[w.id] = base
+            by_org.setdefault(org_id, []).append(w)
+
+    results = {}
+    for org_id, members in by_org.items():
+        last_id, count = marks[org_id]
+        events = list(SalesEvent.objects
+                      .filter(org_id=org_id, id__gt=min(bases[w.id][0] for w in members), id__lte=last_id)
+                      .values("id", "occurred_at", "amount", "cost", "product", "region", "channel").order_by())
+        for w in members:
+            base_id, base_count = bases[w.id]
+            new = [e for e in events if e["id"] > base_id]
+            # contagem não fecha = evento removido ou commitado com id antigo: recálculo completo
+            if base_count + len(new) != count:
+                continue
+            cache, plan = caches[w.id], _plan(w)
+            state = _fold(plan, cache.state, new)
+            results[w.id] = {"payload": render_state(plan, state), "state": state, "reconciled_at": cache.reconciled_at}
+    return results
+
+def payload_hash(payload):
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def data_watermarks(org_ids):
+    """Marca d'água por org: maior id e contador de mudanças em SalesEvent (uma linha por org).
+
+    Mantidos pelos escritores dos rollups (``analytics.rollups.bump_sales_watermark``):
+    insert, delete e edição somam ao contador.
+    """
+    marks = {id: (last_id, changes) for id, last_id, changes in Organization.objects.filter(id__in=org_ids)
+             .values_list("id", "sales_last_event_id", "sales_changes")}
+    return {org_id: marks.get(org_id, (0, 0)) for org_id in org_ids}
+
+def _spec_digest(w):
+    # mudar tipo/config do widget (ou o formato dos planos) também invalida o payload
+    return payload_hash([query.VERSION, w.type, w.config])[:16]
+
+def widget_watermark(w, marks):
+    last_id, count = marks[w.dashboard.org_id]
+    return f"{last_id}:{count}:{_spec_digest(w)}"
+
+def _parse_watermark(value):
+    try:
+        last_id, count, spec = value.split(":")
+        return int(last_id), int(count), spec
+    except ValueError:
+        return None
+
+STATE_FIELDS = ["data_watermark", "state", "reconciled_at", "checked_at", "next_refresh_at"]
+
+def _next_refresh(w, now):
+    return now + timedelta(seconds=w.refresh_seconds)
+
+def _write_caches(results, caches, widgets):
+    """Grava só os payloads cujo hash mudou e publica esses (após o commit).
+
+    Payload igual com dados novos só avança marca d'água e estado parcial.
+    """
+    now = timezone.now()
+    new, rewritten, advanced, changed = [], [], [], {}
+    for wid, values in results.items():
+        digest = payload_hash(values["payload"])
+        cache = caches.get(wid)
+        if cache is None:
+            new.append(WidgetCache(widget_id=wid, payload_hash=digest, payload_json=dumps(values["payload"]),
+                                   checked_at=now, next_refresh_at=_next_refresh(widgets[wid], now), **values))
+        else:
+            unchanged = cache.payload_hash == digest
+            for field, value in values.items():
+                setattr(cache, field, value)
+            cache.checked_at, cache.next_refresh_at = now, _next_refresh(widgets[wid], now)
+            if unchanged:
+                advanced.append(cache)
+                continue
+            cache.payload_hash, cache.payload_json, cache.updated_at = digest, dumps(values["payload"]), now
+            rewritten.append(cache)
+        changed.setdefault(widgets[wid].dashboard_id, []).append({"widget": wid, "payload": values["payload"]})
+    WidgetCache.objects.bulk_update(rewritten, ["payload", "payload_json", "payload_hash", "updated_at", *STATE_FIELDS])
+    WidgetCache.objects.bulk_update(advanced, STATE_FIELDS)
+    WidgetCache.objects.bulk_create(new, ignore_conflicts=True)
+    if changed:
+        transaction.on_commit(lambda: publish_widget_updates(changed, now.isoformat()))
+
+def refresh_many(widgets, force=False):
+    """Recalcula só os widgets cuja marca d'água mudou (todos com ``force``); devolve os recalculados.
+
+    KPI/timeseries com estado parcial válido só somam os eventos novos; os demais,
+    e todos a cada DASHBOARDS_RECONCILE_SECONDS, são recalculados do zero.
+    """
+    widgets = list(widgets)
+    if not widgets:
+        return []
+    now = timezone.now()
+    marks = data_watermarks({w.dashboard.org_id for w in widgets})
+    watermarks = {w.id: widget_watermark(w, marks) for w in widgets}
+    caches = {c.widget_id: c for c in WidgetCache.objects.filter(widget_id__in=watermarks)}
+    stale = [w for w in widgets
+             if force or w.id not in caches or caches[w.id].data_watermark != watermarks[w.id]]
+
+    results = {} if force else _fold_new_events(stale, caches, marks, now)
+    states = {}
+    payloads = compute_payloads([w for w in stale if w.id not in results], states)
+    for wid, payload in payloads.items():
+        results[wid] = {"payload": payload, "state": states.get(wid, {}), "reconciled_at": now}
+    for wid, values in results.items():
+        values["data_watermark"] = watermarks[wid]
+
+    _write_caches(results, caches, {w.id: w for w in stale})
+    if fresh := caches.keys() - results.keys():
+        # nada mudou: um UPDATE do checked_at (por refresh_seconds) tira esses widgets da fila de vencidos
+        now, by_interval = timezone.now(), {}
+        for w in widgets:
+            if w.id in fresh:
+                by_interval.setdefault(w.refresh_seconds, []).append(w.id)
+        for seconds, ids in by_interval.items():
+            WidgetCache.objects.filter(widget_id__in=ids).update(
+                checked_at=now, next_refresh_at=now + timedelta(seconds=seconds))
+    return list(results)
+
+@shared_task
+def refresh_widget(widget_id: int):
+    w = Widget.objects.select_related("dashboard").get(id=widget_id)
+    refresh_many([w])
     return {"widget": w.id, "updated": timezone.now().isoformat()}
+
+@shared_task
+def refresh_dashboard(dashboard_id: int):
+    widgets = Widget.objects.filter(dashboard_id=dashboard_id).select_related("dashboard")
+    return {"dashboard": dashboard_id, "widgets": refresh_many(widgets), "updated": timezone.now().isoformat()}
+
+def due_widget_batches(now=None, batch_size=None):
+    """Lotes de ids de widgets vencidos, agrupados por org e conjunto de filtros.
+
+    Vencido = sem cache ainda, ou ``cache.next_refresh_at`` (checked_at + refresh_seconds)
+    já passou; o filtro roda no banco, só os vencidos saem.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.DASHBOARDS_REFRESH_BATCH_SIZE
+    rows = (Widget.objects.filter(Q(cache__isnull=True) | Q(cache__next_refresh_at__isnull=True)
+                                  | Q(cache__next_refresh_at__lte=now))
+            .values_list("id", "dashboard__org_id", "config"))
+
+    groups = {}
+    for wid, org_id, cfg in rows.order_by("id").iterator():
+        groups.setdefault((org_id, query.filter_key(cfg)), []).append(wid)
+
+    return [ids[i:i + batch_size] for ids in groups.values() for i in range(0, len(ids), batch_size)]
+
+@shared_task
+def refresh_widgets(widget_ids):
+    # widgets removidos depois do agendamento simplesmente não aparecem aqui
+    widgets = Widget.objects.filter(id__in=widget_ids).select_related("dashboard")
+    return {"widgets": refresh_many(widgets), "updated": timezone.now().isoformat()}
+
+@shared_task
+def refresh_due_widgets():
+    """Disparado pelo beat: distribui os widgets vencidos em lotes (Celery group)."""
+    batches = due_widget_batches()
+    if batches:
+        # lotes que não rodarem até o próximo tick são descartados; o tick seguinte re-agenda
+        group(refresh_widgets.s(ids) for ids in batches).apply_async(
+            expires=settings.DASHBOARDS_REFRESH_TICK_SECONDS,
+        )
+    return {"batches": len(batches), "widgets": sum(map(len, batches))}
@@ -1,9 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+import gzip
+import json
+import shutil
+import tempfile
+from importlib.util import find_spec
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
+from rest_framework.exceptions import ParseError
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 
 from accounts.models import Membership, Organization
-from .models import Dashboard
+from config import instrumentation
+from config.renderers import ORJSONParser, ORJSONRenderer, RawJSON
+from analytics.archive import archive_month
+from analytics.models import SalesArchive, SalesEvent
+from analytics.rollups import rebuild_sales_rollups
+from . import query
+from .models import Dashboard, Widget, WidgetCache
+from .tasks import data_watermarks, due_widget_batches, refresh_dashboard, refresh_many, refresh_widget, refresh_widgets
 
 
 class DashboardApiTests(APITestCase):
@@ -20,3 +47,603 @@ class DashboardApiTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual([item["id"] for item in response.data], [own_dashboard.id])
+
+    @override_settings(TENANCY_CACHE_TIMEOUT=300)  # cache compartilhado (Redis)
+    def test_memberships_are_cached_until_they_change(self):
+        user = get_user_model().objects.create_user(username="viewer", password="test-pass")
+        org = Organization.objects.create(name="Own Org", slug="own-org")
+        membership = Membership.objects.create(org=org, user=user, role=Membership.VIEWER)
+        dashboard = Dashboard.objects.create(org=org, title="Own Dashboard")
+        self.client.force_authenticate(user)
+        self.client.get("/api/dashboards/")
+
+        with self.assertNumQueries(3):  # validadores + dashboard + widgets: nem Membership nem permissão por objeto
+            response = self.client.get(f"/api/dashboards/{dashboard.id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        membership.delete()
+        self.assertEqual(self.client.get(f"/api/dashboards/{dashboard.id}/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_memberships_are_per_request_without_a_shared_cache(self):
+        user = get_user_model().objects.create_user(username="moved", password="test-pass")
+        org, other = (Organization.objects.create(name=n, slug=n) for n in ("own-org", "other-org"))
+        Membership.objects.create(org=org, user=user, role=Membership.VIEWER)
+        dashboard = Dashboard.objects.create(org=org, title="Own Dashboard")
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get(f"/api/dashboards/{dashboard.id}/").status_code, status.HTTP_200_OK)
+
+        Membership.objects.filter(user=user).update(org=other)  # sem signal: outro processo, nada a invalidar
+        self.assertEqual(self.client.get(f"/api/dashboards/{dashboard.id}/").status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(TENANCY_CACHE_TIMEOUT=300)
+class DashboardQueryCountTests(APITestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Busy Org", slug="busy-org")
+        user = get_user_model().objects.create_user(username="busy", password="test-pass")
+        Membership.objects.create(org=self.org, user=user, role=Membership.VIEWER)
+        self.client.force_authenticate(user)
+        self.client.get("/api/dashboards/")  # memberships já no cache
+
+    def _add_dashboards(self, n, widgets):
+        for i in range(n):
+            dashboard = Dashboard.objects.create(org=self.org, title=f"Board {i}")
+            for j in range(widgets):
+                widget = Widget.objects.create(dashboard=dashboard, type="kpi", config={"metric": "count"})
+                WidgetCache.objects.create(widget=widget, payload={"value": j}, state={"sum": 0, "count": j})
+
+    def test_dashboard_list_queries_do_not_grow_with_dashboards_or_widgets(self):
+        for dashboards, widgets in [(1, 1), (5, 4)]:
+            self._add_dashboards(dashboards, widgets)
+            with self.assertNumQueries(3):  # validadores (ETag) + dashboards + widgets/caches
+                response = self.client.get("/api/dashboards/")
+
+        self.assertEqual(len(response.json()), 6)
+        self.assertEqual(response.json()[-1]["widgets"][-1]["cache"]["payload"], {"value": 3})
+
+    def test_widget_list_and_detail_take_two_queries(self):
+        self._add_dashboards(3, 3)
+        widget = Widget.objects.last()
+
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.client.get("/api/widgets/").json()), 9)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(f"/api/widgets/{widget.id}/").json()["cache"]["payload"], {"value": 2})
+
+    def test_payloads_can_be_left_out_of_list_responses(self):
+        self._add_dashboards(1, 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/dashboards/", {"payloads": "false"})
+
+        self.assertEqual(set(response.json()[0]["widgets"][0]["cache"]), {"updated_at"})
+        for column in ('."payload"', '."payload_json"'):
+            self.assertNotIn(column, queries.captured_queries[-1]["sql"])
+        widget = response.json()[0]["widgets"][0]["id"]
+        detail = self.client.get(f"/api/widgets/{widget}/", {"payloads": "false"})
+        self.assertEqual(detail.json()["cache"]["payload"], {"value": 0})
+
+    def test_pre_encoded_payloads_are_copied_into_responses(self):
+        self._add_dashboards(1, 1)
+        # bytes gravados valem mais que o JSONField: prova que a API não recodifica o payload
+        WidgetCache.objects.update(payload_json=b'{"value":42,"label":"\xe2\x80\xa8"}')
+
+        response = self.client.get("/api/dashboards/")
+
+        self.assertIn(b'{"value":42,"label":"\\u2028"}', response.content)
+        self.assertEqual(response.json()[0]["widgets"][0]["cache"]["payload"], {"value": 42, "label": "\u2028"})
+
+
+@override_settings(TENANCY_CACHE_TIMEOUT=300)
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Polling Org", slug="polling-org")
+        user = get_user_model().objects.create_user(username="poller", password="test-pass")
+        Membership.objects.create(org=self.org, user=user, role=Membership.VIEWER)
+        self.client.force_authenticate(user)
+        dashboard = Dashboard.objects.create(org=self.org, title="Polled")
+        self.widget = Widget.objects.create(dashboard=dashboard, type="kpi", config={"metric": "count"})
+        WidgetCache.objects.create(widget=self.widget, payload={"value": 1})
+
+    def test_unchanged_dashboards_and_widgets_get_304(self):
+        first = self.client.get("/api/dashboards/")
+        self.assertTrue(first.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):  # só o aggregate dos validadores
+            not_modified = self.client.get("/api/dashboards/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified["ETag"], first["ETag"])
+        since = self.client.get("/api/dashboards/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(since.status_code, status.HTTP_304_NOT_MODIFIED)
+        detail = self.client.get(f"/api/widgets/{self.widget.id}/")
+        again = self.client.get(f"/api/widgets/{self.widget.id}/", HTTP_IF_NONE_MATCH=detail["ETag"])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_payload_or_widget_changes_invalidate_the_etag(self):
+        etag = self.client.get("/api/dashboards/")["ETag"]
+        self.widget.cache.payload = {"value": 2}
+        self.widget.cache.save()
+
+        changed = self.client.get("/api/dashboards/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertEqual(changed.json()[0]["widgets"][0]["cache"]["payload"], {"value": 2})
+
+        self.widget.title = "Renamed"
+        self.widget.save()
+        self.assertEqual(self.client.get("/api/dashboards/", HTTP_IF_NONE_MATCH=changed["ETag"]).status_code,
+                         status.HTTP_200_OK)
+        self.assertNotEqual(self.client.get("/api/dashboards/", {"payloads": "false"})["ETag"], changed["ETag"])
+
+    def test_other_tenants_get_404_not_304(self):
+        outsider = get_user_model().objects.create_user(username="outsider", password="test-pass")
+        etag = self.client.get(f"/api/widgets/{self.widget.id}/")["ETag"]
+        self.client.force_authenticate(outsider)
+        response = self.client.get(f"/api/widgets/{self.widget.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_non_numeric_ids_get_404(self):
+        for url in ("/api/dashboards/abc/", "/api/widgets/abc/"):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class CompressionTests(TestCase):
+    def setUp(self):
+        org = Organization.objects.create(name="Wire Org", slug="wire-org")
+        user = get_user_model().objects.create_user(username="wire", password="test-pass")
+        Membership.objects.create(org=org, user=user, role=Membership.VIEWER)
+        self.token = str(RefreshToken.for_user(user).access_token)
+        widget = Widget.objects.create(dashboard=Dashboard.objects.create(org=org), type="timeseries")
+        WidgetCache.objects.create(widget=widget, payload={"series": [{"x": i, "y": i * 2} for i in range(500)]})
+
+    def _get(self, path, encoding):
+        return self.client.get(path, HTTP_AUTHORIZATION=f"Bearer {self.token}", HTTP_ACCEPT_ENCODING=encoding)
+
+    def test_gzip_is_negotiated_and_small_responses_are_left_alone(self):
+        plain = self._get("/api/dashboards/", "")
+        response = self._get("/api/dashboards/", "br;q=0, gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertTrue(response["ETag"].startswith('W/"'))
+        self.assertFalse(self._get("/api/dashboards/?payloads=false", "gzip").has_header("Content-Encoding"))
+
+    @skipUnless(find_spec("brotli"), "brotli is not installed")
+    def test_brotli_is_preferred_when_accepted(self):
+        import brotli
+        plain = self._get("/api/dashboards/", "")
+        response = self._get("/api/dashboards/", "gzip, deflate, br")
+
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content) / 4)
+        not_modified = self._get("/api/dashboards/", "br")
+        self.assertEqual(self.client.get("/api/dashboards/", HTTP_AUTHORIZATION=f"Bearer {self.token}",
+                                         HTTP_IF_NONE_MATCH=not_modified["ETag"]).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+
+class JSONRenderingTests(TestCase):
+    def test_raw_fragments_are_spliced_and_the_rest_encoded_normally(self):
+        data = {"widgets": [{"payload": RawJSON(b'{"rows":[1,2]}')}, {"payload": RawJSON(b"null")}],
+                "updated_at": datetime(2026, 1, 1, 12, tzinfo=timezone.utc), "note": "rawjson-0"}
+
+        out = ORJSONRenderer().render(data)
+
+        self.assertEqual(json.loads(out), {"widgets": [{"payload": {"rows": [1, 2]}}, {"payload": None}],
+                                           "updated_at": "2026-01-01T12:00:00Z", "note": "rawjson-0"})
+
+    def test_parser_rejects_malformed_bodies(self):
+        self.assertEqual(ORJSONParser().parse(BytesIO(b'{"a": [1, 2.5]}')), {"a": [1, 2.5]})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"a": NaN}'))
+
+
+@override_settings(METRICS_TOKEN="scrape-secret")
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        org = Organization.objects.create(name="Timing Org", slug="timing-org")
+        user = get_user_model().objects.create_user(username="timing", password="test-pass")
+        Membership.objects.create(org=org, user=user, role=Membership.VIEWER)
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(user).access_token}"}
+        self.widget = Widget.objects.create(dashboard=Dashboard.objects.create(org=org), type="kpi")
+        cache.clear()
+        instrumentation.REGISTRY.reset()
+        # LocMem num processo só: aqui ele é o cache "compartilhado"
+        shared = mock.patch.object(instrumentation, "shared_cache", return_value=True)
+        shared.start()
+        self.addCleanup(shared.stop)
+
+    def _metrics(self, **headers):
+        return self.client.get("/metrics", **{"HTTP_AUTHORIZATION": "Bearer scrape-secret", **headers})
+
+    @override_settings(ANALYTICS_CACHE_TIMEOUT=300)
+    def test_server_timing_reports_db_and_cache_per_request(self):
+        first = self.client.get("/api/analytics/kpis/", **self.auth)
+        second = self.client.get("/api/analytics/kpis/", **self.auth)
+
+        self.assertRegex(first["Server-Timing"], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", '
+                                                 r'cache;desc="0 hit, 1 miss"$')
+        self.assertIn('cache;desc="1 hit, 0 miss"', second["Server-Timing"])
+        body = self._metrics().content.decode()
+        self.assertIn('http_requests_total{method="GET",status="200",view="kpis"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{view="kpis"} 2', body)
+        self.assertIn('cache_requests_total{cache="analytics",result="hit"} 1', body)
+        self.assertIn("# TYPE http_db_queries_total counter", body)
+
+    def test_tasks_record_duration_db_and_widget_type(self):
+        refresh_widget.apply(args=[self.widget.id])
+
+        body = self._metrics().content.decode()
+        self.assertIn('celery_tasks_total{state="SUCCESS",task="dashboards.tasks.refresh_widget"} 1', body)
+        self.assertIn('celery_task_duration_seconds_bucket{task="dashboards.tasks.refresh_widget",le="+Inf"} 1',
+                      body)
+        self.assertRegex(body, r'widget_compute_db_queries_total\{type="kpi"\} [1-9]')
+
+    @override_settings(INSTRUMENTATION_SLOW_QUERY_MS=1e-6)
+    def test_slow_queries_are_logged(self):
+        with self.assertLogs("config.instrumentation", "WARNING") as logs:
+            self.client.get("/api/dashboards/", **self.auth)
+
+        self.assertIn("slow query", logs.output[0])
+        self.assertIn("/api/dashboards/", logs.output[0])
+
+    def test_metrics_token_is_required_when_configured(self):
+        self.assertEqual(self._metrics(HTTP_AUTHORIZATION="").status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self._metrics()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+    def test_metrics_need_a_token_and_a_shared_cache_outside_debug(self):
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self._metrics().status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self._metrics().status_code, status.HTTP_200_OK)
+        with mock.patch.object(instrumentation, "shared_cache", return_value=False):
+            self.assertEqual(self._metrics().status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_totals_of_finished_processes_are_kept(self):
+        registry = instrumentation.Registry()
+        registry.inc("celery_tasks_total", 5, task="t", state="SUCCESS")
+        cache.set(instrumentation.SNAPSHOT_KEY.format(process="old-worker:1"), {**registry.snapshot(), "at": 0}, None)
+        cache.set(instrumentation.INDEX_KEY, ["old-worker:1"], None)
+        instrumentation.REGISTRY.inc("celery_tasks_total", 2, task="t", state="SUCCESS")
+
+        def total():
+            return instrumentation.collect().counters[("celery_tasks_total", (("state", "SUCCESS"), ("task", "t")))]
+
+        self.assertEqual(total(), 7)
+        self.assertEqual(total(), 7)  # o worker reciclado ficou no acumulado
+
+        # processo só ocioso que foi para o acumulado: desconta no próximo flush, nada em dobro
+        own = instrumentation.SNAPSHOT_KEY.format(process=instrumentation._process())
+        cache.set(own, {**cache.get(own), "at": 0}, None)
+        with mock.patch.object(instrumentation, "flush"):  # sem o flush do collect este processo parece parado
+            self.assertEqual(total(), 7)
+        instrumentation.REGISTRY.inc("celery_tasks_total", 1, task="t", state="SUCCESS")
+        self.assertEqual(total(), 8)
+
+
+class RefreshWidgetTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Widget Org", slug="widget-org")
+        self.dashboard = Dashboard.objects.create(org=self.org, title="Overview")
+        for day, amount, product, channel, customer in [(1, 100.0, "Alpha", "web", "c1"), (1, 50.0, "Beta", "retail", "c2"),
+                                                        (2, 25.0, "Alpha", "web", "c1"), (3, 10.0, "Gamma", "partner", "c3")]:
+            SalesEvent.objects.create(org=self.org, occurred_at=datetime(2026, 1, day, 12, tzinfo=timezone.utc),
+                                      amount=amount, cost=amount / 2, product=product, channel=channel, region="NA",
+                                      customer=customer)
+
+    def _payload(self, type, config):
+        widget = Widget.objects.create(dashboard=self.dashboard, type=type, config=config)
+        refresh_widget(widget.id)
+        widget.cache.refresh_from_db()
+        return widget.cache.payload
+
+    def test_rollup_payloads_match_raw_events(self):
+        configs = [
+            ("kpi", {"metric": "sum_amount"}),
+            ("kpi", {"metric": "avg_amount", "channels": ["web"]}),
+            ("kpi", {"metric": "count", "date_from": "2026-01-02"}),
+            ("timeseries", {"date_to": "2026-01-03"}),
+            ("bar", {"group_by": "product"}),
+            ("pie", {"group_by": "channel"}),
+        ]
+        from_rollups = [self._payload(t, c) for t, c in configs]
+        with override_settings(ANALYTICS_USE_ROLLUPS=False):
+            from_raw = [self._payload(t, c) for t, c in configs]
+
+        self.assertEqual(from_rollups, from_raw)
+        self.assertEqual(from_rollups[3], {"labels": ["2026-01-01", "2026-01-02"], "series": [[150.0, 25.0]]})
+
+    def test_declarative_measures_dimensions_and_top_n(self):
+        configs = [
+            ("kpi", {"measures": ["margin", "distinct_product", "avg_amount"]}),
+            ("bar", {"measures": ["count", "sum_amount"], "dimensions": ["channel"], "order_by": "sum_amount",
+                     "top": 2}),
+            ("pie", {"group_by": "channel", "products": ["Alpha", "Beta"]}),
+            ("timeseries", {"measures": ["sum_amount", "margin"], "date_to": "2026-01-03"}),
+            ("kpi", {"metric": "count", "regions": ["EU"]}),
+        ]
+        from_rollups = [self._payload(t, c) for t, c in configs]
+        with override_settings(ANALYTICS_USE_ROLLUPS=False):
+            from_raw = [self._payload(t, c) for t, c in configs]
+
+        self.assertEqual(from_rollups, from_raw)
+        self.assertEqual(from_rollups[0], {"value": 92.5,
+                                           "values": {"margin": 92.5, "distinct_product": 3, "avg_amount": 46.25}})
+        self.assertEqual(from_rollups[1], {"labels": ["web", "retail"], "series": [2, 1],
+                                           "values": {"count": [2, 1], "sum_amount": [125.0, 50.0]}})
+        self.assertEqual(from_rollups[2], {"labels": ["web", "retail"], "series": [125.0, 50.0]})
+        self.assertEqual(from_rollups[3]["series"], [[150.0, 25.0], [75.0, 12.5]])
+        self.assertEqual(from_rollups[4], {"value": 0})
+
+    def test_sketch_measures_merge_rollup_buckets(self):
+        SalesEvent.objects.create(org=self.org, occurred_at=datetime(2026, 1, 2, 13, tzinfo=timezone.utc),
+                                  amount=30.0, product="Beta", channel="web", region="EU", customer="c4")
+        configs = [
+            ("kpi", {"measures": ["unique_customers", "p50_amount", "p99_amount"]}),
+            ("bar", {"measures": ["unique_customers"], "dimensions": ["channel"], "top": 1}),
+            ("timeseries", {"measures": ["p50_amount"], "date_to": "2026-01-03"}),
+            # limite com hora: só o bruto responde (sketches agregados no banco)
+            ("kpi", {"measures": ["unique_customers"],
+                     "date_from": "2026-01-01T09:00:00-03:00", "date_to": "2026-01-01T10:00:00-03:00"}),
+        ]
+        from_rollups = [self._payload(t, c) for t, c in configs]
+        with override_settings(ANALYTICS_USE_ROLLUPS=False):
+            from_raw = [self._payload(t, c) for t, c in configs]
+
+        self.assertEqual(from_rollups, from_raw)
+        kpi = from_rollups[0]["values"]
+        self.assertEqual(kpi["unique_customers"], 4)
+        self.assertAlmostEqual(kpi["p50_amount"], 30.0, delta=0.3)
+        self.assertAlmostEqual(kpi["p99_amount"], 50.0, delta=0.5)  # rank q * (n - 1), arredondado para baixo
+        self.assertEqual(from_rollups[1], {"labels": ["web"], "series": [2]})
+        self.assertEqual(from_rollups[2]["labels"], ["2026-01-01", "2026-01-02"])
+        for value, expected in zip(from_rollups[2]["series"][0], [50.0, 25.0]):
+            self.assertAlmostEqual(value, expected, delta=expected * 0.01)
+        self.assertEqual(from_rollups[3], {"value": 2})
+        self.assertFalse(query.compile_plan("kpi", {"measures": ["p95_amount"]}).incremental)
+
+    def test_invalid_configs_are_rejected(self):
+        for type, config in [("bar", {"group_by": "secret"}), ("kpi", {"metric": "median"}),
+                             ("kpi", {"dimensions": ["product"]}), ("pie", {"dimensions": []}),
+                             ("bar", {"top": 0}), ("timeseries", {"granularity": "minute"}),
+                             ("kpi", {"date_from": "yesterday"}), ("bar", {"order_by": "count"}),
+                             ("timeseries", {"measures": ["unique_customers"], "granularity": "hour"}),
+                             ("timeseries", {"measures": ["p95_amount"], "timezone": "America/Sao_Paulo"})]:
+            with self.subTest(type=type, config=config), self.assertRaises(query.QueryError):
+                query.compile_plan(type, config)
+
+        self.assertIs(query.compile_plan("bar", {"group_by": "region"}), query.compile_plan("bar", {"group_by": "region"}))
+        self.assertIn("error", self._payload("bar", {"group_by": "secret"}))
+        with self.assertRaises(ValidationError):
+            Widget(dashboard=self.dashboard, type="pie", config={"group_by": "secret"}).full_clean()
+
+    def test_due_widgets_are_batched_by_org_and_filters(self):
+        now = datetime(2026, 2, 1, tzinfo=timezone.utc)
+        other_dashboard = Dashboard.objects.create(org=Organization.objects.create(name="B", slug="b"))
+        never = Widget.objects.create(dashboard=self.dashboard, type="kpi", config={"metric": "count"})
+        stale = Widget.objects.create(dashboard=self.dashboard, type="bar", refresh_seconds=60)
+        fresh = Widget.objects.create(dashboard=self.dashboard, type="pie", refresh_seconds=600)
+        web = Widget.objects.create(dashboard=self.dashboard, type="kpi", config={"channels": ["web"]})
+        other_org = Widget.objects.create(dashboard=other_dashboard, type="kpi")
+        for widget, age in [(stale, 120), (fresh, 120)]:
+            checked_at = now - timedelta(seconds=age)
+            WidgetCache.objects.create(widget=widget, checked_at=checked_at,
+                                       next_refresh_at=checked_at + timedelta(seconds=widget.refresh_seconds))
+
+        batches = due_widget_batches(now=now, batch_size=1)
+
+        self.assertCountEqual(batches, [[never.id], [stale.id], [web.id], [other_org.id]])
+        self.assertCountEqual(due_widget_batches(now=now, batch_size=10),
+                              [[never.id, stale.id], [web.id], [other_org.id]])
+
+        refresh_widgets([never.id, stale.id, 999999])
+        self.assertEqual(WidgetCache.objects.get(widget=never).payload, {"value": 4})
+        cache = WidgetCache.objects.get(widget=stale)
+        self.assertEqual(cache.next_refresh_at, cache.checked_at + timedelta(seconds=60))
+
+        # editar o widget (ex.: refresh_seconds menor) o deixa vencido no próximo tick
+        fresh.refresh_seconds = 30
+        fresh.save()
+        self.assertIn([fresh.id], due_widget_batches(now=now, batch_size=1))
+
+    def test_refresh_dashboard_shares_one_scan_per_filter_set(self):
+        demo = [("kpi", {"metric": "sum_amount"}), ("kpi", {"metric": "avg_amount"}), ("kpi", {"metric": "count"}),
+                ("timeseries", {"date_from": None}), ("bar", {"group_by": "product"}),
+                ("pie", {"group_by": "channel"}), ("table", {})]
+        widgets = [Widget.objects.create(dashboard=self.dashboard, type=t, config=c) for t, c in demo]
+
+        # widgets + marca d'água + caches existentes + orgs arquivadas + scan agregado + tabela + insert
+        with self.assertNumQueries(7):
+            refresh_dashboard(self.dashboard.id)
+        with self.assertNumQueries(4):  # sem dados novos: nenhum scan, só checked_at
+            refresh_dashboard(self.dashboard.id)
+
+        payloads = [WidgetCache.objects.get(widget=w).payload for w in widgets]
+        self.assertEqual(payloads[:3], [{"value": 185.0}, {"value": 46.25}, {"value": 4}])
+        self.assertEqual(payloads[4], {"labels": ["Alpha", "Beta", "Gamma"], "series": [125.0, 50.0, 10.0]})
+        self.assertEqual(payloads[6]["rows"][0]["occurred_at"], "2026-01-03T12:00:00+00:00")
+
+    def test_refresh_skips_unchanged_data_and_writes_only_changed_payloads(self):
+        january = Widget.objects.create(dashboard=self.dashboard, type="kpi",
+                                         config={"metric": "count", "date_to": "2026-02-01"})
+        total = Widget.objects.create(dashboard=self.dashboard, type="kpi", config={"metric": "count"})
+        self.assertCountEqual(refresh_dashboard(self.dashboard.id)["widgets"], [january.id, total.id])
+        self.assertEqual(refresh_dashboard(self.dashboard.id)["widgets"], [])
+        written = WidgetCache.objects.get(widget=january).updated_at
+
+        SalesEvent.objects.create(org=self.org, occurred_at=datetime(2026, 3, 1, tzinfo=timezone.utc),
+                                  amount=5.0, product="Alpha", channel="web", region="NA")
+        self.assertCountEqual(refresh_dashboard(self.dashboard.id)["widgets"], [january.id, total.id])
+
+        january_cache, total_cache = WidgetCache.objects.get(widget=january), WidgetCache.objects.get(widget=total)
+        self.assertEqual(january_cache.updated_at, written)  # mesmo payload: não regravado
+        self.assertGreater(january_cache.checked_at, written)
+        self.assertEqual(total_cache.payload, {"value": 5})
+
+        # edição in-place não muda maior id nem contagem
+        SalesEvent.objects.filter(product="Gamma").first().delete()
+        event = SalesEvent.objects.get(product="Beta")
+        event.occurred_at = datetime(2026, 3, 2, tzinfo=timezone.utc)
+        event.save()
+        refresh_dashboard(self.dashboard.id)
+        self.assertEqual(WidgetCache.objects.get(widget=january).payload, {"value": 2})
+
+    def test_incremental_refresh_folds_only_new_events(self):
+        configs = [("kpi", {"metric": "sum_amount"}), ("kpi", {"metric": "avg_amount", "channels": ["web"]}),
+                   ("timeseries", {"granularity": "week"}),
+                   ("timeseries", {"granularity": "hour", "timezone": "America/Sao_Paulo", "date_from": "2026-01-02"})]
+        widgets = [Widget.objects.create(dashboard=self.dashboard, type=t, config=c) for t, c in configs]
+        refresh_dashboard(self.dashboard.id)
+        for day, amount, channel in [(2, 7.5, "web"), (20, 3.0, "retail")]:
+            SalesEvent.objects.create(org=self.org, occurred_at=datetime(2026, 1, day, 15, tzinfo=timezone.utc),
+                                      amount=amount, product="Alpha", channel=channel, region="NA")
+
+        # widgets + marca d'água + caches + eventos novos + update dos payloads
+        with self.assertNumQueries(5):
+            refresh_dashboard(self.dashboard.id)
+        incremental = [WidgetCache.objects.get(widget=w).payload for w in widgets]
+        refresh_many(Widget.objects.filter(id__in=[w.id for w in widgets]).select_related("dashboard"), force=True)
+
+        self.assertEqual(incremental, [WidgetCache.objects.get(widget=w).payload for w in widgets])
+        self.assertEqual(incremental[0], {"value": 195.5})
+
+    def test_deleted_events_and_reconcile_interval_force_full_recompute(self):
+        widget = Widget.objects.create(dashboard=self.dashboard, type="kpi", config={"metric": "count"})
+        refresh_dashboard(self.dashboard.id)
+        # delete + insert: maior id muda, mas a contagem não fecha com os eventos novos
+        SalesEvent.objects.filter(product="Gamma").delete()
+        SalesEvent.objects.create(org=self.org, occurred_at=datetime(2026, 1, 5, tzinfo=timezone.utc),
+                                  amount=1.0, product="Alpha", channel="web", region="NA")
+        refresh_dashboard(self.dashboard.id)
+        self.assertEqual(WidgetCache.objects.get(widget=widget).payload, {"value": 4})
+
+        WidgetCache.objects.filter(widget=widget).update(state={"sum": 0.0, "count": 100})
+        SalesEvent.objects.create(org=self.org, occurred_at=datetime(2026, 1, 6, tzinfo=timezone.utc),
+                                  amount=1.0, product="Alpha", channel="web", region="NA")
+        with override_settings(DASHBOARDS_RECONCILE_SECONDS=0):
+            refresh_dashboard(self.dashboard.id)
+        self.assertEqual(WidgetCache.objects.get(widget=widget).payload, {"value": 5})
+
+    def test_watermarks_are_read_from_the_org_change_counter(self):
+        widget = Widget.objects.create(dashboard=self.dashboard, type="kpi", config={"metric": "count"})
+        refresh_dashboard(self.dashboard.id)
+        with CaptureQueriesContext(connection) as queries:
+            data_watermarks([self.org.id])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn(SalesEvent._meta.db_table, queries[0]["sql"])
+
+        # bulk_create passa por fora dos rollups: o rebuild conta a mudança
+        SalesEvent.objects.bulk_create([SalesEvent(org=self.org, occurred_at=datetime(2026, 1, 7, tzinfo=timezone.utc),
+                                                   amount=1.0, product="Alpha", channel="web", region="NA")])
+        rebuild_sales_rollups(org=self.org)
+        refresh_dashboard(self.dashboard.id)
+        self.assertEqual(WidgetCache.objects.get(widget=widget).payload, {"value": 5})
+
+    @skipUnless(find_spec("pyarrow"), "pyarrow not installed")
+    def test_archived_months_are_merged_into_raw_widget_queries(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        SalesEvent.objects.create(org=self.org, occurred_at=datetime(2026, 2, 1, 9, tzinfo=timezone.utc),
+                                  amount=5.0, product="Beta", channel="web", region="EU")
+        configs = [("table", {}), ("kpi", {"metric": "count", "date_from": "2026-01-01T06:00:00Z"}),
+                   ("timeseries", {"granularity": "hour", "timezone": "Asia/Kolkata", "date_from": "2026-01-01"}),
+                   ("bar", {"group_by": "region", "channels": ["web"]}),
+                   ("kpi", {"measures": ["unique_customers", "p95_amount"]})]
+        widgets = [Widget.objects.create(dashboard=self.dashboard, type=t, config=c) for t, c in configs]
+
+        def payloads():
+            refresh_many(Widget.objects.filter(id__in=[w.id for w in widgets]).select_related("dashboard"), force=True)
+            return [WidgetCache.objects.get(widget=w).payload for w in widgets]
+
+        with override_settings(MEDIA_ROOT=media, ANALYTICS_USE_ROLLUPS=False):
+            before = payloads()
+            self.assertEqual(archive_month(self.org.id, datetime(2026, 1, 1).date()), 4)
+            self.assertEqual(SalesEvent.objects.filter(org=self.org).count(), 1)
+            self.assertEqual(SalesArchive.objects.get(org=self.org).rows, 4)
+            after = payloads()
+
+        self.assertEqual(after, before)
+        self.assertEqual(before[1], {"value": 5})
+
+    def test_timeseries_buckets_by_granularity_and_fills_gaps(self):
+        daily = self._payload("timeseries", {"date_from": "2025-12-31", "date_to": "2026-01-05"})
+        weekly = self._payload("timeseries", {"granularity": "week"})
+        hourly = self._payload("timeseries", {"granularity": "hour", "timezone": "America/Sao_Paulo",
+                                              "date_from": "2026-01-02T08:00:00-03:00",
+                                              "date_to": "2026-01-02T11:00:00-03:00"})
+
+        self.assertEqual(daily["labels"], ["2025-12-31", "2026-01-01", "2026-01-02", "2026-01-03", "2026-01-04"])
+        self.assertEqual(daily["series"], [[0, 150.0, 25.0, 10.0, 0]])
+        self.assertEqual(weekly, {"labels": ["2025-12-29"], "series": [[185.0]]})
+        self.assertEqual(hourly["labels"], ["2026-01-02T08:00-03:00", "2026-01-02T09:00-03:00", "2026-01-02T10:00-03:00"])
+        self.assertEqual(hourly["series"], [[0, 25.0, 0]])
+
+
+class _Socket(ApplicationCommunicator):
+    """Cliente WebSocket mínimo sobre o ApplicationCommunicator do asgiref."""
+
+    def __init__(self, application, path, query_string=""):
+        super().__init__(application, {"type": "websocket", "path": path,
+                                        "query_string": query_string.encode(), "headers": [], "subprotocols": []})
+
+    async def connect(self):
+        await self.send_input({"type": "websocket.connect"})
+        message = await self.receive_output(5)
+        return message["type"] == "websocket.accept", message.get("code")
+
+    async def receive_json_from(self):
+        return json.loads((await self.receive_output(5))["text"])
+
+    async def disconnect(self):
+        await self.send_input({"type": "websocket.disconnect", "code": 1000})
+        await self.wait(1)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class DashboardSocketTests(TransactionTestCase):
+    # TransactionTestCase: o consumer acessa o banco em outra thread (database_sync_to_async)
+    def setUp(self):
+        self.org = Organization.objects.create(name="Live Org", slug="live-org")
+        self.dashboard = Dashboard.objects.create(org=self.org, title="Live")
+        self.widget = Widget.objects.create(dashboard=self.dashboard, type="kpi", config={"metric": "count"})
+        self.member = get_user_model().objects.create_user(username="member", password="test-pass")
+        Membership.objects.create(org=self.org, user=self.member, role=Membership.VIEWER)
+
+    def _communicator(self, user):
+        from config.asgi import application
+        token = RefreshToken.for_user(user).access_token
+        return _Socket(application, f"/ws/dashboards/{self.dashboard.id}/", f"token={token}")
+
+    def test_member_receives_only_changed_payloads(self):
+        async def scenario():
+            ws = self._communicator(self.member)
+            connected, _ = await ws.connect()
+            self.assertTrue(connected)
+            self.assertEqual(await ws.receive_json_from(), {"type": "snapshot", "widgets": []})
+
+            await database_sync_to_async(refresh_dashboard)(self.dashboard.id)
+            update = await ws.receive_json_from()
+            self.assertEqual(update["widgets"], [{"widget": self.widget.id, "payload": {"value": 0}}])
+
+            # mesmo payload: nada é publicado
+            await database_sync_to_async(refresh_dashboard)(self.dashboard.id)
+            self.assertTrue(await ws.receive_nothing())
+            await ws.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_non_member_is_rejected(self):
+        outsider = get_user_model().objects.create_user(username="outsider", password="test-pass")
+
+        async def scenario():
+            ws = self._communicator(outsider)
+            connected, code = await ws.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4403)
+
+        async_to_sync(scenario)()
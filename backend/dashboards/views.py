@@ -1,26 +1,102 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Prefetch, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import viewsets, permissions
 from .models import Dashboard, Widget
 from .serializers import DashboardSerializer, WidgetSerializer
-from accounts.models import Membership
-from django.http import JsonResponse
+from accounts import tenancy
+from django.http import Http404, JsonResponse
 
 def index(request):
     return JsonResponse({"ok": True, "message": "dashboards API alive"})
 
 class InOrgPermission(permissions.BasePermission):
+    # memberships já resolvidas no request: nenhuma query por objeto
     def has_object_permission(self, request, view, obj):
-        return Membership.objects.filter(org=obj.org, user=request.user).exists()
+        return obj.org_id in tenancy.org_ids(request)
+
+def _widgets(omit_payloads=False):
+    """Widgets com o cache no mesmo SELECT; o estado incremental nunca sai na API.
+
+    O payload sai de ``payload_json`` (bytes prontos), então o JSONField nem é lido.
+    """
+    deferred = ["cache__state", "cache__payload"] + (["cache__payload_json"] if omit_payloads else [])
+    return Widget.objects.select_related("cache").defer(*deferred).order_by("id")
+
+class PayloadOptionMixin:
+    """``?payloads=false`` nas listagens: widgets sem o payload do cache (nem lido do banco)."""
+
+    def omit_payloads(self):
+        return (self.action == "list"
+                and self.request.query_params.get("payloads", "").lower() in ("0", "false", "no"))
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), "omit_payloads": self.omit_payloads()}
+
+class ConditionalGetMixin:
+    """ETag e Last-Modified de um aggregate (uma query, nada serializado); cliente atualizado recebe 304.
 
-class DashboardViewSet(viewsets.ReadOnlyModelViewSet):
+    ``freshness`` são aggregates que mudam sempre que a resposta muda; os ``*_at``
+    (``WidgetCache.updated_at`` só muda quando o payload muda) dão o Last-Modified.
+    """
+    freshness = {}
+
+    def _validators(self, queryset):
+        values = queryset.order_by().aggregate(**self.freshness)
+        stamps = [v for k, v in values.items() if k.endswith("_at") and v]
+        raw = "|".join([repr(sorted(values.items())), repr(tenancy.org_ids(self.request)),
+                        self.request.get_full_path(), self.request.accepted_media_type])
+        return values, f'"{hashlib.sha1(raw.encode()).hexdigest()}"', int(max(stamps).timestamp()) if stamps else None
+
+    def _conditional(self, queryset, respond):
+        values, etag, last_modified = self._validators(queryset)
+        if not values["count"]:
+            return respond()  # 404 (ou lista vazia) pelo caminho normal
+        response = get_conditional_response(self.request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = respond()
+        response.headers["ETag"] = etag
+        if last_modified:
+            response.headers["Last-Modified"] = http_date(last_modified)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(self.filter_queryset(self.get_queryset()),
+                                 lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            queryset = self.get_queryset().filter(pk=kwargs[self.lookup_field])
+        except (TypeError, ValueError, ValidationError):
+            raise Http404 from None  # pk inválido: mesmo 404 do get_object()
+        return self._conditional(queryset, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+class DashboardViewSet(ConditionalGetMixin, PayloadOptionMixin, tenancy.TenantScopedMixin,
+                       viewsets.ReadOnlyModelViewSet):
+    # número de queries constante: validadores, dashboards (+ org) e um SELECT de widgets + caches
     serializer_class = DashboardSerializer
     permission_classes = [permissions.IsAuthenticated, InOrgPermission]
+    queryset = Dashboard.objects.select_related("org").order_by("id")
+    freshness = {"count": Count("id", distinct=True), "ids": Sum("id", distinct=True),
+                 "widget_count": Count("widgets", distinct=True), "widget_ids": Sum("widgets__id", distinct=True),
+                 "updated_at": Max("updated_at"), "widgets_updated_at": Max("widgets__updated_at"),
+                 "cache_updated_at": Max("widgets__cache__updated_at")}
+
     def get_queryset(self):
-        return Dashboard.objects.filter(org__membership__user=self.request.user).distinct()
+        widgets = Prefetch("widgets", queryset=_widgets(self.omit_payloads()))
+        return super().get_queryset().prefetch_related(widgets)
 
-class WidgetViewSet(viewsets.ReadOnlyModelViewSet):
+class WidgetViewSet(ConditionalGetMixin, PayloadOptionMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = WidgetSerializer
     permission_classes = [permissions.IsAuthenticated]
+    freshness = {"count": Count("id"), "ids": Sum("id"), "updated_at": Max("updated_at"),
+                 "cache_updated_at": Max("cache__updated_at")}
+
     def get_queryset(self):
-        return Widget.objects.filter(dashboard__org__membership__user=self.request.user)
+        return tenancy.scope(_widgets(self.omit_payloads()), self.request, "dashboard__org")
 
 
@@ -35,16 +35,11 @@ export default function Dashboard() {
   useEffect(() => {
     (async () => {
       try {
-        const [a,b,c,d] = await Promise.all([
-          api.get("/analytics/kpis/"),
-          api.get("/analytics/trend/", { params: { days: 30 } }),
-          api.get("/analytics/top-products/"),
-          api.get("/analytics/distribution/"),
-        ]);
-        setKpis(a.data);
-        setTrend(b.data || []);
-        setTop(c.data || []);
-        setDist(d.data || []);
+        const { data } = await api.get("/analytics/summary/");
+        setKpis(data.kpis);
+        setTrend(data.trend || []);
+        setTop(data.top_products || []);
+        setDist(data.distribution || []);
       } catch (e) {
         console.error(e);
         setError("Não foi possível carregar os dados (verifique o token e o backend).");
@@ -64,7 +64,8 @@ export default function Reports() {
   const statusCounts = useMemo(() => {
     const m = { done: 0, queued: 0, processing: 0, failed: 0 };
     rows.forEach(r => {
-      const key = (r.status || "").toLowerCase();
+      let key = (r.status || "").toLowerCase();
+      if (key === "pending") key = "queued";
       if (m[key] !== undefined) m[key] += 1;
     });
     return m;
@@ -246,6 +247,7 @@ function StatusBadge({ status }) {
   const styles = {
     done: "bg-emerald-900/40 text-emerald-300 border-emerald-800",
     queued: "bg-violet-900/40 text-violet-300 border-violet-800",
+    pending: "bg-violet-900/40 text-violet-300 border-violet-800",
     processing: "bg-sky-900/40 text-sky-300 border-sky-800",
     failed: "bg-red-900/40 text-red-300 border-red-800",
   }[s] || "bg-slate-800 text-slate-300 border-slate-700";